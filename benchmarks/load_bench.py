@@ -0,0 +1,377 @@
+# End-to-end load test of the real handlers and workers, fully offline: a fake Pyrogram client records
+# every API call (with latency and random FloodWaits) and a local HTTP server serves the media that
+# stand-in extractor results point at. Each worker count runs in a fresh process and temp directory.
+# Uploads take the production paths: streamed TikTok/audio jobs, save_file, and the parallel big-file
+# uploader for files over PARALLEL_UPLOAD_THRESHOLD_MB. Only SendMedia itself is simulated.
+#   python benchmarks/load_bench.py --jobs 40 --workers 1,2,4 --mix video:3,tiktok:1 --size-mb 8
+# Audio jobs in the mix need ffmpeg for the opus conversion.
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHUNK = 64 * 1024
+class MediaHandler(BaseHTTPRequestHandler):
+    # /media/<name>?size=N returns N zero bytes, honouring Range so yt-dlp can chunk and resume
+    bytes_per_sec = 0
+    def log_message(self, *args):
+        pass
+    def do_GET(self):
+        try:
+            size = int(self.path.split("size=", 1)[1])
+        except (IndexError, ValueError):
+            self.send_error(404)
+            return
+        start, end = 0, size - 1
+        range_header = self.headers.get("Range")
+        if range_header and range_header.startswith("bytes="):
+            first, _, last = range_header[6:].partition("-")
+            start = int(first or 0)
+            end = min(int(last), size - 1) if last else size - 1
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        remaining = end - start + 1
+        block = b"\0" * CHUNK
+        try:
+            while remaining > 0:
+                n = min(CHUNK, remaining)
+                self.wfile.write(block[:n])
+                remaining -= n
+                if self.bytes_per_sec:
+                    time.sleep(n / self.bytes_per_sec)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+def start_media_server(mbps: float) -> int:
+    MediaHandler.bytes_per_sec = mbps * 1024 * 1024 / 8 if mbps else 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MediaHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_address[1]
+def fake_info(url: str, video_id: str, port: int, size: int) -> dict:
+    # Shaped like a sanitized extractor result, so format selection, sizing and the download path run for real
+    media = f"http://127.0.0.1:{port}/media/{video_id}"
+    formats = [
+        {'format_id': 'audio', 'url': f"{media}.m4a?size={size // 8}", 'ext': 'm4a', 'protocol': 'http',
+         'vcodec': 'none', 'acodec': 'mp4a.40.2', 'abr': 128, 'filesize': size // 8},
+        {'format_id': 'sd', 'url': f"{media}.mp4?size={size}", 'ext': 'mp4', 'protocol': 'http',
+         'vcodec': 'avc1.42001E', 'acodec': 'mp4a.40.2', 'height': 360, 'width': 640, 'fps': 30, 'filesize': size},
+    ]
+    return {
+        'id': video_id, 'title': f"Bench {video_id}", 'uploader': "bench", 'duration': 60,
+        'extractor': 'generic', 'extractor_key': 'Generic', 'webpage_url': url, 'original_url': url,
+        'formats': formats
+    }
+class FakeApi:
+    def __init__(self, latency: float, flood_rate: float, flood_seconds: int, upload_bytes_per_sec: float):
+        self.latency = latency
+        self.flood_rate = flood_rate
+        self.flood_seconds = flood_seconds
+        self.upload_bytes_per_sec = upload_bytes_per_sec
+        self.calls = Counter()
+        self.floods = 0
+        self.delivered = {} # chat id -> time the media arrived
+        self.menus = {} # chat id -> message carrying the format keyboard
+        self.next_id = 1
+    async def request(self, name: str):
+        from pyrogram.errors import FloodWait
+        self.calls[name] += 1
+        await asyncio.sleep(self.latency)
+        if self.flood_rate and random.random() < self.flood_rate:
+            self.floods += 1
+            raise FloodWait(value=self.flood_seconds)
+    def message(self, chat_id, text="", reply_to=None, user_id=None, **media):
+        self.next_id += 1
+        return FakeMessage(self, chat_id, self.next_id, text, reply_to, user_id or chat_id, **media)
+class FakeMessage:
+    def __init__(self, api, chat_id, message_id, text, reply_to, user_id, **media):
+        self.api = api
+        self.id = message_id
+        self.chat = SimpleNamespace(id=chat_id, type="private")
+        self.from_user = SimpleNamespace(id=user_id)
+        self.text = text
+        self.via_bot = None
+        self.entities = None
+        self.reply_to_message = reply_to
+        self.reply_markup = None
+        self.empty = False
+        for kind in ('video', 'audio', 'photo', 'document'):
+            setattr(self, kind, media.get(kind))
+    async def reply_text(self, text, **kwargs):
+        await self.api.request("send_message")
+        return self.api.message(self.chat.id, text, reply_to=self)
+    async def reply_photo(self, photo=None, caption="", **kwargs):
+        await self.api.request("send_photo")
+        message = self.api.message(self.chat.id, caption, reply_to=self)
+        message.reply_markup = kwargs.get('reply_markup')
+        if message.reply_markup:
+            self.api.menus[self.chat.id] = message
+        return message
+    async def edit_text(self, text, reply_markup=None, **kwargs):
+        await self.api.request("edit_message_text")
+        self.text = text
+        if reply_markup:
+            self.reply_markup = reply_markup
+            self.api.menus[self.chat.id] = self
+        return self
+    async def delete(self):
+        await self.api.request("delete_messages")
+        return True
+class FakeSession:
+    # Stands in for a pyrogram media Session; each connection carries one part at a time at the upload bandwidth
+    def __init__(self, client, dc_id, auth_key, test_mode, is_media=False):
+        self.api = client.api
+        self.lock = asyncio.Lock()
+    async def start(self):
+        await self.api.request("media_session")
+    async def stop(self):
+        pass
+    async def invoke(self, rpc):
+        async with self.lock:
+            await self.api.request(type(rpc).__name__)
+            if self.api.upload_bytes_per_sec:
+                await asyncio.sleep(len(rpc.bytes) / self.api.upload_bytes_per_sec)
+        return True
+class FakeStorage:
+    async def dc_id(self):
+        return 2
+    async def auth_key(self):
+        return b"\0" * 256
+    async def test_mode(self):
+        return False
+class FakeClient:
+    def __init__(self, api: FakeApi):
+        self.api = api
+        self.storage = FakeStorage()
+    async def _send_media(self, name, chat_id, path, progress=None, progress_args=()):
+        await self.api.request(name)
+        size = os.path.getsize(path) if isinstance(path, str) and os.path.exists(path) else 0
+        if self.api.upload_bytes_per_sec:
+            await asyncio.sleep(size / self.api.upload_bytes_per_sec)
+        if progress:
+            await progress(size, size, *progress_args)
+        self.api.delivered[chat_id] = time.time()
+        kind = name.split("_", 1)[1]
+        return self.api.message(chat_id, **{kind: SimpleNamespace(file_id=f"{kind}-{self.api.next_id}")})
+    async def send_video(self, chat_id, video, progress=None, progress_args=(), **kwargs):
+        return await self._send_media("send_video", chat_id, video, progress, progress_args)
+    async def send_audio(self, chat_id, audio, progress=None, progress_args=(), **kwargs):
+        return await self._send_media("send_audio", chat_id, audio, progress, progress_args)
+    async def send_document(self, chat_id, document, progress=None, progress_args=(), **kwargs):
+        return await self._send_media("send_document", chat_id, document, progress, progress_args)
+    async def send_photo(self, chat_id, photo, progress=None, progress_args=(), **kwargs):
+        return await self._send_media("send_photo", chat_id, photo, progress, progress_args)
+    async def send_media_group(self, chat_id, media, **kwargs):
+        await self.api.request("send_media_group")
+        self.api.delivered[chat_id] = time.time()
+        return [self.api.message(chat_id, photo=SimpleNamespace(file_id=f"photo-{i}")) for i, _ in enumerate(media)]
+    async def get_messages(self, chat_id, message_ids):
+        await self.api.request("get_messages")
+        return SimpleNamespace(empty=True)
+    def rnd_id(self) -> int:
+        self.api.next_id += 1
+        return self.api.next_id
+    async def save_file(self, path, progress=None, progress_args=()):
+        await self.api.request("save_file")
+        size = os.path.getsize(path) if isinstance(path, str) else len(path.getbuffer())
+        if self.api.upload_bytes_per_sec:
+            await asyncio.sleep(size / self.api.upload_bytes_per_sec)
+        if progress:
+            await progress(size, size, *progress_args)
+        return SimpleNamespace(name=os.path.basename(path) if isinstance(path, str) else path.name, size=size)
+async def send_uploaded_media(client, chat_id, input_file, kind, random_id=None, **kwargs):
+    # Stands in for uploader.send_uploaded_media: the upload already happened in save_file, this is the SendMedia call
+    await client.api.request(f"send_{kind}")
+    client.api.delivered[chat_id] = time.time()
+    return client.api.message(chat_id, **{kind: SimpleNamespace(file_id=f"{kind}-{random_id}")})
+def make_links(mix: dict, count: int) -> list:
+    kinds = [kind for kind, weight in mix.items() for _ in range(weight)]
+    links = []
+    for i in range(count):
+        kind = kinds[i % len(kinds)]
+        if kind == "tiktok":
+            links.append((kind, f"https://www.tiktok.com/@bench/video/{7000000000000000000 + i}"))
+        else:
+            links.append((kind, f"https://www.youtube.com/watch?v=bench{i:06d}"))
+    return links
+def disk_usage(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+async def run_load(args, workers: int) -> dict:
+    import main
+    import uploader
+    from downloader import info_cache, select_profile
+    from urls import canonical_key
+    port = start_media_server(args.server_mbps)
+    api = FakeApi(args.latency_ms / 1000, args.flood_rate, args.flood_seconds, args.upload_mbps * 1024 * 1024 / 8)
+    client = FakeClient(api)
+    main.app = client
+    main.send_uploaded_media = send_uploaded_media
+    uploader.Session = FakeSession
+    links = make_links(args.mix, args.jobs)
+    for i, (kind, url) in enumerate(links):
+        info = fake_info(url, f"bench{i:06d}", port, args.size_mb * 1024 * 1024)
+        for key in {canonical_key(url), canonical_key(select_profile(url)[0])}:
+            info_cache.put(key, info)
+    tasks = [asyncio.create_task(main.progress_dispatcher.run())]
+    if workers == "auto":
+        tasks += [asyncio.create_task(main.worker(limit=main.worker_limit)) for _ in range(main.WORKER_MAX)]
+        tasks.append(asyncio.create_task(main.concurrency.run()))
+    else:
+        tasks += [asyncio.create_task(main.worker()) for _ in range(workers)]
+    disk_peak = 0
+    stop = asyncio.Event()
+    async def sample_disk():
+        nonlocal disk_peak
+        while not stop.is_set():
+            disk_peak = max(disk_peak, await asyncio.to_thread(disk_usage, main.DOWNLOADS_DIR))
+            await asyncio.sleep(0.05)
+    sampler = asyncio.create_task(sample_disk())
+    async def submit(i, kind, url):
+        chat_id = 100000 + i
+        incoming = api.message(chat_id, url, user_id=chat_id)
+        await main.video_handler(client, incoming)
+        if kind == "tiktok":
+            return
+        menu = api.menus.get(chat_id)
+        if not menu:
+            return
+        choice = "audio" if kind == "audio" else "best"
+        data = next((b.callback_data for row in menu.reply_markup.inline_keyboard for b in row if b.callback_data.startswith(f"fmt_{choice}_")), None)
+        if not data:
+            return
+        query = SimpleNamespace(data=data, from_user=incoming.from_user, message=menu)
+        async def answer(*a, **kw):
+            await api.request("answer_callback_query")
+        query.answer = answer
+        await main.format_callback(client, query)
+    started = time.time()
+    submitted = {}
+    for i, (kind, url) in enumerate(links):
+        submitted[100000 + i] = time.time()
+        tasks.append(asyncio.create_task(submit(i, kind, url)))
+        if args.rate:
+            await asyncio.sleep(1 / args.rate)
+    deadline = time.time() + args.timeout
+    while sum(main.JOBS.values.values()) < len(links) and time.time() < deadline:
+        await asyncio.sleep(0.05)
+    elapsed = time.time() - started
+    stop.set()
+    await sampler
+    for task in tasks:
+        task.cancel()
+    latencies = [api.delivered[chat] - t for chat, t in submitted.items() if chat in api.delivered]
+    outcomes = {dict(key).get('outcome'): value for key, value in main.JOBS.values.items()}
+    return {
+        'workers': f"auto:{main.worker_limit.limit}" if workers == "auto" else workers,
+        'jobs': len(links),
+        'done': outcomes.get('done', 0),
+        'failed': outcomes.get('failed', 0),
+        'timed_out': len(links) - sum(outcomes.values()),
+        'seconds': elapsed,
+        'jobs_per_sec': len(latencies) / elapsed if elapsed else 0,
+        'p50': percentile(latencies, 0.5),
+        'p99': percentile(latencies, 0.99),
+        'rss_peak_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'disk_peak_mb': disk_peak / 1024 / 1024,
+        'api_calls': sum(api.calls.values()),
+        'flood_waits': api.floods,
+        'save_file': api.calls['save_file'],
+        'big_file_parts': api.calls['SaveBigFilePart']
+    }
+def run_child(args):
+    workdir = tempfile.mkdtemp(prefix="load_bench_")
+    os.chdir(workdir) # Every database, cache and the downloads spool of this run lives here
+    os.environ.update({
+        'BOT_TOKEN': "0:bench", 'API_ID': "1", 'API_HASH': "bench", 'OWNER_ID': "", 'CACHE_CHAT_ID': "",
+        'BOT_ROLE': "all",
+        'WORKER_COUNT': "1" if args.workers == "auto" else str(args.workers), 'PRIORITY_WORKER_COUNT': "0", 'USER_MAX_INFLIGHT': "1",
+        'SPOOL_MIN_FREE_MB': "0", 'METRICS_PORT': "0",
+        'ADAPTIVE_WORKERS': "1" if args.workers == "auto" else "0", 'WORKER_MAX': str(args.max_workers),
+        'ADAPT_INTERVAL': str(args.adapt_interval), 'DOWNLOAD_WORKERS': str(max(4, args.max_workers))
+    })
+    sys.path.insert(0, ROOT)
+    import logging
+    logging.basicConfig(level=logging.WARNING, stream=sys.stderr)
+    result = asyncio.run(run_load(args, args.workers))
+    print(json.dumps(result))
+def parse_mix(text: str) -> dict:
+    mix = {}
+    for part in text.split(","):
+        kind, _, weight = part.partition(":")
+        if kind not in ("video", "audio", "tiktok"):
+            raise argparse.ArgumentTypeError(f"unknown link kind {kind}")
+        mix[kind] = int(weight or 1)
+    return mix
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=40)
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts, one run each; auto = adaptive limit")
+    parser.add_argument("--max-workers", type=int, default=8, help="upper bound for --workers auto")
+    parser.add_argument("--adapt-interval", type=float, default=2, help="controller window for --workers auto")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("video:3,tiktok:1"), help="e.g. video:3,audio:1,tiktok:1")
+    parser.add_argument("--size-mb", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=0, help="incoming links per second, 0 = all at once")
+    parser.add_argument("--server-mbps", type=float, default=400, help="media server bandwidth per connection, 0 = unlimited")
+    parser.add_argument("--upload-mbps", type=float, default=200, help="simulated Telegram upload bandwidth per file or media connection, 0 = instant")
+    parser.add_argument("--latency-ms", type=float, default=40, help="latency of every fake API call")
+    parser.add_argument("--flood-rate", type=float, default=0.01, help="chance an API call raises FloodWait")
+    parser.add_argument("--flood-seconds", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        args.workers = args.workers if args.workers == "auto" else int(args.workers)
+        run_child(args)
+        return
+    print(f"{args.jobs} jobs, mix {args.mix}, {args.size_mb} MB each")
+    print(
+        f"uploads: STREAM_UPLOADS={os.getenv('STREAM_UPLOADS', '1')}, parallel uploader from {os.getenv('PARALLEL_UPLOAD_THRESHOLD_MB', '50')} MB, "
+        "SendMedia simulated"
+    )
+    print(f"{'workers':>7} {'ok':>4} {'fail':>4} {'jobs/s':>7} {'p50 s':>7} {'p99 s':>7} {'rss MB':>7} {'disk MB':>8} {'calls':>6} {'floods':>6} {'saves':>6} {'parts':>6}")
+    mix = ",".join(f"{kind}:{weight}" for kind, weight in args.mix.items())
+    argv = [f"--mix={mix}"] + [
+        f"--{name.replace('_', '-')}={value}" for name, value in vars(args).items() if name not in ("mix", "workers", "child")
+    ]
+    for workers in args.workers.split(","):
+        child = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), *argv, f"--workers={workers}", "--child"],
+            capture_output=True, text=True
+        )
+        if child.returncode != 0 or not child.stdout.strip():
+            print(f"{workers:>7} run failed:\n{child.stderr[-2000:]}")
+            continue
+        r = json.loads(child.stdout.strip().splitlines()[-1])
+        print(
+            f"{r['workers']:>7} {r['done']:>4} {r['failed'] + r['timed_out']:>4} {r['jobs_per_sec']:>7.2f} {r['p50']:>7.2f} {r['p99']:>7.2f} "
+            f"{r['rss_peak_mb']:>7.0f} {r['disk_peak_mb']:>8.1f} {r['api_calls']:>6} {r['flood_waits']:>6} {r['save_file']:>6} {r['big_file_parts']:>6}"
+        )
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# Parallel uploader against a local stand-in for Telegram's media DC: a TCP server that acks each
+# part after a fixed RTT and throttles every connection to a fixed bandwidth, like a real MTProto link.
+#   python benchmarks/upload_bench.py --size-mb 64 --conn-mbps 4 --rtt-ms 80
+import argparse
+import asyncio
+import os
+import struct
+import sys
+import tempfile
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from uploader import upload_big_file, PART_SIZE
+class StandInServer:
+    def __init__(self, conn_bytes_per_sec, rtt):
+        self.conn_bytes_per_sec = conn_bytes_per_sec
+        self.rtt = rtt
+        self.parts = set()
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                header = await reader.readexactly(8)
+                part, size = struct.unpack("!II", header)
+                await reader.readexactly(size)
+                await asyncio.sleep(size / self.conn_bytes_per_sec + self.rtt)
+                self.parts.add(part)
+                writer.write(b"\x01")
+                await writer.drain()
+        except asyncio.IncompleteReadError:
+            pass
+        finally:
+            writer.close()
+class StandInSession:
+    def __init__(self, port):
+        self.port = port
+        self.lock = asyncio.Lock() # One request on the wire per connection, bandwidth is per connection
+    async def start(self):
+        self.reader, self.writer = await asyncio.open_connection("127.0.0.1", self.port)
+    async def invoke(self, rpc):
+        async with self.lock:
+            self.writer.write(struct.pack("!II", rpc.file_part, len(rpc.bytes)) + rpc.bytes)
+            await self.writer.drain()
+            await self.reader.readexactly(1)
+    async def stop(self):
+        self.writer.close()
+class StandInClient:
+    def rnd_id(self):
+        return int.from_bytes(os.urandom(8), "big") >> 1
+async def run_case(path, port, server, parallel_parts, connections):
+    server.parts.clear()
+    async def session_factory(client):
+        session = StandInSession(port)
+        await session.start()
+        return session
+    last = {'throughput': 0.0}
+    started = time.perf_counter()
+    def progress(current, total):
+        last['throughput'] = current / (time.perf_counter() - started)
+    input_file = await upload_big_file(
+        StandInClient(), path,
+        parallel_parts=parallel_parts,
+        connections=connections,
+        progress=progress,
+        session_factory=session_factory
+    )
+    elapsed = time.perf_counter() - started
+    assert len(server.parts) == input_file.parts, "missing parts"
+    size = os.path.getsize(path)
+    print(f"parts={parallel_parts:>2} conns={connections:>2}: {elapsed:6.2f} s, {size / elapsed / 1024 / 1024:6.2f} MB/s (reported {last['throughput'] / 1024 / 1024:.2f} MB/s)")
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size-mb', type=int, default=64)
+    parser.add_argument('--conn-mbps', type=float, default=4.0, help="MB/s per connection")
+    parser.add_argument('--rtt-ms', type=float, default=80.0)
+    parser.add_argument('--cases', default="4x1,8x2,8x4,16x8", help="parallel_parts x connections")
+    args = parser.parse_args()
+    server = StandInServer(args.conn_mbps * 1024 * 1024, args.rtt_ms / 1000)
+    tcp = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+    port = tcp.sockets[0].getsockname()[1]
+    with tempfile.NamedTemporaryFile(suffix=".mp4") as f:
+        f.write(os.urandom(args.size_mb * 1024 * 1024))
+        f.flush()
+        print(f"{args.size_mb} MB file, {args.size_mb * 1024 * 1024 // PART_SIZE} parts, {args.conn_mbps} MB/s per connection, {args.rtt_ms:.0f} ms RTT")
+        for case in args.cases.split(","):
+            parallel_parts, connections = (int(x) for x in case.split("x"))
+            await run_case(f.name, port, server, parallel_parts, connections)
+    tcp.close()
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,49 @@
+# Compares per-request YoutubeDL construction against checkouts from the warm pool.
+# Offline by default (setup cost only), pass --url to include a real metadata extraction.
+#   python benchmarks/ydl_pool_bench.py -n 50 [--url https://youtu.be/...]
+import argparse
+import os
+import statistics
+import sys
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import yt_dlp
+from downloader import PROFILES
+from ydl_pool import YDLPool
+def run_fresh(profile, n, url):
+    timings = []
+    for _ in range(n):
+        started = time.perf_counter()
+        with yt_dlp.YoutubeDL(dict(PROFILES[profile])) as ydl:
+            if url:
+                ydl.extract_info(url, download=False)
+        timings.append(time.perf_counter() - started)
+    return timings
+def run_pooled(profile, n, url):
+    pool = YDLPool(PROFILES, max_idle=1)
+    timings = []
+    for _ in range(n):
+        started = time.perf_counter()
+        with pool.acquire(profile) as ydl:
+            if url:
+                ydl.extract_info(url, download=False)
+        timings.append(time.perf_counter() - started)
+    pool.close()
+    return timings
+def report(name, timings):
+    ms = [t * 1000 for t in timings]
+    print(f"{name:>8}: mean {statistics.mean(ms):8.2f} ms | median {statistics.median(ms):8.2f} ms | first {ms[0]:8.2f} ms | total {sum(ms) / 1000:.2f} s")
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', type=int, default=50)
+    parser.add_argument('--profile', default='video', choices=list(PROFILES))
+    parser.add_argument('--url', default=None)
+    args = parser.parse_args()
+    fresh = run_fresh(args.profile, args.n, args.url)
+    pooled = run_pooled(args.profile, args.n, args.url)
+    report("fresh", fresh)
+    report("pooled", pooled)
+    saved = statistics.mean(fresh) - statistics.mean(pooled)
+    print(f"saved per request: {saved * 1000:.2f} ms")
+if __name__ == "__main__":
+    main()
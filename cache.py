@@ -0,0 +1,171 @@
+import copy
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+class BoundedLRU:
+    # Small thread-safe memo for lookups that would otherwise grow for the life of the process
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.entries:
+                return default
+            self.entries.move_to_end(key)
+            return self.entries[key]
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+    def __len__(self) -> int:
+        return len(self.entries)
+class FileIdCache:
+    def __init__(self, path: str = "file_cache.json", max_entries: int = 5000, ttl: int = 7 * 24 * 3600, flush_interval: float = 5.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.dirty = False
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock() # One writer at a time for the shared .tmp file
+        self.saves = 0
+        self.load()
+        self.stop = threading.Event()
+        if flush_interval:
+            # Uploads only mark the cache dirty; a burst of them costs one rewrite of the file
+            self.writer = threading.Thread(target=self._write_loop, name="file-cache-writer", daemon=True)
+            self.writer.start()
+    @staticmethod
+    def make_key(video_key: str, audio_only: bool = False, quality: str = "best") -> str:
+        kind = "audio" if audio_only else "video"
+        return f"{video_key}|{kind}|{quality}"
+    def get(self, key: str) -> dict:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and time.time() - entry['ts'] > self.ttl:
+                del self.entries[key]
+                self.evictions += 1
+                self.dirty = True
+                entry = None
+            if not entry:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return dict(entry)
+    def put(self, key: str, file_id: str, kind: str, **meta):
+        with self.lock:
+            self.entries[key] = {'file_id': file_id, 'kind': kind, 'ts': time.time(), **meta}
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+            self.dirty = True
+    def peek(self, key: str) -> dict:
+        # No stats, no TTL: used to hand a fresh upload's entry to other processes
+        with self.lock:
+            entry = self.entries.get(key)
+            return dict(entry) if entry else None
+    def discard(self, key: str):
+        with self.lock:
+            if self.entries.pop(key, None):
+                self.dirty = True
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, OSError):
+            return
+        now = time.time()
+        items = sorted(data.items(), key=lambda kv: kv[1].get('ts', 0))
+        for key, entry in items[-self.max_entries:]:
+            if entry.get('file_id') and now - entry.get('ts', 0) <= self.ttl:
+                self.entries[key] = entry
+    def save(self):
+        with self.save_lock:
+            with self.lock:
+                if not self.dirty:
+                    return
+                snapshot = dict(self.entries)
+                self.dirty = False
+            tmp_path = self.path + ".tmp"
+            try:
+                with open(tmp_path, "w") as f:
+                    json.dump(snapshot, f)
+                os.replace(tmp_path, self.path)
+                self.saves += 1
+            except OSError:
+                with self.lock:
+                    self.dirty = True # Retried on the next flush
+                raise
+    def _write_loop(self):
+        while not self.stop.wait(self.flush_interval):
+            try:
+                self.save()
+            except Exception as e:
+                logging.error(f"File cache save failed: {e}")
+    def close(self):
+        self.stop.set()
+        self.save()
+class InfoCache:
+    def __init__(self, max_entries: int = 200, ttl: int = 1800):
+        self.max_entries = max_entries
+        self.ttl = ttl # Stream URLs inside info dicts expire, keep this well under a few hours
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+    def get(self, key: str) -> dict:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and time.time() - entry[0] > self.ttl:
+                del self.entries[key]
+                entry = None
+            if not entry:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(entry[1])
+    def has(self, key: str) -> bool:
+        # No stats, no copy: lets callers decide whether a lookup will need the network
+        with self.lock:
+            entry = self.entries.get(key)
+            return bool(entry) and time.time() - entry[0] <= self.ttl
+    def put(self, key: str, info: dict):
+        with self.lock:
+            self.entries[key] = (time.time(), copy.deepcopy(info))
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager, contextmanager
+class AdaptiveLimit:
+    # Jobs in progress across the worker tasks; more tasks exist than permits, the limit decides how many run
+    def __init__(self, initial: int, minimum: int, maximum: int):
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.limit = min(self.maximum, max(minimum, initial))
+        self.active = 0 # Slots held, including workers still waiting for a job
+        self.busy = 0 # Workers with a job in hand
+        self.cond = asyncio.Condition()
+    @asynccontextmanager
+    async def slot(self):
+        async with self.cond:
+            await self.cond.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+        try:
+            yield
+        finally:
+            async with self.cond:
+                self.active -= 1
+                self.cond.notify_all()
+    @contextmanager
+    def running(self):
+        # Entered after the dequeue, so idle slot holders don't look like saturation
+        self.busy += 1
+        try:
+            yield
+        finally:
+            self.busy -= 1
+    async def set_limit(self, limit: int):
+        # Lowering never interrupts running jobs; they just aren't replaced until active drops below the limit
+        async with self.cond:
+            self.limit = min(self.maximum, max(self.minimum, limit))
+            self.cond.notify_all()
+class AIMDController:
+    # Additive increase while aggregate throughput keeps growing, multiplicative decrease on congestion signals.
+    # sample() returns cumulative totals: bytes (downloaded + uploaded), download_bytes, download_seconds,
+    # jobs, errors (extractor/download failures) and flood_waits; backlog() is the number of jobs waiting.
+    def __init__(self, limiter: AdaptiveLimit, sample, backlog, interval: float = 20, decrease: float = 0.75,
+                 error_ratio: float = 0.3, speed_drop: float = 0.15, gain: float = 0.05):
+        self.limiter = limiter
+        self.sample = sample
+        self.backlog = backlog
+        self.interval = interval
+        self.decrease = decrease
+        self.error_ratio = error_ratio
+        self.speed_drop = speed_drop
+        self.gain = gain
+        self.previous = None # Window stats from the last tick that saw traffic
+        self.decision = "hold"
+        self.reason = "starting"
+        self.decisions = {"increase": 0, "decrease": 0, "hold": 0}
+        self.window = {'throughput': 0.0, 'job_speed': 0.0, 'jobs': 0, 'errors': 0, 'flood_waits': 0}
+    def _decide(self, window: dict, saturated: bool) -> tuple:
+        limit = self.limiter.limit
+        previous = self.previous
+        if window['flood_waits']:
+            return "decrease", f"{window['flood_waits']} FloodWaits"
+        if window['jobs'] >= 2 and window['errors'] / window['jobs'] > self.error_ratio:
+            return "decrease", f"{window['errors']}/{window['jobs']} jobs failed"
+        if previous and previous['limit'] < limit and previous['job_speed'] and window['job_speed']:
+            if window['job_speed'] < previous['job_speed'] * (1 - self.speed_drop) and window['throughput'] < previous['throughput'] * (1 + self.gain):
+                return "decrease", (
+                    f"per-job speed fell to {window['job_speed'] / 1048576:.2f} MB/s "
+                    f"with no aggregate gain ({window['throughput'] / 1048576:.2f} MB/s)"
+                )
+        if not saturated:
+            return "hold", "not saturated"
+        if previous and window['throughput'] < previous['throughput'] * (1 - self.gain) and previous['limit'] < limit:
+            return "hold", "throughput did not grow with the last increase"
+        if limit >= self.limiter.maximum:
+            return "hold", "at maximum"
+        return "increase", f"saturated, {window['throughput'] / 1048576:.2f} MB/s aggregate"
+    async def tick(self, totals: dict, last: dict, seconds: float):
+        delta = {key: totals[key] - last.get(key, 0) for key in totals}
+        window = {
+            'throughput': delta['bytes'] / seconds if seconds > 0 else 0.0,
+            'job_speed': delta['download_bytes'] / delta['download_seconds'] if delta['download_seconds'] > 0 else 0.0,
+            'jobs': delta['jobs'],
+            'errors': delta['errors'],
+            'flood_waits': delta['flood_waits'],
+            'limit': self.limiter.limit
+        }
+        saturated = self.limiter.busy >= self.limiter.limit and self.backlog() > 0
+        self.window = window
+        if not window['throughput'] and not window['jobs'] and not window['flood_waits'] and not saturated:
+            self.decision, self.reason = "hold", "idle"
+            self.decisions["hold"] += 1
+            return
+        decision, reason = self._decide(window, saturated)
+        limit = self.limiter.limit
+        if decision == "increase":
+            await self.limiter.set_limit(limit + 1)
+        elif decision == "decrease":
+            await self.limiter.set_limit(int(limit * self.decrease))
+        if self.limiter.limit == limit and decision == "decrease":
+            reason += ", already at minimum"
+            decision = "hold"
+        self.decision, self.reason = decision, reason
+        self.decisions[decision] += 1
+        if decision != "hold":
+            logging.info(f"Worker limit {limit} -> {self.limiter.limit}: {reason}")
+        else:
+            logging.debug(f"Worker limit stays {limit}: {reason}")
+        if window['throughput'] or window['jobs']:
+            self.previous = window
+    async def run(self):
+        logging.info(f"Adaptive worker limit {self.limiter.limit} (min {self.limiter.minimum}, max {self.limiter.maximum})")
+        last = self.sample()
+        last_time = time.monotonic()
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                totals = self.sample()
+                now = time.monotonic()
+                await self.tick(totals, last, now - last_time)
+                last, last_time = totals, now
+            except Exception as e:
+                logging.error(f"Concurrency controller failed: {e}")
+    def stats(self) -> dict:
+        return {
+            'limit': self.limiter.limit,
+            'active': self.limiter.active,
+            'busy': self.limiter.busy,
+            'min': self.limiter.minimum,
+            'max': self.limiter.maximum,
+            'decision': self.decision,
+            'reason': self.reason,
+            'decisions': dict(self.decisions),
+            **{key: self.window.get(key, 0) for key in ('throughput', 'job_speed', 'jobs', 'errors', 'flood_waits')}
+        }
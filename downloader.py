@@ -1,82 +1,393 @@
-import yt_dlp
+import copy
 import os
-def download_video(url: str, output_path: str = "downloads", progress_hook=None, max_size_bytes: int = None, audio_only: bool = False, quality: str = "best") -> dict:
-    if not os.path.exists(output_path):
-        os.makedirs(output_path)
-    if 'tiktok.com' in url and not audio_only:
-         pass
+import shlex
+import subprocess
+import threading
+import time
+from cache import BoundedLRU, InfoCache
+from identities import IdentityPool
+from metrics import STAGE_SECONDS, DOWNLOAD_BYTES, DOWNLOAD_SPEED
+from urls import canonical_key, detect_platform
+from ydl_pool import YDLPool
+from slideshow import fetch_slideshow, slideshow_kind
+info_cache = InfoCache(
+    max_entries=int(os.getenv("INFO_CACHE_MAX", 200)),
+    ttl=int(os.getenv("INFO_CACHE_TTL", 1800))
+)
+DOWNLOAD_OPTS = {
+    'noplaylist': True,
+    'writethumbnail': True,
+}
+PROFILES = {
+    'metadata': {
+        'extract_flat': True, # Don't download
+        'noplaylist': True, # watch?v=X&list=... is the video, not the Mix it was shared from
+        'quiet': True,
+        'no_warnings': True,
+    },
+    'direct': {
+        'format': 'best[ext=mp4]/best',
+        'quiet': True,
+        'no_warnings': True,
+        'extract_flat': 'in_playlist', # Extract full info for single video, flat for playlist
+        'noplaylist': True,
+    },
+    'tiktok': {**DOWNLOAD_OPTS, 'format': 'best'},
+    'video': {
+        **DOWNLOAD_OPTS,
+        'format': 'bestvideo[height<=1440][fps<=60]+bestaudio/best[height<=1440][fps<=60]/best',
+        'merge_output_format': 'mp4',
+    },
+    'audio': {**DOWNLOAD_OPTS, 'format': 'bestaudio/best'},
+    'audio_opus': {
+        **DOWNLOAD_OPTS,
+        'format': 'bestaudio/best',
+        'postprocessors': [{
+            'key': 'FFmpegExtractAudio',
+            'preferredcodec': 'opus',
+            'preferredquality': '192',
+        }],
+    },
+}
+ydl_pool = YDLPool(PROFILES, max_idle=int(os.getenv("YDL_POOL_IDLE", 4)))
+identity_pool = IdentityPool.load(os.getenv("IDENTITIES_FILE", "identities.json"))
+extracted_by = BoundedLRU(info_cache.max_entries) # canonical key -> identity whose egress the cached format URLs are bound to
+QUALITY_HEIGHTS = {'low': 360, 'medium': 720, 'high': 1080, 'best': 1440}
+def quality_format(quality: str) -> str:
+    if quality not in ('low', 'medium', 'high'):
+        return PROFILES['video']['format']
+    height = QUALITY_HEIGHTS[quality]
+    # H.264 + AAC first: merges into mp4 by stream copy and plays everywhere without a server-side re-encode
+    return (
+        f'bestvideo[height<={height}][fps<=60][vcodec^=avc1]+bestaudio[ext=m4a]/'
+        f'bestvideo[height<={height}][fps<=60]+bestaudio/best[height<={height}][fps<=60]/best'
+    )
+QUALITY_LADDER = ['best', 'high', 'medium', 'low']
+def format_size(fmt: dict, duration: float) -> int:
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if size:
+        return int(size)
+    bitrate = fmt.get('tbr') or ((fmt.get('vbr') or 0) + (fmt.get('abr') or 0)) # kbit/s
+    if bitrate and duration:
+        return int(bitrate * 1000 / 8 * duration)
+    return None
+def estimate_size(selected: dict) -> int:
+    # Merged selections rarely carry a top-level filesize, so sum the parts that will actually be fetched
+    duration = selected.get('duration') or 0
+    formats = selected.get('requested_formats') or [selected]
+    sizes = [format_size(f, duration) for f in formats]
+    if not all(sizes):
+        return None
+    return sum(sizes)
+def select_formats(info: dict, quality: str = "best", audio_only: bool = False, profile: str = None) -> dict:
+    profile = profile or ('audio' if audio_only else 'video')
+    overrides = {'format': quality_format(quality)} if profile == 'video' else {}
+    with ydl_pool.acquire(profile, **overrides) as ydl:
+        return ydl.process_ie_result(copy.deepcopy(info), download=False)
+def fit_quality(info: dict, profile: str, quality: str, max_size_bytes: int) -> tuple:
+    # Walks down the ladder from the requested quality until the estimate fits; unknown sizes are let through
+    if profile == 'video':
+        start = QUALITY_LADDER.index(quality) if quality in QUALITY_LADDER else 0
+        candidates = QUALITY_LADDER[start:]
+    else:
+        candidates = [quality]
+    smallest = None
+    for candidate in candidates:
+        size = estimate_size(select_formats(info, candidate, profile=profile))
+        if size is None or size <= max_size_bytes:
+            return candidate, size
+        smallest = size if smallest is None else min(smallest, size)
+    return None, smallest
+def quality_options(info: dict) -> list:
+    # One entry per distinct selection, so a 480p upload doesn't offer three identical buttons
+    options = []
+    seen = set()
+    for quality in ('low', 'medium', 'high', 'best'):
+        try:
+            selected = select_formats(info, quality)
+        except Exception as e:
+            print(f"Format selection error ({quality}): {e}")
+            continue
+        format_id = selected.get('format_id')
+        if format_id in seen and quality != 'best':
+            continue
+        seen.add(format_id)
+        options.append({'quality': quality, 'size': estimate_size(selected), 'height': selected.get('height')})
+    try:
+        audio_size = estimate_size(select_formats(info, audio_only=True))
+    except Exception:
+        audio_size = None
+    options.append({'quality': 'audio', 'size': audio_size, 'height': None})
+    return options
+PLATFORM_DEFAULTS = {
+    # HLS/DASH fragments in parallel; 10MB HTTP chunks dodge YouTube's per-request throttling
+    'youtube': {'fragments': 4, 'http_chunk_mb': 10},
+    'tiktok': {'fragments': 1, 'http_chunk_mb': 0},
+    'instagram': {'fragments': 4, 'http_chunk_mb': 0},
+    'default': {'fragments': 2, 'http_chunk_mb': 0},
+}
+def load_download_profile(platform: str) -> dict:
+    # .env overrides per platform, e.g. YOUTUBE_FRAGMENTS=8, YOUTUBE_EXTERNAL_DOWNLOADER=aria2c
+    prefix = platform.upper()
+    defaults = PLATFORM_DEFAULTS.get(platform, PLATFORM_DEFAULTS['default'])
+    opts = {}
+    fragments = int(os.getenv(f"{prefix}_FRAGMENTS", defaults['fragments']))
+    if fragments > 1:
+        opts['concurrent_fragment_downloads'] = fragments
+    chunk_mb = int(os.getenv(f"{prefix}_HTTP_CHUNK_MB", defaults['http_chunk_mb']))
+    if chunk_mb > 0:
+        opts['http_chunk_size'] = chunk_mb * 1024 * 1024
+    external = os.getenv(f"{prefix}_EXTERNAL_DOWNLOADER")
+    if external:
+        opts['external_downloader'] = {'default': external}
+        external_args = os.getenv(f"{prefix}_EXTERNAL_ARGS")
+        if external_args:
+            opts['external_downloader_args'] = {'default': shlex.split(external_args)}
+    return opts
+DOWNLOAD_PROFILES = {platform: load_download_profile(platform) for platform in PLATFORM_DEFAULTS}
+profile_stats = {}
+profile_stats_lock = threading.Lock()
+def describe_download_profile(platform: str) -> str:
+    opts = DOWNLOAD_PROFILES[platform]
+    name = f"{platform}:frag{opts.get('concurrent_fragment_downloads', 1)}"
+    if opts.get('http_chunk_size'):
+        name += f":chunk{opts['http_chunk_size'] // (1024 * 1024)}M"
+    if opts.get('external_downloader'):
+        name += f":{opts['external_downloader']['default']}"
+    return name
+def record_throughput(profile_name: str, size: int, seconds: float):
+    with profile_stats_lock:
+        stats = profile_stats.setdefault(profile_name, {'jobs': 0, 'bytes': 0, 'seconds': 0.0})
+        stats['jobs'] += 1
+        stats['bytes'] += size
+        stats['seconds'] += seconds
+def record_stream(plan: dict, nbytes: int, seconds: float):
+    # Streamed jobs never reach download_video; their transfer is accounted the same way under a :stream profile
+    record_throughput(f"{plan['platform']}:stream", nbytes, seconds)
+    STAGE_SECONDS.observe(seconds, stage="download")
+    DOWNLOAD_BYTES.inc(nbytes, platform=plan['platform'])
+    DOWNLOAD_SPEED.set(nbytes / seconds if seconds > 0 else 0, platform=plan['platform'])
+def is_live(info: dict) -> bool:
+    # Unprocessed results carry live_status; is_live is only filled in by format processing
+    return bool(info.get('is_live')) or info.get('live_status') in ('is_live', 'is_upcoming')
+def thumbnail_url(info: dict) -> str:
+    thumbnails = [t for t in info.get('thumbnails') or [] if t.get('url')]
+    return info.get('thumbnail') or (thumbnails[-1]['url'] if thumbnails else None)
+def extract_raw(ydl, url: str) -> dict:
+    # Extractor output before format selection, so the cache never pins one caller's selection
+    # (requested_formats of a merge) onto another caller's audio or low-quality pick
+    info = ydl.extract_info(url, download=False, process=False)
+    for _ in range(3):
+        if info.get('_type') not in ('url', 'url_transparent'):
+            break
+        resolved = ydl.extract_info(info['url'], download=False, process=False, ie_key=info.get('ie_key'))
+        if info['_type'] == 'url_transparent':
+            resolved.update({k: v for k, v in info.items() if v is not None and k not in ('_type', 'url', 'ie_key', 'id')})
+        info = resolved
+    if info.get('_type') in ('playlist', 'multi_video'):
+        # Unprocessed entries are a generator; sanitize_info would cache its repr. Only the marker is kept
+        return {'_type': 'playlist', 'id': info.get('id'), 'title': info.get('title')}
+    return ydl.sanitize_info(info)
+def is_playlist(info: dict) -> bool:
+    return info.get('_type') == 'playlist'
+def extract_cached(ydl, url: str, identity=None) -> dict:
+    key = canonical_key(url)
+    info = info_cache.get(key)
+    if info is not None and identity:
+        previous = identity_pool.find(extracted_by.get(key))
+        if previous and previous.proxy != identity.proxy:
+            info = None # Signed format URLs are tied to the IP that extracted them
+    if info is None:
+        with STAGE_SECONDS.time(stage="extract"):
+            info = extract_raw(ydl, url)
+        info_cache.put(key, info)
+        if identity:
+            extracted_by.put(key, identity.name)
+    return info
+def lease_identity(url: str, charge: bool = None):
+    # Sticks to the identity that extracted the cached info while it stays healthy.
+    # Budget is spent on network work only: by default that's a cache miss, downloads pass charge=True
+    platform = detect_platform(url)
+    key = canonical_key(url)
+    if charge is None:
+        charge = not info_cache.has(key)
+    return identity_pool.lease(platform if platform in DOWNLOAD_PROFILES else 'default', prefer=extracted_by.get(key), charge=charge)
+def select_profile(url: str, audio_only: bool = False, convert_audio: bool = True) -> tuple:
     if 'tiktok.com' in url:
-        ydl_opts = {
-            'outtmpl': f'{output_path}/%(title)s.%(ext)s',
-            'noplaylist': True,
-            'writethumbnail': True,
-            'progress_hooks': [progress_hook] if progress_hook else [],
-        }
-        print("DEBUG: Falling back to yt-dlp for TikTok")
         url = url.replace('/photo/', '/video/')
         if '?' in url:
              url = url.split('?')[0]
-        ydl_opts['format'] = 'best'
-    else:
-        ydl_opts = {
-            'outtmpl': f'{output_path}/%(title)s.%(ext)s',
-            'noplaylist': True,
-            'writethumbnail': True,
-            'progress_hooks': [progress_hook] if progress_hook else [],
-        }
-        if audio_only:
-             ydl_opts['format'] = 'bestaudio/best'
-             ydl_opts['postprocessors'] = [{
-                 'key': 'FFmpegExtractAudio',
-                 'preferredcodec': 'opus',
-                 'preferredquality': '192',
-             }]
-        else:
-             ydl_opts['format'] = 'bestvideo[height<=1440][fps<=60]+bestaudio/best[height<=1440][fps<=60]/best'
-             ydl_opts['merge_output_format'] = 'mp4'
-    try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        return url, 'tiktok'
+    if audio_only:
+        return url, 'audio_opus' if convert_audio else 'audio'
+    return url, 'video'
+def download_video(url: str, output_path: str = "downloads", progress_hook=None, max_size_bytes: int = None, audio_only: bool = False, quality: str = "best", convert_audio: bool = True) -> dict:
+    if not os.path.exists(output_path):
+        os.makedirs(output_path)
+    if not audio_only and slideshow_kind(url):
+        with lease_identity(url, charge=True) as lease:
+            try:
+                album = fetch_slideshow(url, output_path, max_size_bytes, lease.identity)
+            except Exception as e:
+                print(f"Slideshow fetch failed, falling back to yt-dlp: {e}")
+                lease.fail(str(e))
+                album = None
+            if album and album.get('downloaded_bytes'):
+                lease.transferred(album['downloaded_bytes'], album['download_seconds'])
+        if album:
+            if album.get('download_profile'):
+                record_throughput(album['download_profile'], album['downloaded_bytes'], album['download_seconds'])
+                STAGE_SECONDS.observe(album['download_seconds'], stage="download")
+                DOWNLOAD_BYTES.inc(album['downloaded_bytes'], platform=detect_platform(url))
+            return album
+    url, profile = select_profile(url, audio_only, convert_audio)
+    platform = detect_platform(url)
+    if platform not in DOWNLOAD_PROFILES:
+        platform = 'default'
+    download_profile = describe_download_profile(platform)
+    overrides = dict(DOWNLOAD_PROFILES[platform])
+    transfer = {'bytes': 0}
+    def hook(d):
+        if d['status'] == 'finished':
+            transfer['bytes'] += d.get('total_bytes') or d.get('downloaded_bytes') or 0
+        if progress_hook:
+            progress_hook(d)
+    with lease_identity(url, charge=True) as lease:
+        try:
+            with ydl_pool.acquire(profile, identity=lease.identity) as ydl:
+                info = extract_cached(ydl, url, lease.identity)
+            if is_playlist(info):
+                return {'error': 'is_playlist'}
+            estimated_size = None
             if max_size_bytes:
-                info = ydl.extract_info(url, download=False)
-                if info.get('is_live'):
+                if is_live(info):
                     return {'error': 'is_live'}
-                filesize = info.get('filesize') or info.get('filesize_approx')
-                if filesize and filesize > max_size_bytes:
-                    return {'error': 'file_too_large', 'size': filesize}
-            info = ydl.extract_info(url, download=True)
-            filename = ydl.prepare_filename(info)
-            thumbnail_path = None
-            base_filename = os.path.splitext(filename)[0]
-            for ext in ['jpg', 'jpeg', 'png', 'webp']:
-                possible_thumb = f"{base_filename}.{ext}"
-                if os.path.exists(possible_thumb):
-                    thumbnail_path = possible_thumb
-                    break
-            return {
-                'path': filename,
-                'title': info.get('title', 'Video'),
-                'author': info.get('uploader') or info.get('uploader_id') or 'Unknown',
-                'resolution': info.get('resolution') or f"{info.get('height', '?')}p",
-                'thumbnail': thumbnail_path
-            }
+                fitted, estimated_size = fit_quality(info, profile, quality, max_size_bytes)
+                if fitted is None:
+                    return {'error': 'file_too_large', 'size': estimated_size}
+                if fitted != quality:
+                    print(f"Stepped quality down from {quality} to {fitted} to fit {max_size_bytes} bytes")
+                    quality = fitted
+            if profile == 'video':
+                overrides['format'] = quality_format(quality)
+            with ydl_pool.acquire(profile, progress_hook=hook, identity=lease.identity, outtmpl=f'{output_path}/%(title)s.%(ext)s', **overrides) as ydl:
+                download_started = time.time()
+                info = ydl.process_ie_result(info, download=True) # Reuses the extracted info, no second round trip
+                download_seconds = time.time() - download_started
+                lease.transferred(transfer['bytes'], download_seconds)
+                throughput = transfer['bytes'] / download_seconds if download_seconds > 0 else 0
+                record_throughput(download_profile, transfer['bytes'], download_seconds)
+                STAGE_SECONDS.observe(download_seconds, stage="download")
+                DOWNLOAD_BYTES.inc(transfer['bytes'], platform=platform)
+                DOWNLOAD_SPEED.set(throughput, platform=platform)
+                filename = ydl.prepare_filename(info)
+                if profile == 'audio_opus':
+                    filename = os.path.splitext(filename)[0] + '.opus' # FFmpegExtractAudio renames the output
+                thumbnail_path = None
+                base_filename = os.path.splitext(filename)[0]
+                for ext in ['jpg', 'jpeg', 'png', 'webp']:
+                    possible_thumb = f"{base_filename}.{ext}"
+                    if os.path.exists(possible_thumb):
+                        thumbnail_path = possible_thumb
+                        break
+                return {
+                    'path': filename,
+                    'title': info.get('title', 'Video'),
+                    'author': info.get('uploader') or info.get('uploader_id') or 'Unknown',
+                    'resolution': info.get('resolution') or f"{info.get('height', '?')}p",
+                    'thumbnail': thumbnail_path,
+                    'acodec': info.get('acodec'),
+                    'duration': info.get('duration') or 0,
+                    'width': info.get('width') or 0,
+                    'height': info.get('height') or 0,
+                    'quality': quality,
+                    'estimated_size': estimated_size,
+                    'download_profile': download_profile,
+                    'downloaded_bytes': transfer['bytes'],
+                    'download_seconds': download_seconds,
+                    'throughput': throughput
+                }
+        except Exception as e:
+            print(f"Error downloading video: {e}")
+            lease.fail(str(e))
+            return {'error': 'exception', 'details': str(e)}
+def estimate_download(url: str, audio_only: bool = False, quality: str = "best", max_size_bytes: int = None) -> int:
+    # Same selection download_video will make; the info lands in info_cache so the download doesn't extract twice
+    url, profile = select_profile(url, audio_only, convert_audio=False)
+    try:
+        with lease_identity(url) as lease, ydl_pool.acquire(profile, identity=lease.identity) as ydl:
+            info = extract_cached(ydl, url, lease.identity)
+        if is_live(info) or is_playlist(info):
+            return None
+        if max_size_bytes:
+            return fit_quality(info, profile, quality, max_size_bytes)[1]
+        return estimate_size(select_formats(info, quality, profile=profile))
     except Exception as e:
-        print(f"Error downloading video: {e}")
-        return {'error': 'exception', 'details': str(e)}
-def get_video_info(url: str) -> dict:
-    ydl_opts = {
-        'extract_flat': True, # Don't download
-        'quiet': True,
-        'no_warnings': True,
+        print(f"Error estimating download size: {e}")
+        return None
+def plan_stream(url: str, audio_only: bool = False, max_size_bytes: int = None) -> dict:
+    # Returns the single progressive format yt-dlp would pick, or None when the job needs a merge,
+    # a fragmented protocol or is otherwise not streamable
+    url, profile = select_profile(url, audio_only, convert_audio=False)
+    try:
+        with lease_identity(url) as lease, ydl_pool.acquire(profile, identity=lease.identity) as ydl: # The stream itself is charged by identity_pool.hold
+            info = extract_cached(ydl, url, lease.identity)
+            if is_live(info) or info.get('_type', 'video') != 'video':
+                return None
+            selected = ydl.process_ie_result(info, download=False)
+    except Exception as e:
+        print(f"Stream plan error: {e}")
+        return None
+    if selected.get('requested_formats') or selected.get('protocol') not in ('http', 'https') or not selected.get('url'):
+        return None
+    filesize = estimate_size(selected)
+    if max_size_bytes and filesize and filesize > max_size_bytes:
+        return None
+    return {
+        'url': selected['url'],
+        'headers': selected.get('http_headers') or {},
+        'proxy': lease.identity.proxy, # The stream must leave through the IP the URL was signed for
+        'platform': lease.platform,
+        'identity': lease.identity.name,
+        'cookies': selected.get('cookies'),
+        'cookiefile': lease.identity.cookiefile,
+        'ext': selected.get('ext', 'mp4'),
+        'filesize': filesize,
+        'acodec': selected.get('acodec'),
+        'title': selected.get('title', 'Video'),
+        'author': selected.get('uploader') or selected.get('uploader_id') or 'Unknown',
+        'resolution': selected.get('resolution') or f"{selected.get('height', '?')}p",
+        'duration': selected.get('duration') or 0,
+        'width': selected.get('width') or 0,
+        'height': selected.get('height') or 0
     }
+def convert_to_opus(path: str, acodec: str = None, bitrate: str = "192k") -> str:
+    # Same result as yt-dlp's FFmpegExtractAudio(opus), run separately so it can go to its own pool
+    target = os.path.splitext(path)[0] + '.opus'
+    if target == path:
+        return path
+    codec_args = ['-c:a', 'copy'] if acodec and acodec.startswith('opus') else ['-c:a', 'libopus', '-b:a', bitrate]
+    result = subprocess.run(
+        ['ffmpeg', '-y', '-loglevel', 'error', '-i', path, '-vn', *codec_args, target],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {result.stderr.strip()[-300:]}")
+    os.remove(path)
+    return target
+def get_video_info(url: str) -> dict:
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
+        with lease_identity(url) as lease, ydl_pool.acquire('metadata', identity=lease.identity) as ydl:
+            info = extract_cached(ydl, url, lease.identity)
+            if is_playlist(info):
+                return {'title': info.get('title') or 'Playlist', 'is_playlist': True}
             return {
                 'title': info.get('title', 'Video'),
                 'duration': info.get('duration', 0),
-                'thumbnail': info.get('thumbnail', None),
+                'thumbnail': thumbnail_url(info),
                 'author': info.get('uploader', 'Unknown'),
-                'is_live': info.get('is_live', False)
+                'is_live': is_live(info),
+                'qualities': [] if is_live(info) else quality_options(info)
             }
     except Exception as e:
         print(f"Metadata Error: {e}")
@@ -85,14 +396,11 @@ import logging
 def get_direct_link(url: str) -> dict:
     logging.info(f"get_direct_link called for: {url}")
     try:
-        ydl_opts = {
-            'format': 'best[ext=mp4]/best',
-            'quiet': True,
-            'no_warnings': True,
-            'extract_flat': 'in_playlist', # Extract full info for single video, flat for playlist
-        }
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
+        with lease_identity(url) as lease, ydl_pool.acquire('direct', identity=lease.identity) as ydl:
+            info = extract_cached(ydl, url, lease.identity)
+            if is_playlist(info):
+                return None
+            info = ydl.process_ie_result(info, download=False)
             video_url = info.get('url')
             if not video_url and 'formats' in info:
                  video_url = info['formats'][-1].get('url')
@@ -103,7 +411,7 @@ def get_direct_link(url: str) -> dict:
             return {
                 'url': video_url,
                 'title': info.get('title', 'Video'),
-                'thumbnail': info.get('thumbnail'),
+                'thumbnail': thumbnail_url(info),
                 'duration': info.get('duration')
             }
     except Exception as e:
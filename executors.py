@@ -0,0 +1,70 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+def _timed_call(fn, args, kwargs):
+    # Runs inside the pool (thread or child process), the start stamp lets the caller split wait vs run time
+    started = time.time()
+    return started, fn(*args, **kwargs)
+class MeteredExecutor:
+    def __init__(self, name: str, max_workers: int, use_processes: bool = False):
+        self.name = name
+        self.max_workers = max_workers
+        self.use_processes = use_processes
+        if use_processes:
+            self.executor = ProcessPoolExecutor(max_workers=max_workers)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.wait_total = 0.0
+        self.run_total = 0.0
+        self.wait_max = 0.0
+    async def run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        submitted = time.time()
+        self.pending += 1
+        try:
+            started, result = await loop.run_in_executor(self.executor, _timed_call, fn, args, kwargs)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.pending -= 1
+        finished = time.time()
+        wait = max(0.0, started - submitted)
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        self.run_total += finished - started
+        self.completed += 1
+        return result
+    def stats(self) -> dict:
+        done = self.completed or 1
+        return {
+            'name': self.name,
+            'workers': self.max_workers,
+            'queued': max(0, self.pending - self.max_workers),
+            'active': min(self.pending, self.max_workers),
+            'completed': self.completed,
+            'failed': self.failed,
+            'avg_wait': self.wait_total / done,
+            'max_wait': self.wait_max,
+            'avg_run': self.run_total / done
+        }
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+metadata_pool = MeteredExecutor("metadata", int(os.getenv("METADATA_WORKERS", 4)))
+def default_download_workers() -> int:
+    # One thread per job that can run at once (workers + audio workers), so the pool never caps the worker limit
+    adaptive = os.getenv("ADAPTIVE_WORKERS", "1") == "1"
+    workers = int(os.getenv("WORKER_MAX", 8)) if adaptive else int(os.getenv("WORKER_COUNT", 2))
+    return max(4, workers + int(os.getenv("PRIORITY_WORKER_COUNT", 1)))
+download_pool = MeteredExecutor("download", int(os.getenv("DOWNLOAD_WORKERS", default_download_workers())))
+postprocess_pool = MeteredExecutor(
+    "postprocess",
+    int(os.getenv("POSTPROCESS_WORKERS", 2)),
+    use_processes=os.getenv("POSTPROCESS_USE_PROCESSES", "0") == "1"
+)
+journal_pool = MeteredExecutor("journal", 1) # One thread owns the claiming connection, a blocked BEGIN IMMEDIATE waits here instead of on the loop
+POOLS = [metadata_pool, download_pool, postprocess_pool, journal_pool]
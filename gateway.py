@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import time
+from pyrogram.errors import FloodWait, InternalServerError, ServiceUnavailable, SlowmodeWait
+TRANSIENT_ERRORS = (InternalServerError, ServiceUnavailable, ConnectionError, TimeoutError, asyncio.TimeoutError)
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+    def delay(self, cost: float = 1.0) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        needed = min(cost, self.capacity) # A cost above capacity goes out once the bucket is full and leaves it in debt
+        if self.tokens >= needed:
+            self.tokens -= cost
+            return 0.0
+        return (needed - self.tokens) / self.rate
+    def ready(self, cost: float = 1.0) -> bool:
+        # Non-consuming check, for callers that would rather skip than wait
+        now = time.monotonic()
+        return now >= self.blocked_until and min(self.capacity, self.tokens + (now - self.updated) * self.rate) >= min(cost, self.capacity)
+    def block(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+class TelegramGateway:
+    # Single path for outgoing Bot API calls: token buckets per chat and globally,
+    # sleep-and-retry on FloodWait, bounded retry with backoff on transient network/server errors
+    def __init__(self, global_rate: float = 25.0, private_rate: float = 1.0, group_rate: float = 20 / 60, max_retries: int = 4):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.private_rate = private_rate
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self.chat_buckets = {}
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.flood_waits = 0
+        self.flood_wait_seconds = 0.0
+        self.throttle_seconds = 0.0
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if not bucket:
+            if len(self.chat_buckets) > 10000:
+                self._prune()
+            is_group = isinstance(chat_id, int) and chat_id < 0
+            rate = self.group_rate if is_group else self.private_rate
+            bucket = TokenBucket(rate, max(3.0, rate * 3)) # Small burst so a reply + edit pair doesn't stall
+            self.chat_buckets[chat_id] = bucket
+        return bucket
+    def ready(self, chat_id, cost: float = 1.0) -> bool:
+        return self._chat_bucket(chat_id).ready(cost) and self.global_bucket.ready()
+    async def _acquire(self, chat_id, cost: float):
+        waited = 0.0
+        for bucket in ([self._chat_bucket(chat_id)] if chat_id is not None else []) + [self.global_bucket]:
+            while True:
+                delay = bucket.delay(cost if bucket is not self.global_bucket else 1.0)
+                if delay <= 0:
+                    break
+                waited += delay
+                await asyncio.sleep(delay)
+        self.throttle_seconds += waited
+    async def call(self, chat_id, func, /, *args, retries: int = None, cost: float = 1.0, idempotent: bool = True, **kwargs):
+        # idempotent=False: a transient error may hide a call that went through, so only FloodWaits
+        # (rejected before anything was sent) are retried
+        retries = self.max_retries if retries is None else retries
+        attempt = 0
+        while True:
+            await self._acquire(chat_id, cost)
+            self.calls += 1
+            try:
+                return await func(*args, **kwargs)
+            except (FloodWait, SlowmodeWait) as e:
+                self.flood_waits += 1
+                self.flood_wait_seconds += e.value
+                if chat_id is not None:
+                    self._chat_bucket(chat_id).block(e.value)
+                if attempt >= retries:
+                    self.failures += 1
+                    raise
+                logging.warning(f"FloodWait {e.value}s on {getattr(func, '__name__', func)} for {chat_id}")
+                await asyncio.sleep(e.value)
+            except TRANSIENT_ERRORS as e:
+                if attempt >= retries or not idempotent:
+                    self.failures += 1
+                    raise
+                logging.warning(f"Transient error on {getattr(func, '__name__', func)} ({e}), retrying")
+                await asyncio.sleep(min(30, 2 ** attempt))
+            attempt += 1
+            self.retries += 1
+    def _prune(self):
+        now = time.monotonic()
+        for chat_id in [c for c, b in self.chat_buckets.items() if b.blocked_until < now and now - b.updated > 300]:
+            del self.chat_buckets[chat_id]
+    def forget_chat(self, chat_id):
+        self.chat_buckets.pop(chat_id, None)
+    def stats(self) -> dict:
+        return {
+            'calls': self.calls,
+            'retries': self.retries,
+            'failures': self.failures,
+            'flood_waits': self.flood_waits,
+            'flood_wait_seconds': self.flood_wait_seconds,
+            'throttle_seconds': self.throttle_seconds,
+            'chats': len(self.chat_buckets)
+        }
@@ -0,0 +1,183 @@
+import json
+import logging
+import sqlite3
+import time
+from contextlib import contextmanager
+QUEUED = "queued"
+DOWNLOADING = "downloading"
+UPLOADING = "uploading"
+DONE = "done"
+FAILED = "failed"
+UNFINISHED = (QUEUED, DOWNLOADING, UPLOADING)
+RUNNING = (DOWNLOADING, UPLOADING)
+COLUMNS = {'user_id': "TEXT", 'lane': "TEXT", 'cache_key': "TEXT", 'worker': "TEXT", 'result': "TEXT", 'claimed_at': "REAL"}
+class JobJournal:
+    # Durable record of every queued job, so a restart can pick up where it left off.
+    # Several processes may share the file: the front-end adds jobs, workers claim them (see BOT_ROLE in main.py).
+    def __init__(self, path: str = "jobs.db", check_same_thread: bool = True):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=check_same_thread)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, state TEXT NOT NULL, payload TEXT NOT NULL, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        existing = {row[1] for row in self.conn.execute("PRAGMA table_info(jobs)")}
+        for column, kind in COLUMNS.items():
+            if column not in existing:
+                self.conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_cache_key ON jobs (cache_key, state)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_user_claimed ON jobs (user_id, claimed_at)")
+    @contextmanager
+    def _transaction(self):
+        # IMMEDIATE takes the write lock up front, so two workers can't claim the same row
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.conn
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+    @staticmethod
+    def _message_ref(item: dict) -> dict:
+        message = item.get('message')
+        processing_msg = item.get('processing_msg')
+        return {
+            'user_id': item['user_id'],
+            'chat_id': item['chat_id'],
+            'message_id': message.id if message else None,
+            'processing_msg_id': processing_msg.id if processing_msg else None
+        }
+    def _payload(self, job: dict) -> str:
+        return json.dumps({
+            'url': job['url'],
+            'video_key': job['video_key'],
+            'audio_only': job['audio_only'],
+            'quality': job['quality'],
+            **self._message_ref(job),
+            'waiters': [self._message_ref(w) for w in job['waiters']]
+        })
+    @staticmethod
+    def _record(row) -> dict:
+        return {'job_id': row[0], 'state': row[1], **json.loads(row[2])}
+    def add(self, job: dict) -> int:
+        now = time.time()
+        cursor = self.conn.execute(
+            "INSERT INTO jobs (state, payload, created_at, updated_at, user_id, lane, cache_key) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (QUEUED, self._payload(job), now, now, str(job['user_id']), job['lane'], job['cache_key'])
+        )
+        return cursor.lastrowid
+    def update(self, job: dict, state: str = None):
+        # With a state only the state moves; the payload is rewritten only when waiters changed in this process
+        job_id = job.get('job_id')
+        if job_id is None:
+            return
+        try:
+            if state:
+                self.conn.execute("UPDATE jobs SET state = ?, updated_at = ? WHERE id = ?", (state, time.time(), job_id))
+            else:
+                self.conn.execute("UPDATE jobs SET payload = ?, updated_at = ? WHERE id = ?", (self._payload(job), time.time(), job_id))
+        except sqlite3.Error as e:
+            logging.error(f"Job journal update failed for {job_id}: {e}")
+    def pending(self, cache_key: str) -> int:
+        row = self.conn.execute(
+            f"SELECT id FROM jobs WHERE cache_key = ? AND state IN ({', '.join('?' * len(UNFINISHED))}) ORDER BY id DESC LIMIT 1",
+            (cache_key, *UNFINISHED)
+        ).fetchone()
+        return row[0] if row else None
+    def attach(self, cache_key: str, waiter: dict) -> int:
+        # Adds a waiter to an unfinished job for the same video; None means a new job is needed
+        with self._transaction() as conn:
+            row = conn.execute(
+                f"SELECT id, payload FROM jobs WHERE cache_key = ? AND state IN ({', '.join('?' * len(UNFINISHED))}) ORDER BY id DESC LIMIT 1",
+                (cache_key, *UNFINISHED)
+            ).fetchone()
+            if not row:
+                return None
+            payload = json.loads(row[1])
+            payload['waiters'].append(self._message_ref(waiter))
+            conn.execute("UPDATE jobs SET payload = ? WHERE id = ?", (json.dumps(payload), row[0]))
+            return row[0]
+    def has_queued(self, lanes=None) -> bool:
+        # Plain read, no write lock: lets idle workers skip claim() when there is nothing to take
+        lanes = tuple(lanes) if lanes else ('priority', 'normal')
+        return self.conn.execute(
+            f"SELECT 1 FROM jobs WHERE state = ? AND lane IN ({', '.join('?' * len(lanes))}) LIMIT 1",
+            (QUEUED, *lanes)
+        ).fetchone() is not None
+    def claim(self, worker: str, lanes=None, per_user_limit: int = 1) -> dict:
+        # Priority lane first, then round-robin like FairScheduler: the user served longest ago (or never) goes next,
+        # oldest job first within a user; users already at their limit across all workers are skipped
+        lanes = tuple(lanes) if lanes else ('priority', 'normal')
+        with self._transaction() as conn:
+            row = conn.execute(
+                f"SELECT id, state, payload, created_at FROM jobs WHERE state = ? AND lane IN ({', '.join('?' * len(lanes))}) "
+                f"AND user_id NOT IN (SELECT user_id FROM jobs WHERE state IN (?, ?) GROUP BY user_id HAVING COUNT(*) >= ?) "
+                f"ORDER BY lane = 'priority' DESC, (SELECT MAX(claimed_at) FROM jobs AS served WHERE served.user_id = jobs.user_id), id LIMIT 1",
+                (QUEUED, *lanes, *RUNNING, per_user_limit)
+            ).fetchone()
+            if not row:
+                return None
+            now = time.time()
+            conn.execute("UPDATE jobs SET state = ?, worker = ?, updated_at = ?, claimed_at = ? WHERE id = ?", (DOWNLOADING, worker, now, now, row[0]))
+        record = self._record(row)
+        record['state'] = DOWNLOADING
+        record['created_at'] = row[3]
+        return record
+    def heartbeat(self, job_ids):
+        if not job_ids:
+            return
+        job_ids = list(job_ids)
+        self.conn.execute(f"UPDATE jobs SET updated_at = ? WHERE id IN ({', '.join('?' * len(job_ids))})", (time.time(), *job_ids))
+    def requeue_stale(self, max_age: float) -> int:
+        # Jobs whose worker stopped heartbeating go back to the queue for another worker
+        cursor = self.conn.execute(
+            "UPDATE jobs SET state = ?, worker = NULL WHERE state IN (?, ?) AND worker IS NOT NULL AND updated_at < ?",
+            (QUEUED, *RUNNING, time.time() - max_age)
+        )
+        return cursor.rowcount
+    def requeue_worker(self, worker: str) -> int:
+        cursor = self.conn.execute(
+            "UPDATE jobs SET state = ?, worker = NULL WHERE state IN (?, ?) AND worker = ?",
+            (QUEUED, *RUNNING, worker)
+        )
+        return cursor.rowcount
+    def complete(self, job_id: int, state: str, result: dict = None) -> dict:
+        # Returns the final record, including waiters another process attached while the job ran
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET state = ?, result = ?, updated_at = ? WHERE id = ?",
+                (state, json.dumps(result) if result else None, time.time(), job_id)
+            )
+            row = conn.execute("SELECT id, state, payload FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._record(row) if row else None
+    def results_since(self, since: float) -> list:
+        return self.conn.execute(
+            "SELECT updated_at, cache_key, result FROM jobs WHERE state = ? AND result IS NOT NULL AND updated_at > ? ORDER BY updated_at",
+            (DONE, since)
+        ).fetchall()
+    def queued_ahead(self, job_id: int) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM jobs WHERE state = ? AND id < ?", (QUEUED, job_id)).fetchone()[0]
+    def unfinished(self) -> list:
+        rows = self.conn.execute(
+            f"SELECT id, state, payload FROM jobs WHERE state IN ({', '.join('?' * len(UNFINISHED))}) ORDER BY id",
+            UNFINISHED
+        ).fetchall()
+        return [self._record(row) for row in rows]
+    def prune(self, max_age: float = 7 * 24 * 3600):
+        self.conn.execute(
+            "DELETE FROM jobs WHERE state IN (?, ?) AND updated_at < ?",
+            (DONE, FAILED, time.time() - max_age)
+        )
+    def counts(self) -> dict:
+        return dict(self.conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+    def workers(self) -> dict:
+        return dict(self.conn.execute(
+            f"SELECT worker, COUNT(*) FROM jobs WHERE state IN (?, ?) AND worker IS NOT NULL GROUP BY worker",
+            RUNNING
+        ).fetchall())
+    def close(self):
+        self.conn.close()
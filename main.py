@@ -1,11 +1,15 @@
 import asyncio
+import contextlib
+import json
 import logging
 import os
+import socket
 import sys
-import json
 import time
 import re
+import io
 from dotenv import load_dotenv
+load_dotenv() # Before local imports, some modules read .env at import time
 import pyrogram
 from pyrogram import Client, filters, enums
 from pyrogram.types import (
@@ -14,6 +18,7 @@ from pyrogram.types import (
     ReplyKeyboardRemove,
     InputMediaVideo,
     InputMediaDocument,
+    InputMediaPhoto,
     Message,
     InlineKeyboardMarkup,
     InlineKeyboardButton,
@@ -23,47 +28,111 @@ from pyrogram.types import (
     InlineQueryResultArticle,
     InlineQueryResultVideo,
     InlineQueryResultCachedVideo,
+    InlineQueryResultCachedAudio,
+    InlineQueryResultCachedPhoto,
+    InlineQueryResultCachedDocument,
     InputTextMessageContent
 )
-from downloader import download_video, get_video_info, get_direct_link
+from downloader import download_video, estimate_download, get_video_info, get_direct_link, convert_to_opus, plan_stream, record_stream, info_cache, ydl_pool, identity_pool, profile_stats
 from text_content import TEXTS
-load_dotenv()
+from cache import FileIdCache
+from storage import UserStore, PendingSelections
+from urls import canonical_key, extract_links
+from scheduler import FairScheduler, PRIORITY, NORMAL
+from executors import metadata_pool, download_pool, postprocess_pool, journal_pool, POOLS
+from streaming import http_source, opus_transcode
+from slideshow import slideshow_kind
+from progress import ProgressDispatcher
+from gateway import TelegramGateway, TRANSIENT_ERRORS
+from pyrogram.errors import FloodWait
+from spool import Spool
+import metrics
+from metrics import STAGE_SECONDS, JOBS, JOB_ERRORS, DOWNLOAD_BYTES, UPLOAD_BYTES
+from concurrency import AdaptiveLimit, AIMDController
+from journal import JobJournal, QUEUED, DOWNLOADING, UPLOADING, DONE, FAILED
+from uploader import rechunk, upload_big_stream, upload_big_file, send_uploaded_media, BIG_FILE_THRESHOLD
 BYTES_IN_MB = 1024 * 1024
+BOT_ROLE = os.getenv("BOT_ROLE", "all") # all = one process; frontend = handlers only; worker = downloads/uploads only
+WORKER_NAME = os.getenv("WORKER_NAME") or f"{socket.gethostname()}-{os.getpid()}" # Set it to keep the same session file across restarts
+BROKER_POLL_INTERVAL = float(os.getenv("BROKER_POLL_INTERVAL", 1)) # Seconds between claim attempts of an idle worker
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0)) # Prometheus scrape endpoint, 0 = off
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+BROKER_STALE_AFTER = int(os.getenv("BROKER_STALE_AFTER", 300)) # Seconds without a heartbeat before a claimed job is re-queued
 FILE_LIMIT = 4000 * BYTES_IN_MB # 4GB
-download_queue = asyncio.Queue()
-processing_urls = set() # Track actively processing URLs to prevent dupes
-WORKER_COUNT = 2 # Process 2 videos continuously
-USER_DATA_FILE = "user_data.json"
-DOWNLOADS_DIR = "downloads"
+WORKER_COUNT = int(os.getenv("WORKER_COUNT", 2)) # Workers serving both lanes, the starting point when adaptive
+ADAPTIVE_WORKERS = os.getenv("ADAPTIVE_WORKERS", "1") == "1" # Resize the worker pool from measured throughput, FloodWaits and errors
+WORKER_MIN = int(os.getenv("WORKER_MIN", 1)) if ADAPTIVE_WORKERS else WORKER_COUNT
+WORKER_MAX = int(os.getenv("WORKER_MAX", 8)) if ADAPTIVE_WORKERS else WORKER_COUNT
+ADAPT_INTERVAL = float(os.getenv("ADAPT_INTERVAL", 20)) # Seconds per measurement window
+PRIORITY_WORKER_COUNT = int(os.getenv("PRIORITY_WORKER_COUNT", 1)) # Extra workers reserved for audio jobs
+if WORKER_MAX + PRIORITY_WORKER_COUNT > download_pool.max_workers:
+    # More jobs than download threads would just queue inside the pool and read as saturation
+    logging.warning(f"DOWNLOAD_WORKERS={download_pool.max_workers} is below WORKER_MAX + PRIORITY_WORKER_COUNT, capping WORKER_MAX")
+    WORKER_MAX = max(1, download_pool.max_workers - PRIORITY_WORKER_COUNT)
+    WORKER_MIN = min(WORKER_MIN, WORKER_MAX)
+USER_MAX_INFLIGHT = int(os.getenv("USER_MAX_INFLIGHT", 1)) # Jobs one user may have running at once
+download_queue = FairScheduler(per_user_limit=USER_MAX_INFLIGHT)
+inflight_jobs = {} # cache key -> job, later requests for the same video attach as waiters
+USER_DATA_FILE = "user_data.json" # Legacy store, migrated into USER_DB_FILE on first start
+USER_DB_FILE = "user_data.db"
+JOBS_DB_FILE = "jobs.db"
+MAX_BATCH_LINKS = int(os.getenv("MAX_BATCH_LINKS", 10)) # Links taken from one message, the rest are ignored
+PENDING_TTL = int(os.getenv("PENDING_TTL", 3600)) # Seconds a format menu stays valid
+TG_GLOBAL_RATE = float(os.getenv("TG_GLOBAL_RATE", 25)) # Outgoing API calls per second, all chats
+TG_PRIVATE_RATE = float(os.getenv("TG_PRIVATE_RATE", 1)) # Per private chat
+TG_GROUP_RATE = float(os.getenv("TG_GROUP_RATE", 20 / 60)) # Per group chat (Telegram allows ~20 messages/minute)
+TG_MAX_RETRIES = int(os.getenv("TG_MAX_RETRIES", 4))
+PROGRESS_MESSAGE_INTERVAL = float(os.getenv("PROGRESS_MESSAGE_INTERVAL", 3)) # Min seconds between edits of one message
+PROGRESS_CHAT_INTERVAL = float(os.getenv("PROGRESS_CHAT_INTERVAL", 1)) # Min seconds between edits in one chat
+PROGRESS_GLOBAL_RATE = float(os.getenv("PROGRESS_GLOBAL_RATE", 20)) # Progress edits per second across all chats
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", 30)) # Short, so results switch to cached file_ids soon after a warm-up
+CACHE_CHAT_ID = os.getenv("CACHE_CHAT_ID") or os.getenv("OWNER_ID") # Chat that background warm-up uploads land in
+DOWNLOADS_DIR = os.path.join("downloads", WORKER_NAME) if BOT_ROLE == "worker" else "downloads" # Workers on one host each own a subtree
+SPOOL_BUDGET = int(os.getenv("SPOOL_BUDGET_MB", 0)) * BYTES_IN_MB # Cap on reserved download space, 0 = free disk only
+SPOOL_MIN_FREE = int(os.getenv("SPOOL_MIN_FREE_MB", 1024)) * BYTES_IN_MB # Disk always left free for the OS and databases
+SPOOL_ORPHAN_AGE = int(os.getenv("SPOOL_ORPHAN_AGE", 3600)) # Seconds before an unowned file in downloads/ is removed
+SPOOL_OVERHEAD = float(os.getenv("SPOOL_OVERHEAD", 2.0)) # Merges and audio conversion hold source and output at once
+SPOOL_DEFAULT_RESERVE = int(os.getenv("SPOOL_DEFAULT_RESERVE_MB", 500)) * BYTES_IN_MB # Used when the size can't be estimated
+FILE_CACHE_FILE = f"file_cache.{WORKER_NAME}.json" if BOT_ROLE == "worker" else "file_cache.json"
+FILE_CACHE_TTL = int(os.getenv("FILE_CACHE_TTL", 7 * 24 * 3600)) # Telegram keeps file_ids valid for a long time
+FILE_CACHE_MAX = int(os.getenv("FILE_CACHE_MAX", 5000))
+STREAM_UPLOADS = os.getenv("STREAM_UPLOADS", "1") == "1" # Pipe single-format TikTok/audio jobs straight into the upload
+STREAM_BUFFER_CHUNKS = int(os.getenv("STREAM_BUFFER_CHUNKS", 8)) # 256KB reads held between fetch and upload
+PARALLEL_UPLOAD_THRESHOLD = max(int(os.getenv("PARALLEL_UPLOAD_THRESHOLD_MB", 50)) * BYTES_IN_MB, BIG_FILE_THRESHOLD) # Smaller files can't go as big-file parts
+UPLOAD_PARALLEL_PARTS = int(os.getenv("UPLOAD_PARALLEL_PARTS", 8)) # Parts in flight at once
+UPLOAD_CONNECTIONS = int(os.getenv("UPLOAD_CONNECTIONS", 4)) # Media connections the parts are spread over
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 API_ID = os.getenv("API_ID")
 API_HASH = os.getenv("API_HASH")
+OWNER_ID = os.getenv("OWNER_ID")
 if not BOT_TOKEN or not API_ID or not API_HASH:
     print("Error: BOT_TOKEN, API_ID, or API_HASH is not set in .env file.")
     sys.exit(1)
 app = Client(
-    "downloader_bot_session",
+    f"downloader_bot_worker_{WORKER_NAME}" if BOT_ROLE == "worker" else "downloader_bot_session",
     api_id=API_ID,
     api_hash=API_HASH,
-    bot_token=BOT_TOKEN
+    bot_token=BOT_TOKEN,
+    no_updates=BOT_ROLE == "worker" # Updates belong to the front-end session
 )
-def load_user_data():
-    if os.path.exists(USER_DATA_FILE):
-        try:
-            with open(USER_DATA_FILE, "r") as f:
-                return json.load(f)
-        except json.JSONDecodeError:
-            return {}
-    return {}
-def save_user_data(data):
-    with open(USER_DATA_FILE, "w") as f:
-        json.dump(data, f, indent=4)
-user_data = load_user_data()
+user_store = UserStore(USER_DB_FILE)
+user_store.migrate_json(USER_DATA_FILE)
+job_journal = JobJournal(JOBS_DB_FILE)
+claim_journal = JobJournal(JOBS_DB_FILE, check_same_thread=False) # Used only from journal_pool's single thread
+spool = Spool(DOWNLOADS_DIR, SPOOL_BUDGET, SPOOL_MIN_FREE, SPOOL_ORPHAN_AGE)
+pending_selections = PendingSelections(ttl=PENDING_TTL)
+gateway = TelegramGateway(TG_GLOBAL_RATE, TG_PRIVATE_RATE, TG_GROUP_RATE, TG_MAX_RETRIES)
+progress_dispatcher = ProgressDispatcher(
+    PROGRESS_MESSAGE_INTERVAL, PROGRESS_CHAT_INTERVAL, PROGRESS_GLOBAL_RATE,
+    edit=lambda message, text: gateway.call(message.chat.id, message.edit_text, text, retries=0), # Dispatcher handles its own FloodWait pause
+    ready=gateway.ready
+)
+file_cache = FileIdCache(FILE_CACHE_FILE, max_entries=FILE_CACHE_MAX, ttl=FILE_CACHE_TTL)
 def get_text(user_id, key, **kwargs):
-    lang = user_data.get(str(user_id), "en")
+    lang = user_store.get_lang(user_id, "en")
     if lang not in TEXTS:
         lang = "en"
-    text = TEXTS.get(lang, TEXTS["en"]).get(key, "")
+    text = TEXTS.get(lang, TEXTS["en"]).get(key) or TEXTS["en"].get(key, "")
     if kwargs:
         try:
             return text.format(**kwargs)
@@ -87,17 +156,16 @@ def get_settings_keyboard():
 async def start_handler(client: Client, message: Message):
     logging.info(f"Start command received from {message.from_user.id} in {message.chat.type}")
     user_id = str(message.from_user.id)
-    if user_id not in user_data:
+    if user_id not in user_store:
         detected_lang = (message.from_user.language_code or "en")[:2]
         if detected_lang in TEXTS:
-             user_data[user_id] = detected_lang
+             user_store.set_lang(user_id, detected_lang)
         else:
-             user_data[user_id] = "en"
-        save_user_data(user_data)
+             user_store.set_lang(user_id, "en")
     text = get_text(user_id, "welcome", name=message.from_user.first_name)
     logging.info(f"Sending welcome text: {text}")
     try:
-        await message.reply_text(text)
+        await gateway.call(message.chat.id, message.reply_text, text)
     except Exception as e:
         logging.error(f"Error sending start reply: {e}")
 @app.on_message(filters.command("language"))
@@ -105,7 +173,8 @@ async def language_command_handler(client: Client, message: Message):
     logging.info(f"Language command received from {message.from_user.id}")
     user_id = str(message.from_user.id)
     try:
-        await message.reply_text(
+        await gateway.call(
+            message.chat.id, message.reply_text,
             get_text(user_id, "choose_language"),
             reply_markup=get_settings_keyboard()
         )
@@ -116,15 +185,142 @@ async def language_callback(client: Client, callback_query: CallbackQuery):
     user_id = str(callback_query.from_user.id)
     lang_code = callback_query.data.split("_")[2]
     if lang_code in TEXTS:
-        user_data[user_id] = lang_code
-        save_user_data(user_data)
+        user_store.set_lang(user_id, lang_code)
         new_text = TEXTS[lang_code].get("language_selected", "Language set!")
-        await callback_query.edit_message_text(new_text)
-    await callback_query.answer()
+        await gateway.call(callback_query.message.chat.id, callback_query.edit_message_text, new_text)
+    await gateway.call(None, callback_query.answer)
+async def send_cached(chat_id, cache_key):
+    entry = file_cache.get(cache_key)
+    if not entry:
+        return False
+    file_id = entry['file_id']
+    caption = entry.get('caption', '')
+    try:
+        if entry['kind'] == 'photo':
+            await gateway.call(chat_id, app.send_photo, chat_id=chat_id, photo=file_id, caption=caption)
+        elif entry['kind'] == 'audio':
+            await gateway.call(chat_id, app.send_audio, chat_id=chat_id, audio=file_id, caption=caption)
+        elif entry['kind'] == 'album':
+            kinds = entry.get('kinds') or ['photo'] * len(file_id)
+            for i in range(0, len(file_id), 10):
+                media_group = [album_item(fid, kind, caption if i == 0 and j == 0 else "") for j, (fid, kind) in enumerate(zip(file_id[i:i + 10], kinds[i:i + 10]))]
+                if len(media_group) == 1:
+                    await send_album_item(chat_id, media_group[0])
+                else:
+                    await gateway.call(chat_id, app.send_media_group, chat_id=chat_id, media=media_group, cost=len(media_group), idempotent=False)
+            if entry.get('audio'):
+                await gateway.call(chat_id, app.send_audio, chat_id=chat_id, audio=entry['audio'])
+        elif entry['kind'] == 'document':
+            await gateway.call(chat_id, app.send_document, chat_id=chat_id, document=file_id, caption=caption)
+        else:
+            await gateway.call(chat_id, app.send_video, chat_id=chat_id, video=file_id, caption=caption, supports_streaming=True)
+        logging.info(f"Cache hit for {cache_key}")
+        return True
+    except (FloodWait, *TRANSIENT_ERRORS) as e:
+        logging.error(f"Cached send for {cache_key} gave up: {e}")
+        return False
+    except Exception as e:
+        logging.error(f"Cached send failed for {cache_key}: {e}")
+        file_cache.discard(cache_key)
+        return False
+def remember_upload(cache_key, sent, caption):
+    if not sent:
+        return
+    for kind in ['video', 'audio', 'photo', 'document']:
+        media = getattr(sent, kind, None)
+        if media:
+            file_cache.put(cache_key, media.file_id, kind, caption=caption)
+            return
+QUALITY_BUTTONS = {'low': "btn_low", 'medium': "btn_med", 'high': "btn_high", 'best': "btn_video", 'audio': "btn_audio"}
+def get_quality_keyboard(user_id, qualities, token):
+    if not qualities:
+        return InlineKeyboardMarkup([
+            [
+                InlineKeyboardButton(get_text(user_id, "btn_video"), callback_data=f"fmt_best_{token}"),
+                InlineKeyboardButton(get_text(user_id, "btn_audio"), callback_data=f"fmt_audio_{token}")
+            ]
+        ])
+    kb = []
+    row = []
+    for option in qualities:
+        label = get_text(user_id, QUALITY_BUTTONS[option['quality']])
+        if option['quality'] == 'best' and option.get('height'):
+            label = f"{label} {option['height']}p"
+        if option.get('size'):
+            label = f"{label} · {option['size'] / BYTES_IN_MB:.0f} MB"
+        row.append(InlineKeyboardButton(label, callback_data=f"fmt_{option['quality']}_{token}"))
+        if len(row) == 2:
+            kb.append(row)
+            row = []
+    if row:
+        kb.append(row)
+    return InlineKeyboardMarkup(kb)
+@app.on_message(filters.command("stats"))
+async def stats_handler(client: Client, message: Message):
+    if not OWNER_ID or str(message.from_user.id) != str(OWNER_ID):
+        return
+    stats = file_cache.stats()
+    text = (
+        f"File cache: {stats['entries']} entries\n"
+        f"Hits: {stats['hits']} | Misses: {stats['misses']} | Hit rate: {stats['hit_rate'] * 100:.1f}%\n"
+        f"Evictions: {stats['evictions']}"
+    )
+    store_stats = user_store.stats()
+    text += f"\nUsers: {store_stats['users']}, {store_stats['pending_writes']} writes pending, {store_stats['flushes']} flushes"
+    job_counts = job_journal.counts()
+    text += "\nJob journal: " + (", ".join(f"{count} {state}" for state, count in sorted(job_counts.items())) or "empty")
+    if BOT_ROLE != "all":
+        for name, running in sorted(job_journal.workers().items()):
+            text += f"\nWorker {name}: {running} running"
+    if BOT_ROLE != "frontend":
+        c = concurrency.stats()
+        text += (
+            f"\nWorker limit: {c['busy']}/{c['limit']} busy (min {c['min']}, max {c['max']}), last {c['decision']}: {c['reason']}, "
+            f"{c['throughput'] / BYTES_IN_MB:.2f} MB/s aggregate, {c['job_speed'] / BYTES_IN_MB:.2f} MB/s per job"
+        )
+    spool_stats = spool.stats()
+    text += (
+        f"\nSpool: {spool_stats['reserved'] / BYTES_IN_MB:.0f} MB reserved by {spool_stats['jobs']} jobs, "
+        f"{spool_stats['available'] / BYTES_IN_MB:.0f} MB available, {spool_stats['delayed']} delayed ({spool_stats['delay_seconds']:.0f}s), "
+        f"{spool_stats['cleaned']} orphans cleaned"
+    )
+    info_stats = info_cache.stats()
+    text += f"\nInfo cache: {info_stats['entries']} entries, hit rate {info_stats['hit_rate'] * 100:.1f}%"
+    gw = gateway.stats()
+    text += (
+        f"\nTelegram API: {gw['calls']} calls, {gw['retries']} retries, {gw['failures']} failed, "
+        f"{gw['flood_waits']} FloodWaits ({gw['flood_wait_seconds']:.0f}s), throttled {gw['throttle_seconds']:.0f}s"
+    )
+    progress_stats = progress_dispatcher.stats()
+    text += (
+        f"\nProgress edits: {progress_stats['edits']} sent, {progress_stats['coalesced']} coalesced, "
+        f"{progress_stats['skipped']} unchanged, {progress_stats['flood_waits']} FloodWaits ({progress_stats['flood_wait_seconds']:.0f}s)"
+    )
+    ydl_stats = ydl_pool.stats()
+    text += f"\nYoutubeDL pool: {ydl_stats['created']} created, {ydl_stats['reused']} reused, setup {ydl_stats['avg_setup'] * 1000:.0f} ms"
+    for name, p in sorted(profile_stats.items()):
+        speed = p['bytes'] / p['seconds'] / BYTES_IN_MB if p['seconds'] else 0
+        text += f"\n{name}: {p['jobs']} jobs, {speed:.2f} MB/s"
+    for ident in identity_pool.stats():
+        cooling = ", ".join(f"{platform} cooling {left:.0f}s" for platform, left in ident['cooling'].items())
+        text += (
+            f"\nIdentity {ident['label']}: {ident['inflight']} active, {ident['jobs']} leases, "
+            f"{ident['success_rate'] * 100:.0f}% ok, {ident['throttles']} throttled, health {ident['health']:.2f}, "
+            f"{ident['bandwidth'] / BYTES_IN_MB:.2f} MB/s" + (f", {cooling}" if cooling else "")
+        )
+    for pool in POOLS:
+        p = pool.stats()
+        text += (
+            f"\n{p['name']}: {p['active']}/{p['workers']} active, {p['queued']} queued, "
+            f"wait {p['avg_wait']:.2f}s (max {p['max_wait']:.1f}s), run {p['avg_run']:.1f}s, {p['failed']} failed"
+        )
+    await gateway.call(message.chat.id, message.reply_text, text)
 async def upload_progress(current, total, client, message, user_id, start_time):
+    if not message:
+        return
     now = time.time()
     diff = now - start_time.get('last_update', 0)
-    if diff < 3 and current != total:
+    if diff < 1 and current != total:
         return
     start_time['last_update'] = now
     start_ts = start_time.get('start', now)
@@ -135,53 +331,50 @@ async def upload_progress(current, total, client, message, user_id, start_time):
         speed = f"{speed_val:.2f} MB/s"
     percent = f"{current * 100 / total:.1f}%"
     total_mb = f"{total / BYTES_IN_MB:.2f} MB"
-    try:
-        text = get_text(user_id, "download_progress", default="Upload: {percent}").format(
-                 percent=percent,
-                 total=total_mb,
-                 speed=speed
-             )
-        await message.edit_text(text)
-    except Exception as e:
-        logging.error(f"Error updating progress: {e}")
-@app.on_message(filters.text & ~filters.command("start"))
+    text = get_text(user_id, "download_progress", percent=percent, total=total_mb, speed=speed)
+    progress_dispatcher.update(message, text)
+@app.on_message(filters.text & ~filters.command(["start", "stats"]))
 async def video_handler(client: Client, message: Message):
     user_id = str(message.from_user.id)
     text = message.text.strip()
     logging.info(f"Received text message: {text} from {user_id} (via_bot: {message.via_bot.id if message.via_bot else 'None'})")
-    pattern = r'(https?://)?(?:[\w-]+\.)*(youtube|youtu|tiktok|instagram)\.(com|be)/.+'
-    match = re.search(pattern, text, re.IGNORECASE)
-    if not match:
-        logging.info("Regex didn't match.")
+    links = extract_links(text, message.entities)
+    if not links:
+        logging.info("No supported links.")
+        return
+    if len(links) > 1:
+        await enqueue_batch(message, user_id, links[:MAX_BATCH_LINKS])
         return
-    url = match.group(0)
-    if not url.startswith("http"):
-        url = "https://" + url
+    platform, url = links[0]
     is_inline = (message.via_bot is not None)
-    is_tiktok = 'tiktok.com' in url.lower()
+    is_tiktok = platform == 'tiktok'
+    video_key = await metadata_pool.run(canonical_key, url)
     if is_inline or is_tiktok:
-        if url in processing_urls:
-             return
-        processing_urls.add(url)
-        processing_msg = await message.reply_text(get_text(user_id, "processing"))
-        await download_queue.put({
-            'url': url,
-            'message': message,
-            'user_id': user_id,
-            'processing_msg': processing_msg,
-            'audio_only': False,
-            'quality': 'best'
-        })
+        if await send_cached(message.chat.id, FileIdCache.make_key(video_key)):
+            try:
+                await gateway.call(message.chat.id, message.delete)
+            except:
+                pass
+            return
+        processing_msg = await gateway.call(message.chat.id, message.reply_text, get_text(user_id, "processing"))
+        await enqueue_job(url, video_key, message, user_id, processing_msg)
+        return
+    analyzing_msg = await gateway.call(message.chat.id, message.reply_text, get_text(user_id, "analyzing"))
+    info = await metadata_pool.run(get_video_info, url)
+    if info and info.get('is_playlist'):
+        await gateway.call(message.chat.id, analyzing_msg.edit_text, get_text(user_id, "error_playlist"))
         return
-    user_data[user_id + "_pending"] = url
-    analyzing_msg = await message.reply_text(get_text(user_id, "analyzing"))
-    info = await asyncio.get_event_loop().run_in_executor(None, lambda: get_video_info(url))
+    token = pending_selections.register({
+        'url': url,
+        'video_key': video_key,
+        'info': info,
+        'user_id': user_id,
+        'chat_id': message.chat.id,
+        'message_id': message.id
+    })
     if not info:
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton(get_text(user_id, "btn_video"), callback_data="fmt_best")],
-            [InlineKeyboardButton(get_text(user_id, "btn_audio"), callback_data="fmt_audio")]
-        ])
-        await analyzing_msg.edit_text(get_text(user_id, "select_format").replace("{title}", "Unknown").replace("{duration}", "?"), reply_markup=keyboard)
+        keyboard = get_quality_keyboard(user_id, None, token)
+        await gateway.call(message.chat.id, analyzing_msg.edit_text, get_text(user_id, "select_format").replace("{title}", "Unknown").replace("{duration}", "?"), reply_markup=keyboard)
         return
     title = info.get('title', 'Video')
     duration = info.get('duration', 0)
@@ -189,66 +382,218 @@ async def video_handler(client: Client, message: Message):
     seconds = duration % 60
     dur_str = f"{minutes} min {seconds} sec"
     caption = get_text(user_id, "select_format").format(title=title, duration=dur_str)
-    keyboard = InlineKeyboardMarkup([
-        [
-            InlineKeyboardButton(get_text(user_id, "btn_video"), callback_data="fmt_best"),
-            InlineKeyboardButton(get_text(user_id, "btn_audio"), callback_data="fmt_audio")
-        ]
-    ])
+    keyboard = get_quality_keyboard(user_id, info.get('qualities'), token)
     try:
         thumb = info.get('thumbnail')
         if thumb and thumb.startswith('http'):
-             await message.reply_photo(
+             await gateway.call(
+                 message.chat.id, message.reply_photo,
                  photo=thumb,
                  caption=caption,
                  reply_markup=keyboard,
                  reply_to_message_id=message.id
              )
-             await analyzing_msg.delete()
+             await gateway.call(message.chat.id, analyzing_msg.delete)
         else:
-             await analyzing_msg.edit_text(caption, reply_markup=keyboard)
+             await gateway.call(message.chat.id, analyzing_msg.edit_text, caption, reply_markup=keyboard)
     except Exception as e:
         logging.error(f"Error sending rich menu: {e}")
-        await analyzing_msg.edit_text(caption, reply_markup=keyboard)
+        await gateway.call(message.chat.id, analyzing_msg.edit_text, caption, reply_markup=keyboard)
 @app.on_callback_query(filters.regex(r"^fmt_"))
 async def format_callback(client: Client, callback_query: CallbackQuery):
     user_id = str(callback_query.from_user.id)
-    choice = callback_query.data.split("_")[1] # low, medium, high, audio, best
-    url = user_data.get(user_id + "_pending")
-    if not url:
-        await callback_query.answer("Link expired.", show_alert=True)
-        try: await callback_query.message.delete()
-        except: pass
+    parts = callback_query.data.split("_", 2)
+    choice = parts[1] # low, medium, high, audio, best
+    token = parts[2] if len(parts) > 2 else ""
+    record = pending_selections.get(token)
+    if not record or record['user_id'] != user_id:
+        await gateway.call(None, callback_query.answer, "Link expired.", show_alert=True)
+        if not record:
+            try: await gateway.call(callback_query.message.chat.id, callback_query.message.delete)
+            except: pass
         return
-    del user_data[user_id + "_pending"]
-    if url in processing_urls:
-         await callback_query.answer("Already processing!", show_alert=True)
-         return
-    await callback_query.answer("Queued!")
-    processing_urls.add(url)
+    pending_selections.pop(token)
+    url = record['url']
+    video_key = record['video_key']
+    audio_only = (choice == "audio")
+    quality = choice if choice in ['low', 'medium', 'high'] else 'best'
+    if await send_cached(callback_query.message.chat.id, FileIdCache.make_key(video_key, audio_only, quality)):
+        await gateway.call(None, callback_query.answer)
+        try:
+            await gateway.call(callback_query.message.chat.id, callback_query.message.delete)
+        except:
+            pass
+        return
+    await gateway.call(None, callback_query.answer, "Queued!")
+    chat_id = callback_query.message.chat.id
     try:
-        await callback_query.message.delete()
+        await gateway.call(chat_id, callback_query.message.delete)
     except:
         pass
-    processing_msg = await callback_query.message.reply_text(get_text(user_id, "processing"))
-    audio_only = (choice == "audio")
-    quality = choice if choice in ['low', 'medium', 'high'] else 'best'
-    await download_queue.put({
+    processing_msg = await gateway.call(chat_id, callback_query.message.reply_text, get_text(user_id, "processing"))
+    message = callback_query.message.reply_to_message or callback_query.message # Use original link message
+    await enqueue_job(url, video_key, message, user_id, processing_msg, audio_only=audio_only, quality=quality)
+def cached_inline_result(entry, title):
+    caption = entry.get('caption', '')
+    if entry['kind'] == 'video':
+        return InlineQueryResultCachedVideo(video_file_id=entry['file_id'], title=title, caption=caption)
+    if entry['kind'] == 'audio':
+        return InlineQueryResultCachedAudio(audio_file_id=entry['file_id'], caption=caption)
+    if entry['kind'] == 'photo':
+        return InlineQueryResultCachedPhoto(photo_file_id=entry['file_id'], title=title, caption=caption)
+    if entry['kind'] == 'document':
+        return InlineQueryResultCachedDocument(document_file_id=entry['file_id'], title=title, caption=caption)
+    return None
+async def warm_cache(url, video_key):
+    if not CACHE_CHAT_ID:
+        return
+    if FileIdCache.make_key(video_key) in inflight_jobs:
+        return
+    if BOT_ROLE == "frontend" and job_journal.pending(FileIdCache.make_key(video_key)):
+        return
+    await enqueue_job(url, video_key, None, str(CACHE_CHAT_ID), None, chat_id=int(CACHE_CHAT_ID))
+@app.on_inline_query()
+async def inline_handler(client: Client, inline_query: InlineQuery):
+    user_id = str(inline_query.from_user.id)
+    links = extract_links(inline_query.query.strip())
+    if not links:
+        await gateway.call(None, inline_query.answer, [], cache_time=INLINE_CACHE_TIME)
+        return
+    url = links[0][1]
+    video_key = await metadata_pool.run(canonical_key, url)
+    results = []
+    entry = file_cache.get(FileIdCache.make_key(video_key))
+    if entry:
+        title = entry.get('caption', '').split("\n", 1)[0] or "Video"
+        result = cached_inline_result(entry, title)
+        if result:
+            results.append(result)
+    if not results:
+        direct = await metadata_pool.run(get_direct_link, url)
+        if direct:
+            results.append(InlineQueryResultVideo(
+                video_url=direct['url'],
+                thumb_url=direct.get('thumbnail') or direct['url'],
+                title=direct.get('title', 'Video'),
+                video_duration=int(direct.get('duration') or 0),
+                caption=direct.get('title', '')
+            ))
+        await warm_cache(url, video_key)
+        results.append(InlineQueryResultArticle(
+            title=get_text(user_id, "processing"),
+            description=url,
+            input_message_content=InputTextMessageContent(url) # Posted via the bot, video_handler queues it
+        ))
+    try:
+        await gateway.call(None, inline_query.answer, results, cache_time=INLINE_CACHE_TIME)
+    except Exception as e:
+        logging.error(f"Error answering inline query: {e}")
+async def enqueue_job(url, video_key, message, user_id, processing_msg, audio_only=False, quality='best', chat_id=None, job_id=None, batch=None):
+    # message/processing_msg may be None for background jobs that only warm the file_id cache
+    cache_key = FileIdCache.make_key(video_key, audio_only, quality)
+    waiter = {'message': message, 'user_id': user_id, 'processing_msg': processing_msg, 'chat_id': chat_id or message.chat.id, 'batch': batch}
+    if BOT_ROLE == "frontend":
+        return await submit_job(url, video_key, cache_key, waiter, audio_only, quality)
+    job = inflight_jobs.get(cache_key)
+    if job:
+        logging.info(f"Attaching to in-flight job {cache_key}")
+        job['waiters'].append(waiter)
+        job_journal.update(job)
+        return job
+    job = {
         'url': url,
-        'message': callback_query.message.reply_to_message or callback_query.message, # Use original link message
-        'user_id': user_id,
-        'processing_msg': processing_msg,
+        'video_key': video_key,
+        'cache_key': cache_key,
         'audio_only': audio_only,
-        'quality': quality
-    })
-async def download_progress_hook(d, client, message, user_id, start_time):
-    if d['status'] == 'downloading':
+        'quality': quality,
+        'lane': PRIORITY if audio_only else NORMAL,
+        'waiters': [],
+        'queued_at': time.time(),
+        **waiter
+    }
+    job['job_id'] = job_id or job_journal.add(job)
+    inflight_jobs[cache_key] = job
+    await download_queue.put(job)
+    position = download_queue.position(job)
+    if processing_msg and not batch and position > download_queue.waiting_workers:
+        try:
+            await gateway.call(processing_msg.chat.id, processing_msg.edit_text, get_text(user_id, "queued", position=position))
+        except Exception as e:
+            logging.error(f"Error showing queue position: {e}")
+    return job
+async def enqueue_batch(message, user_id, links):
+    # Several links in one message: one job each, sharing a single progress message that is removed at the end
+    chat_id = message.chat.id
+    if BOT_ROLE == "frontend":
+        # Worker processes can't see the in-memory batch, so each link gets its own progress message
+        for platform, url in links:
+            video_key = await metadata_pool.run(canonical_key, url)
+            processing_msg = await gateway.call(chat_id, message.reply_text, get_text(user_id, "processing"))
+            await enqueue_job(url, video_key, message, user_id, processing_msg)
+        return
+    processing_msg = await gateway.call(chat_id, message.reply_text, get_text(user_id, "batch_queued", count=len(links)))
+    batch = {'message': message, 'processing_msg': processing_msg, 'user_id': user_id, 'chat_id': chat_id, 'total': len(links), 'done': 0, 'failed': 0}
+    for platform, url in links:
+        video_key = await metadata_pool.run(canonical_key, url)
+        if await send_cached(chat_id, FileIdCache.make_key(video_key)):
+            await batch_item_done(batch)
+            continue
+        await enqueue_job(url, video_key, message, user_id, processing_msg, batch=batch)
+async def batch_item_done(batch, failed=False):
+    batch['done'] += 1
+    batch['failed'] += int(failed)
+    processing_msg = batch['processing_msg']
+    if batch['done'] < batch['total']:
+        progress_dispatcher.update(processing_msg, get_text(batch['user_id'], "batch_progress", done=batch['done'], total=batch['total']))
+        return
+    progress_dispatcher.forget(processing_msg)
+    try:
+        if batch['failed']:
+            await gateway.call(batch['chat_id'], processing_msg.edit_text, get_text(batch['user_id'], "batch_failed", failed=batch['failed'], total=batch['total']))
+            return
+        await gateway.call(batch['chat_id'], processing_msg.delete)
+        await gateway.call(batch['chat_id'], batch['message'].delete)
+    except Exception as e:
+        logging.error(f"Error finishing batch in {batch['chat_id']}: {e}")
+async def settle_batches(job):
+    # Once per job: the owner and every waiter that came from a batch count towards it
+    for item in [job] + job['waiters']:
+        if item.get('batch'):
+            await batch_item_done(item['batch'], failed=bool(job.get('error')))
+async def submit_job(url, video_key, cache_key, waiter, audio_only, quality):
+    # Front-end side of the broker: the job only goes into jobs.db, a worker process picks it up
+    job_id = job_journal.attach(cache_key, waiter)
+    if job_id:
+        logging.info(f"Attaching to queued job {job_id} ({cache_key})")
+        return None
+    job = {
+        'url': url,
+        'video_key': video_key,
+        'cache_key': cache_key,
+        'audio_only': audio_only,
+        'quality': quality,
+        'lane': PRIORITY if audio_only else NORMAL,
+        'waiters': [],
+        'queued_at': time.time(),
+        **waiter
+    }
+    job['job_id'] = job_journal.add(job)
+    position = job_journal.queued_ahead(job['job_id'])
+    if waiter['processing_msg'] and position:
+        try:
+            await gateway.call(waiter['chat_id'], waiter['processing_msg'].edit_text, get_text(waiter['user_id'], "queued", position=position + 1))
+        except Exception as e:
+            logging.error(f"Error showing queue position: {e}")
+    return job
+def download_progress_hook(d, loop, message, user_id, start_time, batch=None):
+    # Runs on the download thread for every yt-dlp callback, only hands the latest text to the dispatcher
+    if message and d['status'] == 'downloading':
         try:
             total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
             current = d.get('downloaded_bytes', 0)
             now = time.time()
             diff = now - start_time.get('last_update', 0)
-            if diff < 3 and current != total:
+            if diff < 1 and current != total:
                 return
             start_time['last_update'] = now
             speed_val = d.get('speed', 0)
@@ -257,150 +602,522 @@ async def download_progress_hook(d, client, message, user_id, start_time):
                 speed = f"{speed_val / BYTES_IN_MB:.2f} MB/s"
             percent = d.get('_percent_str', '0%').strip()
             total_mb = f"{total / BYTES_IN_MB:.2f} MB"
-            text = get_text(user_id, "download_progress", default="DL: {percent}").format(
-                     percent=percent,
-                     total=total_mb,
-                     speed=speed
-                 )
-            await message.edit_text(text)
+            text = get_text(user_id, "download_progress", percent=percent, total=total_mb, speed=speed)
+            if batch:
+                text = f"{get_text(user_id, 'batch_progress', done=batch['done'], total=batch['total'])}\n{text}"
+            progress_dispatcher.update_threadsafe(loop, message, text)
         except Exception as e:
             pass
-async def worker():
-    logging.info("Worker started")
-    while True:
+async def report_error(job, key, details=None, **kwargs):
+    job['error'] = (key, details, kwargs)
+    JOB_ERRORS.inc(type=key)
+    if job.get('batch'):
+        logging.info(f"Batch item {job['url']} failed: {key} {details or ''}")
+        return
+    await show_error(job['processing_msg'], job['user_id'], key, details, **kwargs)
+async def show_error(processing_msg, user_id, key, details=None, **kwargs):
+    if not processing_msg:
+        return
+    progress_dispatcher.forget(processing_msg)
+    text = get_text(user_id, key, **kwargs)
+    if details:
+        text = f"{text}\n\nTechnical Details: {details}"
+    try:
+        await gateway.call(processing_msg.chat.id, processing_msg.edit_text, text)
+    except Exception as e:
+        logging.error(f"Error reporting failure: {e}")
+async def finish_job(job):
+    if job.get('batch'):
+        return # The shared message goes when the whole batch is done
+    if job['processing_msg']:
+        progress_dispatcher.forget(job['processing_msg'])
+        await gateway.call(job['chat_id'], job['processing_msg'].delete)
+    if job['message']:
         try:
-            item = await download_queue.get()
-            url = item['url']
-            message = item['message']
-            user_id = item['user_id']
-            processing_msg = item['processing_msg']
-            audio_only = item.get('audio_only', False)
-            quality = item.get('quality', 'best')
-            start_time = {'start': time.time(), 'last_update': 0}
-            try:
-                video_info = await asyncio.get_event_loop().run_in_executor(
-                    None,
-                    lambda: download_video(url, progress_hook=lambda d: asyncio.run_coroutine_threadsafe(download_progress_hook(d, app, processing_msg, user_id, start_time), loop), max_size_bytes=FILE_LIMIT, audio_only=audio_only, quality=quality)
+            await gateway.call(job['chat_id'], job['message'].delete)
+        except:
+            pass
+async def notify_waiters(job):
+    for waiter in job['waiters']:
+        chat_id = waiter['chat_id']
+        try:
+            if await send_cached(chat_id, job['cache_key']):
+                await finish_job(waiter)
+                continue
+            if waiter.get('batch'):
+                continue
+            key, details, kwargs = job.get('error') or ("download_failed", None, {})
+            await show_error(waiter['processing_msg'], waiter['user_id'], key, details, **kwargs)
+        except Exception as e:
+            logging.error(f"Error notifying waiter in {chat_id}: {e}")
+def album_item(media, kind: str, caption: str = ""):
+    if kind == 'video':
+        return InputMediaVideo(media, caption=caption, supports_streaming=True)
+    return InputMediaPhoto(media, caption=caption)
+async def send_album_item(chat_id, item, **kwargs):
+    if isinstance(item, InputMediaVideo):
+        return await gateway.call(chat_id, app.send_video, chat_id=chat_id, video=item.media, caption=item.caption, supports_streaming=True, **kwargs)
+    return await gateway.call(chat_id, app.send_photo, chat_id=chat_id, photo=item.media, caption=item.caption, **kwargs)
+async def send_album(job, video_info):
+    message = job['message']
+    files = video_info.get('files', [])
+    title = video_info.get('title', 'Slideshow')
+    author = video_info.get('author', 'Unknown')
+    if not files:
+        await report_error(job, "download_failed")
+        return
+    caption = f"{title}\n\n👤 Author: {author}"
+    file_ids = []
+    kinds = ['video' if f.endswith('.mp4') else 'photo' for f in files]
+    chunks = [files[i:i + 10] for i in range(0, len(files), 10)]
+    for i, chunk in enumerate(chunks):
+        media_group = []
+        for j, file_path in enumerate(chunk):
+            cap = caption if (i == 0 and j == 0) else ""
+            media_group.append(album_item(file_path, kinds[i * 10 + j], cap))
+        if len(media_group) == 1:
+            # Media groups need at least two items, e.g. the 11th slide goes out on its own
+            sent = [await send_album_item(job['chat_id'], media_group[0], reply_to_message_id=message.id if message else None)]
+        else:
+            sent = await gateway.call(
+                job['chat_id'], app.send_media_group,
+                chat_id=job['chat_id'],
+                media=media_group,
+                reply_to_message_id=message.id if message else None,
+                cost=len(media_group), # An album counts as one message per item against chat limits
+                idempotent=False # Pyrogram draws new random_ids per attempt, a retry after a lost reply would post the album twice
+            )
+        file_ids.extend((m.video or m.photo).file_id for m in sent if m.video or m.photo)
+    audio_file_id = None
+    audio_path = video_info.get('audio')
+    if audio_path and os.path.exists(audio_path):
+        try:
+            sent_audio = await gateway.call(
+                job['chat_id'], app.send_audio,
+                chat_id=job['chat_id'],
+                audio=audio_path,
+                title=title,
+                performer=author
+            )
+            audio_file_id = sent_audio.audio.file_id if sent_audio and sent_audio.audio else None
+        except Exception as e:
+            logging.error(f"Error sending slideshow audio: {e}")
+        os.remove(audio_path)
+    if len(file_ids) == len(files):
+        file_cache.put(job['cache_key'], file_ids, 'album', caption=caption, audio=audio_file_id, kinds=kinds)
+    for f in files:
+        if os.path.exists(f):
+            os.remove(f)
+    if job['processing_msg'] and not job.get('batch'):
+        progress_dispatcher.forget(job['processing_msg'])
+        await gateway.call(job['chat_id'], job['processing_msg'].delete)
+async def send_file(job, video_info):
+    message = job['message']
+    processing_msg = job['processing_msg']
+    user_id = job['user_id']
+    file_path = video_info['path']
+    title = video_info.get('title', 'Video')
+    author = video_info.get('author', 'Unknown')
+    resolution = video_info.get('resolution', '?')
+    thumbnail_path = video_info.get('thumbnail')
+    caption = f"{title}\n\n👤 Author: {author}\n📺 Quality: {resolution}"
+    if not os.path.exists(file_path):
+        await report_error(job, "file_not_found")
+        return
+    start_time = {'last_update': 0, 'start': time.time()}
+    progress_args = (app, processing_msg, user_id, start_time)
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext in ['.jpg', '.jpeg', '.png', '.webp']:
+        kind = 'photo'
+    elif job['audio_only'] or ext in ['.mp3', '.m4a', '.opus', '.flac']:
+        kind = 'audio'
+    else:
+        kind = 'video'
+    # Upload once, then only SendMedia is retried; the job's random_id makes a resend after a lost reply a no-op
+    if os.path.getsize(file_path) >= PARALLEL_UPLOAD_THRESHOLD and kind != 'photo':
+        input_file = await upload_big_file(
+            app, file_path,
+            parallel_parts=UPLOAD_PARALLEL_PARTS,
+            connections=UPLOAD_CONNECTIONS,
+            progress=upload_progress,
+            progress_args=progress_args
+        )
+    else:
+        input_file = await gateway.call(None, app.save_file, file_path, progress=upload_progress, progress_args=progress_args)
+    thumb = None
+    if kind == 'video' and thumbnail_path and os.path.exists(thumbnail_path):
+        thumb = await gateway.call(None, app.save_file, thumbnail_path)
+    sent = await gateway.call(
+        job['chat_id'], send_uploaded_media,
+        app, job['chat_id'], input_file, kind,
+        caption=caption,
+        file_name=os.path.basename(file_path),
+        duration=video_info.get('duration'),
+        width=video_info.get('width'),
+        height=video_info.get('height'),
+        title=title,
+        performer=author,
+        thumb=thumb,
+        random_id=job.setdefault('random_id', app.rnd_id())
+    )
+    remember_upload(job['cache_key'], sent, caption)
+    if os.path.exists(file_path):
+        os.remove(file_path)
+    if thumbnail_path and os.path.exists(thumbnail_path):
+        os.remove(thumbnail_path)
+    await finish_job(job)
+async def stream_job(job, plan):
+    message = job['message']
+    processing_msg = job['processing_msg']
+    user_id = job['user_id']
+    audio_only = job['audio_only']
+    title = plan['title']
+    author = plan['author']
+    caption = f"{title}\n\n👤 Author: {author}\n📺 Quality: {plan['resolution']}"
+    safe_title = re.sub(r'[\\/:*?"<>|]', '_', title)[:100] or "video"
+    transfer = {}
+    source = http_source(plan, buffer_chunks=STREAM_BUFFER_CHUNKS, transfer=transfer)
+    if audio_only:
+        source = opus_transcode(source, plan.get('acodec'))
+        file_name = f"{safe_title}.opus"
+    else:
+        file_name = f"{safe_title}.{plan['ext']}"
+    parts = rechunk(source)
+    start_time = {'last_update': 0, 'start': time.time()}
+    progress_args = (app, processing_msg, user_id, start_time)
+    upload_size = 0
+    with identity_pool.hold(plan['identity'], plan['platform']) as lease: # Held for the transfer, the signed URL only works for this identity
+        try:
+            head = []
+            head_size = 0
+            async for part in parts:
+                head.append(part)
+                head_size += len(part)
+                if head_size > BIG_FILE_THRESHOLD:
+                    break
+            if head_size == 0:
+                return False
+            if head_size <= BIG_FILE_THRESHOLD:
+                # Whole file fit in the lookahead, a normal small upload is cheaper than a big-file session
+                data = io.BytesIO(b"".join(head))
+                data.name = file_name
+                input_file = await gateway.call(None, app.save_file, data, progress=upload_progress, progress_args=progress_args)
+                upload_size = head_size
+            else:
+                async def all_parts():
+                    nonlocal upload_size
+                    for part in head:
+                        upload_size += len(part)
+                        yield part
+                    head.clear()
+                    async for part in parts:
+                        upload_size += len(part)
+                        yield part
+                input_file = await upload_big_stream(
+                    app, all_parts(), file_name,
+                    expected_size=plan.get('filesize'),
+                    progress=upload_progress,
+                    progress_args=progress_args
                 )
-                if video_info:
-                    if 'error' in video_info:
-                        error = video_info['error']
-                        if error == 'file_too_large':
-                             size = video_info['size']
-                             await processing_msg.edit_text(get_text(user_id, "video_too_large", size=size / BYTES_IN_MB))
-                        elif error == 'is_live':
-                             await processing_msg.edit_text(get_text(user_id, "error_live"))
-                        elif error == 'exception':
-                             details = video_info.get('details', '')
-                             if 'sign in to confirm your age' in details.lower() or 'age restricted' in details.lower():
-                                 await processing_msg.edit_text(get_text(user_id, "error_age"))
-                             else:
-                                 error_text = f"{get_text(user_id, 'error')}\n\nTechnical Details: {details}"
-                                 await processing_msg.edit_text(error_text)
-                        else:
-                             await processing_msg.edit_text(get_text(user_id, "download_failed"))
-                    else:
-                        if video_info.get('type') == 'album':
-                            files = video_info.get('files', [])
-                            title = video_info.get('title', 'Slideshow')
-                            author = video_info.get('author', 'Unknown')
-                            if files:
-                                caption = f"{title}\n\n👤 Author: {author}"
-                                from pyrogram.types import InputMediaPhoto
-                                chunks = [files[i:i + 10] for i in range(0, len(files), 10)]
-                                for i, chunk in enumerate(chunks):
-                                    media_group = []
-                                    for j, file_path in enumerate(chunk):
-                                        cap = caption if (i == 0 and j == 0) else ""
-                                        media_group.append(InputMediaPhoto(file_path, caption=cap))
-                                    await app.send_media_group(
-                                        chat_id=message.chat.id,
-                                        media=media_group,
-                                        reply_to_message_id=message.id
-                                    )
-                                    if len(chunks) > 1:
-                                        await asyncio.sleep(1)
-                                for f in files:
-                                    if os.path.exists(f):
-                                        os.remove(f)
-                                await processing_msg.delete()
-                        elif video_info.get('path'):
-                            file_path = video_info['path']
-                            title = video_info.get('title', 'Video')
-                            author = video_info.get('author', 'Unknown')
-                            resolution = video_info.get('resolution', '?')
-                            thumbnail_path = video_info.get('thumbnail')
-                            caption = f"{title}\n\n👤 Author: {author}\n📺 Quality: {resolution}"
-                            if os.path.exists(file_path):
-                                start_time = {'last_update': 0, 'start': time.time()}
-                                ext = os.path.splitext(file_path)[1].lower()
-                                if ext in ['.jpg', '.jpeg', '.png', '.webp']:
-                                    await app.send_photo(
-                                        chat_id=message.chat.id,
-                                        photo=file_path,
-                                        caption=caption,
-                                        reply_to_message_id=None,
-                                        progress=upload_progress,
-                                        progress_args=(app, processing_msg, user_id, start_time)
-                                    )
-                                elif audio_only or ext in ['.mp3', '.m4a', '.opus', '.flac']:
-                                    await app.send_audio(
-                                        chat_id=message.chat.id,
-                                        audio=file_path,
-                                        caption=caption,
-                                        title=title,
-                                        performer=author,
-                                        reply_to_message_id=None,
-                                        progress=upload_progress,
-                                        progress_args=(app, processing_msg, user_id, start_time)
-                                    )
-                                else:
-                                    await app.send_video(
-                                        chat_id=message.chat.id,
-                                        video=file_path,
-                                        caption=caption,
-                                        reply_to_message_id=None, # Don't reply, so we can delete the original safely without orphans? Or just reply.
-                                        thumb=thumbnail_path if thumbnail_path and os.path.exists(thumbnail_path) else None,
-                                        supports_streaming=True,
-                                        progress=upload_progress,
-                                        progress_args=(app, processing_msg, user_id, start_time)
-                                    )
-                                if os.path.exists(file_path):
-                                    os.remove(file_path)
-                                if thumbnail_path and os.path.exists(thumbnail_path):
-                                    os.remove(thumbnail_path)
-                                await processing_msg.delete()
-                                try:
-                                    await message.delete()
-                                except:
-                                    pass
-                        else:
-                            await processing_msg.edit_text(get_text(user_id, "download_failed"))
-            except Exception as e:
-                 logging.error(f"Worker logic failed: {e}")
-            finally:
-                if url in processing_urls:
-                    processing_urls.remove(url)
-                download_queue.task_done()
+            sent = await gateway.call(
+                job['chat_id'], send_uploaded_media,
+                app, job['chat_id'], input_file,
+                'audio' if audio_only else 'video',
+                caption=caption,
+                file_name=file_name,
+                duration=plan['duration'],
+                width=plan['width'],
+                height=plan['height'],
+                title=title,
+                performer=author,
+                random_id=job.setdefault('random_id', app.rnd_id())
+            )
+        except Exception as e:
+            logging.warning(f"Streaming failed for {job['url']}, falling back to download: {e}")
+            return False
+        finally:
+            await parts.aclose()
+            lease.transferred(transfer.get('bytes', 0), transfer.get('seconds', 0.0))
+            if transfer.get('error'):
+                lease.fail(transfer['error'])
+    if not sent:
+        return False
+    record_stream(plan, transfer['bytes'], transfer['seconds'])
+    UPLOAD_BYTES.inc(upload_size)
+    logging.info(f"Streamed {transfer['bytes'] / BYTES_IN_MB:.1f} MB in {transfer['seconds']:.1f}s for {job['url']}")
+    remember_upload(job['cache_key'], sent, caption)
+    await finish_job(job)
+    return True
+async def process_job(job):
+    url = job['url']
+    message = job['message']
+    user_id = job['user_id']
+    processing_msg = job['processing_msg']
+    if await send_cached(job['chat_id'], job['cache_key']):
+        await finish_job(job)
+        return
+    slideshow = not job['audio_only'] and await metadata_pool.run(slideshow_kind, url)
+    if STREAM_UPLOADS and not slideshow and (job['audio_only'] or job['video_key'].startswith('tiktok:')):
+        job_journal.update(job, DOWNLOADING)
+        plan = await metadata_pool.run(plan_stream, url, job['audio_only'], FILE_LIMIT)
+        if plan:
+            with STAGE_SECONDS.time(stage="stream"):
+                if await stream_job(job, plan):
+                    return
+    estimated = None if slideshow else await metadata_pool.run(estimate_download, url, job['audio_only'], job['quality'], FILE_LIMIT)
+    await spool.reserve(job['job_id'], int(estimated * SPOOL_OVERHEAD) if estimated else SPOOL_DEFAULT_RESERVE)
+    start_time = {'start': time.time(), 'last_update': 0}
+    loop = asyncio.get_running_loop()
+    job_journal.update(job, DOWNLOADING)
+    video_info = await download_pool.run(
+        download_video,
+        url,
+        output_path=spool.job_dir(job['job_id']),
+        progress_hook=lambda d: download_progress_hook(d, loop, processing_msg, user_id, start_time, job.get('batch')),
+        max_size_bytes=FILE_LIMIT,
+        audio_only=job['audio_only'],
+        quality=job['quality'],
+        convert_audio=False
+    )
+    if video_info and video_info.get('path') and job['audio_only']:
+        try:
+            with STAGE_SECONDS.time(stage="postprocess"):
+                video_info['path'] = await postprocess_pool.run(convert_to_opus, video_info['path'], video_info.get('acodec'))
+        except Exception as e:
+            video_info = {'error': 'exception', 'details': str(e)}
+    if not video_info:
+        await report_error(job, "download_failed")
+        return
+    if 'error' in video_info:
+        error = video_info['error']
+        if error == 'file_too_large':
+            await report_error(job, "video_too_large", size=video_info['size'] / BYTES_IN_MB)
+        elif error == 'is_live':
+            await report_error(job, "error_live")
+        elif error == 'is_playlist':
+            await report_error(job, "error_playlist")
+        elif error == 'exception':
+            details = video_info.get('details', '')
+            if 'sign in to confirm your age' in details.lower() or 'age restricted' in details.lower():
+                await report_error(job, "error_age")
+            else:
+                await report_error(job, "error", details=details)
+        else:
+            await report_error(job, "download_failed")
+        return
+    if video_info.get('download_profile'):
+        logging.info(f"Downloaded {video_info['downloaded_bytes'] / BYTES_IN_MB:.1f} MB in {video_info['download_seconds']:.1f}s ({video_info['throughput'] / BYTES_IN_MB:.2f} MB/s) with {video_info['download_profile']}")
+    job_journal.update(job, UPLOADING)
+    upload_paths = video_info.get('files', []) + [video_info.get('audio')] if video_info.get('type') == 'album' else [video_info.get('path')]
+    upload_size = sum(os.path.getsize(path) for path in upload_paths if path and os.path.exists(path))
+    if video_info.get('type') == 'album':
+        with STAGE_SECONDS.time(stage="upload"):
+            await send_album(job, video_info)
+    elif video_info.get('path'):
+        with STAGE_SECONDS.time(stage="upload"):
+            await send_file(job, video_info)
+    else:
+        await report_error(job, "download_failed")
+    if not job.get('error'):
+        UPLOAD_BYTES.inc(upload_size)
+def record_job_metrics(job):
+    JOBS.inc(outcome="failed" if job.get('error') else "done")
+    STAGE_SECONDS.observe(time.time() - job['queued_at'], stage="total")
+def register_gauges():
+    registry = metrics.REGISTRY
+    if BOT_ROLE == "all":
+        registry.gauge("bot_queue_depth", "Jobs waiting for a worker", download_queue.qsize)
+        registry.gauge("bot_inflight_jobs", "Jobs being processed", lambda: len(inflight_jobs))
+    else:
+        registry.gauge("bot_queue_depth", "Jobs waiting for a worker", lambda: job_journal.counts().get(QUEUED, 0))
+        registry.gauge("bot_inflight_jobs", "Jobs being processed", lambda: len(claimed_jobs) if BOT_ROLE == "worker" else sum(job_journal.workers().values()))
+    registry.gauge("bot_spool_reserved_bytes", "Disk reserved by running downloads", lambda: spool.stats()['reserved'])
+    registry.gauge("bot_spool_free_bytes", "Free disk under the downloads spool", lambda: spool.stats()['free'])
+    registry.gauge("bot_pool_active", "Busy threads per executor", lambda: {p.name: p.stats()['active'] for p in POOLS}, label="pool")
+    registry.gauge("bot_pool_queued", "Calls waiting per executor", lambda: {p.name: p.stats()['queued'] for p in POOLS}, label="pool")
+    registry.gauge("bot_telegram_flood_wait_seconds", "Seconds spent in FloodWait since start", lambda: gateway.stats()['flood_wait_seconds'])
+    registry.gauge("bot_file_cache_hit_ratio", "file_id cache hit ratio", lambda: file_cache.stats()['hit_rate'])
+    registry.gauge("bot_identity_success_ratio", "Successful leases per identity", lambda: {i['name']: i['success_rate'] for i in identity_pool.stats()}, label="identity")
+    registry.gauge("bot_identity_health", "Health score per identity", lambda: {i['name']: i['health'] for i in identity_pool.stats()}, label="identity")
+    registry.gauge("bot_identity_bytes_per_second", "Average download throughput per identity", lambda: {i['name']: i['bandwidth'] for i in identity_pool.stats()}, label="identity")
+    registry.gauge("bot_identity_inflight", "Leases held per identity", lambda: {i['name']: i['inflight'] for i in identity_pool.stats()}, label="identity")
+    if BOT_ROLE != "frontend":
+        registry.gauge("bot_worker_limit", "Jobs the adaptive controller currently allows at once", lambda: worker_limit.limit)
+        registry.gauge("bot_worker_busy", "Adaptive workers currently running a job", lambda: worker_limit.busy)
+        registry.gauge("bot_worker_limit_bounds", "Configured worker limit bounds", lambda: {'min': worker_limit.minimum, 'max': worker_limit.maximum}, label="bound")
+        registry.gauge("bot_worker_limit_decisions", "Controller decisions since start", lambda: concurrency.stats()['decisions'], label="decision")
+        registry.gauge("bot_worker_window_bytes_per_second", "Aggregate download + upload throughput of the last window", lambda: concurrency.stats()['throughput'])
+async def worker(lanes=(PRIORITY, NORMAL), limit=None):
+    logging.info(f"Worker started for lanes: {', '.join(lanes)}")
+    while True:
+        try:
+            async with limit.slot() if limit else contextlib.nullcontext():
+                job = await download_queue.get(lanes)
+                with limit.running() if limit else contextlib.nullcontext():
+                    STAGE_SECONDS.observe(time.time() - job['queued_at'], stage="queue_wait")
+                    try:
+                        await process_job(job)
+                    except Exception as e:
+                        logging.error(f"Worker logic failed: {e}")
+                        job.setdefault('error', ("error", str(e), {}))
+                        JOB_ERRORS.inc(type="exception")
+                    finally:
+                        record_job_metrics(job)
+                        inflight_jobs.pop(job['cache_key'], None)
+                        job_journal.complete(job['job_id'], FAILED if job.get('error') else DONE, file_cache.peek(job['cache_key']))
+                        await spool.release(job['job_id'])
+                        await notify_waiters(job)
+                        await settle_batches(job)
+                        await download_queue.done(job)
         except Exception as e:
              logging.error(f"Worker loop failed: {e}")
              await asyncio.sleep(1)
-if __name__ == "__main__":
-    logging.basicConfig(level=logging.INFO, stream=sys.stdout)
-    if os.path.exists(DOWNLOADS_DIR):
+async def fetch_message(chat_id, message_id):
+    if not message_id:
+        return None
+    try:
+        message = await gateway.call(chat_id, app.get_messages, chat_id, message_id)
+        return None if not message or message.empty else message
+    except Exception as e:
+        logging.error(f"Could not fetch message {message_id} in {chat_id}: {e}")
+        return None
+async def restore_waiter(ref):
+    return {
+        'user_id': ref['user_id'],
+        'chat_id': ref['chat_id'],
+        'message': await fetch_message(ref['chat_id'], ref['message_id']),
+        'processing_msg': await fetch_message(ref['chat_id'], ref['processing_msg_id'])
+    }
+async def resume_jobs():
+    # Re-queue whatever was queued or running when the process died, oldest first
+    pending = job_journal.unfinished()
+    if pending:
+        logging.info(f"Resuming {len(pending)} unfinished jobs")
+    for record in pending:
+        restored = [await restore_waiter(ref) for ref in [record] + record['waiters']]
+        owner = restored[0]
+        job = await enqueue_job(
+            record['url'], record['video_key'], owner['message'], owner['user_id'], owner['processing_msg'],
+            audio_only=record['audio_only'], quality=record['quality'], chat_id=owner['chat_id'], job_id=record['job_id']
+        )
+        job['waiters'].extend(restored[1:])
+        logging.info(f"Resumed job {record['job_id']} ({record['state']}) for {record['url']}")
+async def broker_worker(lanes=(PRIORITY, NORMAL), limit=None):
+    # Worker-process counterpart of worker(): claims from jobs.db instead of the in-process scheduler
+    logging.info(f"Broker worker {WORKER_NAME} started for lanes: {', '.join(lanes)}")
+    while True:
+        try:
+            async with limit.slot() if limit else contextlib.nullcontext():
+                # claim() takes the write lock (up to the 30s busy timeout), so it runs off the loop and only when a cheap read sees work
+                record = await journal_pool.run(claim_journal.claim, WORKER_NAME, lanes, USER_MAX_INFLIGHT) if job_journal.has_queued(lanes) else None
+                if not record:
+                    await asyncio.sleep(BROKER_POLL_INTERVAL)
+                    continue
+                with limit.running() if limit else contextlib.nullcontext():
+                    owner = await restore_waiter(record)
+                    job = {
+                        'url': record['url'],
+                        'video_key': record['video_key'],
+                        'cache_key': FileIdCache.make_key(record['video_key'], record['audio_only'], record['quality']),
+                        'audio_only': record['audio_only'],
+                        'quality': record['quality'],
+                        'lane': PRIORITY if record['audio_only'] else NORMAL,
+                        'waiters': [],
+                        'queued_at': record['created_at'],
+                        'job_id': record['job_id'],
+                        **owner
+                    }
+                    claimed_jobs.add(job['job_id'])
+                    logging.info(f"Claimed job {job['job_id']} for {job['url']}")
+                    STAGE_SECONDS.observe(time.time() - record['created_at'], stage="queue_wait")
+                    try:
+                        await process_job(job)
+                    except Exception as e:
+                        logging.error(f"Worker logic failed: {e}")
+                        job.setdefault('error', ("error", str(e), {}))
+                        JOB_ERRORS.inc(type="exception")
+                    finally:
+                        record_job_metrics(job)
+                        claimed_jobs.discard(job['job_id'])
+                        final = job_journal.complete(job['job_id'], FAILED if job.get('error') else DONE, file_cache.peek(job['cache_key']))
+                        await spool.release(job['job_id'])
+                        if final:
+                            job['waiters'] = [await restore_waiter(ref) for ref in final['waiters']]
+                        await notify_waiters(job)
+        except Exception as e:
+            logging.error(f"Broker worker loop failed: {e}")
+            await asyncio.sleep(1)
+async def broker_heartbeat():
+    while True:
+        try:
+            job_journal.heartbeat(claimed_jobs)
+            requeued = job_journal.requeue_stale(BROKER_STALE_AFTER)
+            if requeued:
+                logging.warning(f"Re-queued {requeued} jobs from unresponsive workers")
+        except Exception as e:
+            logging.error(f"Broker heartbeat failed: {e}")
+        await asyncio.sleep(min(30, BROKER_STALE_AFTER / 3))
+async def sync_results():
+    # Uploads finished by other processes become cache hits here, so repeats never reach a worker
+    since = time.time() - FILE_CACHE_TTL
+    while True:
         try:
-            for f in os.listdir(DOWNLOADS_DIR):
-                path = os.path.join(DOWNLOADS_DIR, f)
-                try:
-                    if os.path.isfile(path):
-                        os.remove(path)
-                except Exception as e:
-                    logging.error(f"Error deleting old file {path}: {e}")
+            rows = job_journal.results_since(since)
+            for updated_at, cache_key, result in rows:
+                entry = json.loads(result)
+                entry.pop('ts', None)
+                file_cache.put(cache_key, entry.pop('file_id'), entry.pop('kind'), **entry)
+                since = updated_at
         except Exception as e:
-            logging.error(f"Error cleaning downloads dir: {e}")
+            logging.error(f"Result sync failed: {e}")
+        await asyncio.sleep(BROKER_POLL_INTERVAL)
+def concurrency_sample() -> dict:
+    # Cumulative totals the controller diffs per window; streamed jobs count through record_stream like downloads
+    downloads = list(profile_stats.values())
+    return {
+        'bytes': DOWNLOAD_BYTES.total() + UPLOAD_BYTES.total(),
+        'download_bytes': sum(p['bytes'] for p in downloads),
+        'download_seconds': sum(p['seconds'] for p in downloads),
+        'jobs': JOBS.total(),
+        'errors': sum(JOB_ERRORS.total(type=kind) for kind in ("error", "download_failed", "exception")),
+        'flood_waits': gateway.stats()['flood_waits']
+    }
+def concurrency_backlog() -> int:
+    return download_queue.qsize() if BOT_ROLE == "all" else job_journal.counts().get(QUEUED, 0)
+claimed_jobs = set()
+worker_limit = AdaptiveLimit(WORKER_COUNT, WORKER_MIN, WORKER_MAX)
+concurrency = AIMDController(worker_limit, concurrency_sample, concurrency_backlog, interval=ADAPT_INTERVAL)
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout)
     loop = asyncio.get_event_loop()
-    for _ in range(WORKER_COUNT):
-        loop.create_task(worker())
+    if BOT_ROLE == "all":
+        spool.keep(record['job_id'] for record in job_journal.unfinished())
+    elif BOT_ROLE == "worker":
+        requeued = job_journal.requeue_worker(WORKER_NAME)
+        if requeued:
+            logging.info(f"Re-queued {requeued} jobs this worker held before restarting")
+    job_journal.prune()
+    if BOT_ROLE != "frontend":
+        loop.create_task(spool.janitor())
+    if METRICS_PORT:
+        register_gauges()
+        loop.create_task(metrics.serve(metrics.REGISTRY, METRICS_HOST, METRICS_PORT))
+    loop.create_task(progress_dispatcher.run())
+    if BOT_ROLE != "frontend" and ADAPTIVE_WORKERS:
+        loop.create_task(concurrency.run())
+    if BOT_ROLE == "all":
+        for _ in range(WORKER_MAX):
+            loop.create_task(worker(limit=worker_limit))
+        for _ in range(PRIORITY_WORKER_COUNT):
+            loop.create_task(worker(lanes=(PRIORITY,)))
+    else:
+        loop.create_task(sync_results())
+        loop.create_task(broker_heartbeat())
+    if BOT_ROLE == "worker":
+        for _ in range(WORKER_MAX):
+            loop.create_task(broker_worker(limit=worker_limit))
+        for _ in range(PRIORITY_WORKER_COUNT):
+            loop.create_task(broker_worker(lanes=(PRIORITY,)))
     app.start()
     try:
         from pyrogram.types import BotCommand
@@ -411,6 +1128,15 @@ if __name__ == "__main__":
         logging.info("Commands set successfully")
     except Exception as e:
         logging.error(f"Error setting commands: {e}")
-    logging.info("Bot started.")
+    if BOT_ROLE == "all":
+        try:
+            loop.run_until_complete(resume_jobs())
+        except Exception as e:
+            logging.error(f"Error resuming jobs: {e}")
+    logging.info(f"Bot started ({BOT_ROLE}).")
     pyrogram.idle()
-    app.stop()
\ No newline at end of file
+    app.stop()
+    file_cache.close()
+    user_store.close()
+    job_journal.close()
+    claim_journal.close()
\ No newline at end of file
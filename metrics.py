@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import threading
+import time
+from contextlib import contextmanager
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+def _format_labels(key: tuple) -> str:
+    if not key:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in key)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(key, escaped)) + "}"
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+class Counter:
+    kind = "counter"
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self.values = {}
+        self.lock = threading.Lock()
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+    def samples(self):
+        with self.lock:
+            return [(self.name, key, value) for key, value in self.values.items()]
+    def total(self, **labels) -> float:
+        # Sum over every series carrying these labels
+        wanted = set(labels.items())
+        with self.lock:
+            return sum(value for key, value in self.values.items() if wanted <= set(key))
+class Gauge(Counter):
+    kind = "gauge"
+    def __init__(self, name: str, help_text: str, collect=None, label: str = None):
+        super().__init__(name, help_text)
+        self.collect = collect # Called at scrape time, returns a number or {label value: number}
+        self.label = label
+    def set(self, value: float, **labels):
+        with self.lock:
+            self.values[_label_key(labels)] = value
+    def samples(self):
+        if self.collect:
+            try:
+                values = self.collect()
+            except Exception as e:
+                logging.error(f"Metric {self.name} failed to collect: {e}")
+                return []
+            if not isinstance(values, dict):
+                return [(self.name, (), values)] if values is not None else []
+            return [(self.name, ((self.label, key),), value) for key, value in values.items() if value is not None]
+        return super().samples()
+class Histogram:
+    kind = "histogram"
+    def __init__(self, name: str, help_text: str, buckets=STAGE_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self.values = {} # labels -> [bucket counts..., sum, count]
+        self.lock = threading.Lock()
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            series = self.values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+    @contextmanager
+    def time(self, **labels):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started, **labels)
+    def samples(self):
+        out = []
+        with self.lock:
+            for key, series in self.values.items():
+                for bound, count in zip(self.buckets, series):
+                    out.append((f"{self.name}_bucket", key + (('le', _format_value(bound)),), count))
+                out.append((f"{self.name}_bucket", key + (('le', "+Inf"),), series[-1]))
+                out.append((f"{self.name}_sum", key, series[-2]))
+                out.append((f"{self.name}_count", key, series[-1]))
+        return out
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+    def _add(self, metric):
+        if metric.name in self.metrics:
+            return self.metrics[metric.name]
+        self.metrics[metric.name] = metric
+        return metric
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._add(Counter(name, help_text))
+    def gauge(self, name: str, help_text: str, collect=None, label: str = None) -> Gauge:
+        return self._add(Gauge(name, help_text, collect, label))
+    def histogram(self, name: str, help_text: str, buckets=STAGE_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help_text, buckets))
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, value in metric.samples():
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+async def serve(registry: Registry, host: str = "127.0.0.1", port: int = 9108):
+    # Just enough HTTP for a Prometheus scrape: any GET gets the text exposition format
+    async def handle(reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readline(), timeout=5)
+            while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+                pass
+            if request.split(b" ")[1:2] in ([b"/metrics"], [b"/"]):
+                body = registry.render().encode()
+                status = "200 OK"
+            else:
+                body = b"not found\n"
+                status = "404 Not Found"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except Exception as e:
+            logging.error(f"Metrics request failed: {e}")
+        finally:
+            writer.close()
+    server = await asyncio.start_server(handle, host, port)
+    logging.info(f"Metrics on http://{host}:{port}/metrics")
+    async with server:
+        await server.serve_forever()
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.histogram("bot_stage_seconds", "Time spent per job stage")
+JOBS = REGISTRY.counter("bot_jobs_total", "Finished jobs by outcome")
+JOB_ERRORS = REGISTRY.counter("bot_job_errors_total", "Job errors by type")
+DOWNLOAD_BYTES = REGISTRY.counter("bot_download_bytes_total", "Bytes downloaded per platform")
+DOWNLOAD_SPEED = REGISTRY.gauge("bot_download_bytes_per_second", "Throughput of the last download per platform")
+UPLOAD_BYTES = REGISTRY.counter("bot_upload_bytes_total", "Bytes of downloaded files sent to Telegram")
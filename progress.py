@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import time
+from pyrogram.errors import FloodWait, MessageNotModified
+class ProgressDispatcher:
+    # Keeps only the newest progress text per message and edits at a pace Telegram tolerates:
+    # per-message interval, per-chat interval and a global edits/sec bucket, pausing on FloodWait
+    def __init__(self, message_interval: float = 3.0, chat_interval: float = 1.0, global_rate: float = 20.0, edit=None, ready=None):
+        self.edit = edit or (lambda message, text: message.edit_text(text))
+        self.chat_ready = ready or (lambda chat_id: True) # Lets a rate-limited chat be skipped instead of stalling every other chat's edits
+        self.message_interval = message_interval
+        self.chat_interval = chat_interval
+        self.global_rate = global_rate
+        self.tokens = global_rate
+        self.tokens_updated = time.monotonic()
+        self.pending = {} # (chat_id, message_id) -> (message, text)
+        self.last_text = {}
+        self.last_edit = {}
+        self.chat_last_edit = {}
+        self.paused_until = 0.0
+        self.wakeup = asyncio.Event()
+        self.edits = 0
+        self.skipped = 0
+        self.coalesced = 0
+        self.flood_waits = 0
+        self.flood_wait_seconds = 0.0
+    @staticmethod
+    def _key(message):
+        return (message.chat.id, message.id)
+    def update(self, message, text: str):
+        if not message:
+            return
+        key = self._key(message)
+        if self.last_text.get(key) == text:
+            self.skipped += 1
+            return
+        if key in self.pending:
+            self.coalesced += 1
+        self.pending[key] = (message, text)
+        self.wakeup.set()
+    def update_threadsafe(self, loop, message, text: str):
+        loop.call_soon_threadsafe(self.update, message, text)
+    def forget(self, message):
+        if not message:
+            return
+        key = self._key(message)
+        self.pending.pop(key, None)
+        self.last_text.pop(key, None)
+        self.last_edit.pop(key, None)
+    def _take_token(self, now) -> bool:
+        self.tokens = min(self.global_rate, self.tokens + (now - self.tokens_updated) * self.global_rate)
+        self.tokens_updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+    def _ready(self, now):
+        for key in list(self.pending):
+            if now - self.last_edit.get(key, 0) < self.message_interval:
+                continue
+            if now - self.chat_last_edit.get(key[0], 0) < self.chat_interval:
+                continue
+            if not self.chat_ready(key[0]):
+                continue
+            return key
+        return None
+    async def run(self):
+        while True:
+            try:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                key = self._ready(now) if self.pending else None
+                if key is None or not self._take_token(now):
+                    self.wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self.wakeup.wait(), timeout=0.5)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                message, text = self.pending.pop(key)
+                self.last_edit[key] = now
+                self.chat_last_edit[key[0]] = now
+                try:
+                    await self.edit(message, text)
+                    self.last_text[key] = text
+                    self.edits += 1
+                except MessageNotModified:
+                    self.last_text[key] = text
+                except FloodWait as e:
+                    self.flood_waits += 1
+                    self.flood_wait_seconds += e.value
+                    self.paused_until = time.monotonic() + e.value
+                    self.pending.setdefault(key, (message, text))
+                    logging.warning(f"Progress edits paused for {e.value}s (FloodWait)")
+                except Exception as e:
+                    logging.error(f"Error updating progress: {e}")
+            except Exception as e:
+                logging.error(f"Progress dispatcher failed: {e}")
+                await asyncio.sleep(1)
+    def stats(self) -> dict:
+        return {
+            'pending': len(self.pending),
+            'edits': self.edits,
+            'skipped': self.skipped,
+            'coalesced': self.coalesced,
+            'flood_waits': self.flood_waits,
+            'flood_wait_seconds': self.flood_wait_seconds
+        }
@@ -0,0 +1,70 @@
+import asyncio
+from collections import deque, OrderedDict
+PRIORITY = "priority"
+NORMAL = "normal"
+LANES = (PRIORITY, NORMAL)
+class FairScheduler:
+    def __init__(self, per_user_limit: int = 1):
+        self.per_user_limit = per_user_limit
+        self.lanes = {lane: OrderedDict() for lane in LANES} # user_id -> deque of jobs, order is the round-robin turn
+        self.inflight = {}
+        self.waiting_workers = 0
+        self.cond = asyncio.Condition()
+    async def put(self, job: dict):
+        lane = job.setdefault('lane', NORMAL)
+        self.lanes[lane].setdefault(job['user_id'], deque()).append(job)
+        async with self.cond:
+            self.cond.notify_all()
+    def _pick(self, lanes):
+        for lane in lanes:
+            users = self.lanes[lane]
+            for user_id in list(users):
+                if self.inflight.get(user_id, 0) >= self.per_user_limit:
+                    continue
+                queue = users.pop(user_id)
+                job = queue.popleft()
+                if queue:
+                    users[user_id] = queue # Re-insert at the end: next user gets the next turn
+                self.inflight[user_id] = self.inflight.get(user_id, 0) + 1
+                return job
+        return None
+    async def get(self, lanes=LANES) -> dict:
+        async with self.cond:
+            self.waiting_workers += 1
+            try:
+                while True:
+                    job = self._pick(lanes)
+                    if job:
+                        return job
+                    await self.cond.wait()
+            finally:
+                self.waiting_workers -= 1
+    async def done(self, job: dict):
+        user_id = job['user_id']
+        count = self.inflight.get(user_id, 0) - 1
+        if count > 0:
+            self.inflight[user_id] = count
+        else:
+            self.inflight.pop(user_id, None)
+        async with self.cond:
+            self.cond.notify_all()
+    def position(self, job: dict) -> int:
+        lane = job.get('lane', NORMAL)
+        queue = self.lanes[lane].get(job['user_id'])
+        if not queue or job not in queue:
+            return 0
+        index = queue.index(job)
+        ahead = 0
+        if lane == NORMAL:
+            ahead += sum(len(q) for q in self.lanes[PRIORITY].values())
+        before = True
+        for user_id, other in self.lanes[lane].items():
+            if user_id == job['user_id']:
+                before = False
+                continue
+            ahead += min(len(other), index + 1 if before else index)
+        return ahead + index + 1
+    def qsize(self) -> int:
+        return sum(len(q) for users in self.lanes.values() for q in users.values())
+    def inflight_count(self) -> int:
+        return sum(self.inflight.values())
@@ -0,0 +1,156 @@
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import MozillaCookieJar
+import requests
+from requests.adapters import HTTPAdapter
+from urls import canonicalize, normalize_url, resolve_short_link
+SLIDESHOW_WORKERS = int(os.getenv("SLIDESHOW_WORKERS", 6)) # Images fetched at once per post
+SLIDESHOW_AUDIO = os.getenv("SLIDESHOW_AUDIO", "1") == "1" # Also fetch a TikTok slideshow's sound
+COOKIES_FILE = "cookies.txt"
+HEADERS = {
+    'User-Agent': "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36",
+    'Accept-Language': "en-US,en;q=0.9",
+}
+TIKTOK_STATE = re.compile(r'<script id="__UNIVERSAL_DATA_FOR_REHYDRATION__" type="application/json">(.*?)</script>', re.DOTALL)
+INSTAGRAM_APP_ID = "936619743392459" # Public web client id, required by the JSON endpoint
+_sessions = {} # identity name -> session, so each identity keeps its own proxy and cookie jar
+_session_lock = threading.Lock()
+_pool = ThreadPoolExecutor(max_workers=SLIDESHOW_WORKERS, thread_name_prefix="slideshow")
+def get_session(identity=None) -> requests.Session:
+    # One keep-alive session per identity for every post: image CDNs reuse connections across slides and jobs
+    name = identity.name if identity else None
+    with _session_lock:
+        if name not in _sessions:
+            session = requests.Session()
+            session.headers.update(HEADERS)
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=SLIDESHOW_WORKERS * 2)
+            session.mount("https://", adapter)
+            if identity and identity.proxy:
+                session.proxies.update({'http': identity.proxy, 'https': identity.proxy})
+            cookies_file = identity.cookiefile if identity else COOKIES_FILE
+            if cookies_file and os.path.exists(cookies_file):
+                jar = MozillaCookieJar(cookies_file)
+                try:
+                    jar.load(ignore_discard=True, ignore_expires=True)
+                    session.cookies.update(jar)
+                except Exception as e:
+                    print(f"Could not load {cookies_file}: {e}")
+            _sessions[name] = session
+        return _sessions[name]
+def slideshow_kind(url: str) -> str:
+    # Blocking for short links, like canonical_key
+    url = resolve_short_link(url)
+    normalized = normalize_url(url)
+    if normalized.startswith('tiktok.com/') and '/photo/' in normalized:
+        return 'tiktok'
+    ident = canonicalize(url)
+    if ident and ident[0] == 'instagram' and re.search(r'/p/', normalized):
+        return 'instagram' # Posts may be carousels; reels are always video
+    return None
+def _pick_jpeg(urls: list) -> str:
+    # Telegram rejects some webp/heic variants as photos
+    for candidate in urls:
+        if '.jpeg' in candidate or '.jpg' in candidate:
+            return candidate
+    return urls[0] if urls else None
+def tiktok_post(url: str, session: requests.Session) -> dict:
+    response = session.get(resolve_short_link(url), headers={'Referer': "https://www.tiktok.com/"}, timeout=20)
+    response.raise_for_status()
+    match = TIKTOK_STATE.search(response.text)
+    if not match:
+        return None
+    item = json.loads(match.group(1)).get('__DEFAULT_SCOPE__', {}).get('webapp.video-detail', {}).get('itemInfo', {}).get('itemStruct', {})
+    images = [_pick_jpeg(image.get('imageURL', {}).get('urlList', [])) for image in item.get('imagePost', {}).get('images', [])]
+    images = [image for image in images if image]
+    if not images:
+        return None
+    return {
+        'media': [('photo', image) for image in images],
+        'audio': (item.get('music') or {}).get('playUrl'),
+        'title': (item.get('desc') or "TikTok slideshow").strip(),
+        'author': (item.get('author') or {}).get('uniqueId') or "Unknown",
+        'referer': "https://www.tiktok.com/"
+    }
+def instagram_post(url: str, session: requests.Session) -> dict:
+    shortcode = canonicalize(url)[1]
+    response = session.get(
+        f"https://www.instagram.com/p/{shortcode}/?__a=1&__d=dis",
+        headers={'X-IG-App-ID': INSTAGRAM_APP_ID, 'Referer': "https://www.instagram.com/"},
+        timeout=20
+    )
+    response.raise_for_status()
+    items = response.json().get('items') or []
+    if not items:
+        return None
+    post = items[0]
+    media = []
+    for entry in post.get('carousel_media') or [post]:
+        # Mixed carousels keep their videos in place; the item order is the post's order
+        if entry.get('video_versions'):
+            media.append(('video', entry['video_versions'][0]['url']))
+            continue
+        candidates = (entry.get('image_versions2') or {}).get('candidates') or []
+        if candidates:
+            media.append(('photo', candidates[0]['url']))
+    if not any(kind == 'photo' for kind, _ in media):
+        return None # Reels and all-video posts are yt-dlp's job
+    return {
+        'media': media,
+        'audio': None,
+        'title': ((post.get('caption') or {}).get('text') or "Instagram post").strip(),
+        'author': (post.get('user') or {}).get('username') or "Unknown",
+        'referer': "https://www.instagram.com/"
+    }
+def _fetch(session: requests.Session, url: str, path: str, referer: str) -> int:
+    with session.get(url, headers={'Referer': referer}, stream=True, timeout=30) as response:
+        response.raise_for_status()
+        size = 0
+        with open(path, "wb") as f:
+            for chunk in response.iter_content(256 * 1024):
+                f.write(chunk)
+                size += len(chunk)
+    return size
+def fetch_slideshow(url: str, output_path: str = "downloads", max_size_bytes: int = None, identity=None) -> dict:
+    # Returns the album result download_video hands to the worker, or None to fall back to yt-dlp
+    kind = slideshow_kind(url)
+    if not kind:
+        return None
+    session = get_session(identity)
+    post = tiktok_post(url, session) if kind == 'tiktok' else instagram_post(url, session)
+    if not post:
+        return None
+    os.makedirs(output_path, exist_ok=True)
+    started = time.time()
+    paths = [os.path.join(output_path, f"slide_{i:02d}.{'mp4' if kind == 'video' else 'jpg'}") for i, (kind, _) in enumerate(post['media'])]
+    futures = [_pool.submit(_fetch, session, item, path, post['referer']) for (_, item), path in zip(post['media'], paths)]
+    audio_path = os.path.join(output_path, "slideshow_audio.mp3") if SLIDESHOW_AUDIO and post['audio'] else None
+    audio_future = _pool.submit(_fetch, session, post['audio'], audio_path, post['referer']) if audio_path else None
+    total = sum(future.result() for future in futures)
+    if audio_future:
+        try:
+            total += audio_future.result()
+        except Exception as e:
+            print(f"Slideshow audio failed: {e}")
+            audio_path = None
+    if max_size_bytes and total > max_size_bytes:
+        return {'error': 'file_too_large', 'size': total}
+    seconds = time.time() - started
+    result = {
+        'type': 'album',
+        'files': paths,
+        'audio': audio_path,
+        'title': post['title'][:200],
+        'author': post['author'],
+        'download_profile': f"{kind}:slideshow",
+        'downloaded_bytes': total,
+        'download_seconds': seconds,
+        'throughput': total / seconds if seconds > 0 else 0
+    }
+    if len(paths) == 1 and not audio_path:
+        # A media group needs two items; one image goes out as a plain photo
+        result.update(type='photo', path=paths[0], resolution="photo")
+    return result
@@ -0,0 +1,99 @@
+import asyncio
+import logging
+import os
+import shutil
+import time
+class Spool:
+    def __init__(self, root: str = "downloads", budget_bytes: int = 0, min_free_bytes: int = 0, orphan_age: float = 3600):
+        self.root = root
+        self.budget_bytes = budget_bytes # 0 = only limited by free disk
+        self.min_free_bytes = min_free_bytes
+        self.orphan_age = orphan_age
+        self.reservations = {} # job id -> reserved bytes
+        self.active = set() # job ids whose directories must survive cleanup
+        self.delayed = 0
+        self.delay_seconds = 0.0
+        self.cleaned = 0
+        self.cond = asyncio.Condition()
+        os.makedirs(root, exist_ok=True)
+    def job_dir(self, job_id) -> str:
+        path = os.path.join(self.root, f"job-{job_id}")
+        os.makedirs(path, exist_ok=True)
+        self.active.add(str(job_id))
+        return path
+    def keep(self, job_ids):
+        # Unfinished jobs from the journal keep their directories, and the .part files in them, across a restart
+        self.active.update(str(job_id) for job_id in job_ids)
+    @property
+    def reserved(self) -> int:
+        return sum(self.reservations.values())
+    def available(self) -> int:
+        # Reservations count in full, so a half-written download still holds back the rest of its estimate
+        free = shutil.disk_usage(self.root).free - self.min_free_bytes - self.reserved
+        if self.budget_bytes:
+            free = min(free, self.budget_bytes - self.reserved)
+        return free
+    def _fits(self, nbytes: int) -> bool:
+        if not self.reservations:
+            return True # Nothing else to wait for; an oversized job runs alone rather than never
+        return nbytes <= self.available()
+    async def reserve(self, job_id, nbytes: int):
+        job_id = str(job_id)
+        async with self.cond:
+            if not self._fits(nbytes):
+                self.delayed += 1
+                started = time.monotonic()
+                logging.info(f"Spool full, delaying job {job_id} ({nbytes / 1024 / 1024:.0f} MB needed, {max(self.available(), 0) / 1024 / 1024:.0f} MB available)")
+                while not self._fits(nbytes):
+                    try:
+                        await asyncio.wait_for(self.cond.wait(), timeout=30) # Disk can also free up outside the bot
+                    except asyncio.TimeoutError:
+                        pass
+                self.delay_seconds += time.monotonic() - started
+            self.reservations[job_id] = nbytes
+    async def release(self, job_id):
+        job_id = str(job_id)
+        self.reservations.pop(job_id, None)
+        self.active.discard(job_id)
+        shutil.rmtree(os.path.join(self.root, f"job-{job_id}"), ignore_errors=True)
+        async with self.cond:
+            self.cond.notify_all()
+    def clean(self) -> int:
+        removed = 0
+        now = time.time()
+        for name in os.listdir(self.root):
+            if name.startswith("job-") and name[4:] in self.active:
+                continue
+            path = os.path.join(self.root, name)
+            try:
+                if now - os.path.getmtime(path) < self.orphan_age:
+                    continue
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+                removed += 1
+            except Exception as e:
+                logging.error(f"Error removing spool orphan {path}: {e}")
+        self.cleaned += removed
+        return removed
+    async def janitor(self, interval: float = 600):
+        while True:
+            try:
+                removed = await asyncio.to_thread(self.clean)
+                if removed:
+                    logging.info(f"Spool cleanup removed {removed} orphaned entries")
+            except Exception as e:
+                logging.error(f"Spool cleanup failed: {e}")
+            await asyncio.sleep(interval)
+    def stats(self) -> dict:
+        usage = shutil.disk_usage(self.root)
+        return {
+            'reserved': self.reserved,
+            'jobs': len(self.reservations),
+            'free': usage.free,
+            'available': max(self.available(), 0),
+            'delayed': self.delayed,
+            'delay_seconds': self.delay_seconds,
+            'cleaned': self.cleaned
+        }
@@ -0,0 +1,128 @@
+import json
+import logging
+import os
+import queue
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+class UserStore:
+    def __init__(self, path: str = "user_data.db", flush_interval: float = 1.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.langs = {}
+        self.writes = queue.Queue()
+        self.flushes = 0
+        self.rows_written = 0
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS users (user_id TEXT PRIMARY KEY, lang TEXT NOT NULL, updated_at REAL NOT NULL)")
+            for user_id, lang in conn.execute("SELECT user_id, lang FROM users"):
+                self.langs[user_id] = lang
+        conn.close()
+        self.writer = threading.Thread(target=self._write_loop, name="user-store-writer", daemon=True)
+        self.writer.start()
+    def _connect(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL") # WAL + NORMAL: durable across app crashes, one fsync per checkpoint
+        return conn
+    def __contains__(self, user_id) -> bool:
+        return str(user_id) in self.langs
+    def get_lang(self, user_id, default: str = None) -> str:
+        return self.langs.get(str(user_id), default)
+    def set_lang(self, user_id, lang: str):
+        user_id = str(user_id)
+        if self.langs.get(user_id) == lang:
+            return
+        self.langs[user_id] = lang
+        self.writes.put((user_id, lang))
+    def _write_loop(self):
+        conn = self._connect()
+        running = True
+        while running:
+            item = self.writes.get()
+            batch = {}
+            while item is not None:
+                batch[item[0]] = item[1] # Later writes for the same user win
+                try:
+                    item = self.writes.get_nowait()
+                except queue.Empty:
+                    break
+            if item is None:
+                running = False
+            if batch:
+                now = time.time()
+                try:
+                    with conn:
+                        conn.executemany(
+                            "INSERT INTO users (user_id, lang, updated_at) VALUES (?, ?, ?) "
+                            "ON CONFLICT(user_id) DO UPDATE SET lang = excluded.lang, updated_at = excluded.updated_at",
+                            [(user_id, lang, now) for user_id, lang in batch.items()]
+                        )
+                    self.flushes += 1
+                    self.rows_written += len(batch)
+                except sqlite3.Error as e:
+                    logging.error(f"User store write failed: {e}")
+            if running:
+                time.sleep(self.flush_interval) # Let writes pile up so a burst of /start costs one commit
+        conn.close()
+    def migrate_json(self, json_path: str) -> int:
+        # One-shot import of the old user_data.json, the file is renamed so it never runs twice
+        if not os.path.exists(json_path):
+            return 0
+        try:
+            with open(json_path, "r") as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            logging.error(f"Could not read {json_path} for migration: {e}")
+            return 0
+        migrated = 0
+        for user_id, lang in data.items():
+            if user_id.endswith("_pending") or not isinstance(lang, str):
+                continue
+            if user_id not in self.langs:
+                self.set_lang(user_id, lang)
+                migrated += 1
+        os.replace(json_path, json_path + ".migrated")
+        logging.info(f"Migrated {migrated} users from {json_path}")
+        return migrated
+    def stats(self) -> dict:
+        return {'users': len(self.langs), 'pending_writes': self.writes.qsize(), 'flushes': self.flushes, 'rows_written': self.rows_written}
+    def close(self):
+        self.writes.put(None)
+        self.writer.join(timeout=10)
+class PendingSelections:
+    # Format menus waiting for a button press, one record per menu addressed by a short token in
+    # callback_data; memory only, they are worthless after a restart
+    def __init__(self, ttl: int = 3600, max_entries: int = 20000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+    def register(self, record: dict) -> str:
+        self.expire()
+        token = secrets.token_urlsafe(6)
+        while token in self.entries:
+            token = secrets.token_urlsafe(6)
+        self.entries[token] = (time.time(), record)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return token
+    def get(self, token: str) -> dict:
+        entry = self.entries.get(token)
+        if not entry or time.time() - entry[0] > self.ttl:
+            return None
+        return entry[1]
+    def pop(self, token: str) -> dict:
+        record = self.get(token)
+        self.entries.pop(token, None)
+        return record
+    def expire(self):
+        now = time.time()
+        while self.entries:
+            token, (ts, _) = next(iter(self.entries.items()))
+            if now - ts <= self.ttl:
+                break
+            del self.entries[token] # Insertion order is creation order, so the oldest are in front
+    def __len__(self) -> int:
+        return len(self.entries)
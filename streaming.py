@@ -0,0 +1,109 @@
+import asyncio
+import os
+import re
+import threading
+import time
+import requests
+from yt_dlp.cookies import LenientSimpleCookie, YoutubeDLCookieJar
+from executors import download_pool
+READ_CHUNK = 256 * 1024
+RANGE_SIZE = 10 * 1024 * 1024 # Same request size yt-dlp uses for YouTube, larger single requests get throttled
+def load_cookies(session: requests.Session, plan: dict):
+    # The identity's cookie file, then what yt-dlp scoped to the format URL (extractor-set ones like
+    # TikTok's tt_chain_token live only there: yt-dlp moves Cookie out of http_headers)
+    cookiefile = plan.get('cookiefile')
+    if cookiefile and os.path.exists(cookiefile):
+        jar = YoutubeDLCookieJar(cookiefile)
+        jar.load(ignore_discard=True, ignore_expires=True)
+        session.cookies.update(jar)
+    for name, morsel in LenientSimpleCookie(plan.get('cookies') or "").items():
+        session.cookies.set(name, morsel.value, domain=morsel['domain'], path=morsel['path'] or "/", secure=bool(morsel['secure']))
+async def http_source(plan: dict, buffer_chunks: int = 8, transfer: dict = None):
+    # Fetches the format URL on a download-pool thread; the bounded queue is the only buffer,
+    # a slow consumer blocks the fetch instead of growing memory. transfer gets the bytes and seconds fetched
+    transfer = transfer if transfer is not None else {}
+    transfer.update(bytes=0, seconds=0.0)
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(buffer_chunks)
+    stop = threading.Event()
+    def put(item):
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+    def fetch():
+        started = time.monotonic()
+        try:
+            with requests.Session() as session:
+                session.headers.update(plan.get('headers') or {})
+                if plan.get('proxy'):
+                    session.proxies.update({'http': plan['proxy'], 'https': plan['proxy']})
+                load_cookies(session, plan)
+                offset = 0
+                total = None
+                while not stop.is_set():
+                    headers = {'Range': f"bytes={offset}-{offset + RANGE_SIZE - 1}"}
+                    with session.get(plan['url'], headers=headers, stream=True, timeout=30) as response:
+                        response.raise_for_status()
+                        match = re.search(r'/(\d+)$', response.headers.get('Content-Range', ''))
+                        if match:
+                            total = int(match.group(1))
+                        received = 0
+                        for data in response.iter_content(READ_CHUNK):
+                            if stop.is_set():
+                                return
+                            put(data)
+                            received += len(data)
+                            transfer['bytes'] += len(data)
+                    offset += received
+                    if response.status_code != 206 or received == 0 or (total and offset >= total):
+                        break
+            put(None)
+        except Exception as e:
+            if not stop.is_set():
+                transfer['error'] = str(e) # Source failures count against the identity, upload failures don't
+                put(e)
+        finally:
+            transfer['seconds'] = time.monotonic() - started
+    fetcher = asyncio.ensure_future(download_pool.run(fetch))
+    try:
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        while not queue.empty():
+            queue.get_nowait()
+        await asyncio.gather(fetcher, return_exceptions=True)
+async def opus_transcode(source, acodec: str = None, bitrate: str = "192k"):
+    codec_args = ['-c:a', 'copy'] if acodec and acodec.startswith('opus') else ['-c:a', 'libopus', '-b:a', bitrate]
+    proc = await asyncio.create_subprocess_exec(
+        'ffmpeg', '-loglevel', 'error', '-i', 'pipe:0', '-vn', *codec_args, '-f', 'ogg', 'pipe:1',
+        stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    async def feed():
+        try:
+            async for data in source:
+                proc.stdin.write(data)
+                await proc.stdin.drain()
+        finally:
+            proc.stdin.close()
+            await source.aclose()
+    feeder = asyncio.create_task(feed())
+    try:
+        while True:
+            data = await proc.stdout.read(READ_CHUNK)
+            if not data:
+                break
+            yield data
+        await feeder
+        stderr = await proc.stderr.read()
+        if await proc.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed: {stderr.decode(errors='ignore').strip()[-300:]}")
+    finally:
+        if not feeder.done():
+            feeder.cancel()
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
@@ -0,0 +1,32 @@
+import json
+import threading
+from cache import FileIdCache
+def test_concurrent_saves_keep_file_valid(tmp_path):
+    path = tmp_path / "file_cache.json"
+    cache = FileIdCache(str(path), flush_interval=0)
+    errors = []
+    def upload(worker):
+        for i in range(50):
+            cache.put(f"key{worker}-{i}", f"file{worker}-{i}", "video")
+            try:
+                cache.save()
+            except Exception as e:
+                errors.append(e)
+    threads = [threading.Thread(target=upload, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert len(json.loads(path.read_text())) == 200
+    assert len(FileIdCache(str(path), flush_interval=0).entries) == 200
+def test_writer_flushes_dirty_cache(tmp_path):
+    path = tmp_path / "file_cache.json"
+    cache = FileIdCache(str(path), flush_interval=0.05)
+    cache.put("key", "file", "photo")
+    cache.writer.join(0.3)
+    assert json.loads(path.read_text())["key"]["file_id"] == "file"
+    saves = cache.saves
+    cache.writer.join(0.2)
+    assert cache.saves == saves # Nothing new, no rewrite
+    cache.close()
@@ -0,0 +1,57 @@
+import asyncio
+from concurrency import AdaptiveLimit, AIMDController
+MB = 1024 * 1024
+def totals(mb=0, download_mb=None, download_seconds=0, jobs=0, errors=0, flood_waits=0):
+    return {
+        'bytes': mb * MB, 'download_bytes': (mb if download_mb is None else download_mb) * MB,
+        'download_seconds': download_seconds, 'jobs': jobs, 'errors': errors, 'flood_waits': flood_waits
+    }
+def controller(limit=4, busy=None, backlog=5):
+    limiter = AdaptiveLimit(limit, 1, 8)
+    limiter.active = limit
+    limiter.busy = limit if busy is None else busy
+    return AIMDController(limiter, sample=None, backlog=lambda: backlog)
+def tick(aimd, window, seconds=10):
+    asyncio.run(aimd.tick(window, {}, seconds))
+    return aimd.decision, aimd.limiter.limit
+def test_increase_when_saturated():
+    aimd = controller()
+    assert tick(aimd, totals(mb=100, download_seconds=40, jobs=4)) == ("increase", 5)
+def test_hold_when_not_saturated():
+    assert tick(controller(busy=2), totals(mb=100, download_seconds=40, jobs=4)) == ("hold", 4)
+    assert tick(controller(backlog=0), totals(mb=100, download_seconds=40, jobs=4)) == ("hold", 4)
+def test_hold_when_idle():
+    aimd = controller(busy=0, backlog=0)
+    assert tick(aimd, totals()) == ("hold", 4)
+    assert aimd.reason == "idle"
+def test_decrease_on_flood_wait():
+    assert tick(controller(), totals(mb=100, download_seconds=40, jobs=4, flood_waits=1)) == ("decrease", 3)
+def test_decrease_on_errors():
+    assert tick(controller(), totals(mb=10, download_seconds=10, jobs=4, errors=2)) == ("decrease", 3)
+def test_decrease_when_per_job_speed_drops_without_gain():
+    aimd = controller()
+    tick(aimd, totals(mb=100, download_seconds=40, jobs=4))
+    assert aimd.limiter.limit == 5
+    aimd.limiter.busy = 5
+    # Same aggregate throughput spread over more jobs: each got slower, nothing gained
+    assert tick(aimd, totals(mb=100, download_seconds=80, jobs=4)) == ("decrease", 3)
+def test_decrease_stops_at_minimum():
+    aimd = controller(limit=1)
+    assert tick(aimd, totals(mb=10, download_seconds=10, jobs=2, flood_waits=3)) == ("hold", 1)
+    assert aimd.reason.endswith("already at minimum")
+def test_increase_stops_at_maximum():
+    aimd = controller(limit=8)
+    assert tick(aimd, totals(mb=100, download_seconds=40, jobs=4)) == ("hold", 8)
+    assert aimd.reason == "at maximum"
+def test_idle_slot_holders_are_not_saturation():
+    # Every slot is held by a worker waiting on the queue, but the backlog is blocked by the per-user cap
+    assert tick(controller(busy=1), totals(mb=100, download_seconds=40, jobs=4)) == ("hold", 4)
+def test_running_counts_busy_workers():
+    limiter = AdaptiveLimit(2, 1, 4)
+    async def run():
+        async with limiter.slot():
+            assert (limiter.active, limiter.busy) == (1, 0)
+            with limiter.running():
+                assert limiter.busy == 1
+        return limiter.active, limiter.busy
+    assert asyncio.run(run()) == (0, 0)
@@ -0,0 +1,62 @@
+import yt_dlp
+from yt_dlp.extractor.common import InfoExtractor
+import downloader
+from downloader import PROFILES, extract_cached, estimate_size, select_formats, info_cache
+FORMATS = [
+    {'format_id': '140', 'ext': 'm4a', 'acodec': 'mp4a.40.2', 'vcodec': 'none', 'abr': 128, 'filesize': 500_000, 'protocol': 'https', 'url': 'https://media.test/140'},
+    {'format_id': '134', 'ext': 'mp4', 'vcodec': 'avc1.4d401e', 'acodec': 'none', 'height': 360, 'width': 640, 'fps': 30, 'filesize': 2_000_000, 'protocol': 'https', 'url': 'https://media.test/134'},
+    {'format_id': '137', 'ext': 'mp4', 'vcodec': 'avc1.640028', 'acodec': 'none', 'height': 1080, 'width': 1920, 'fps': 30, 'filesize': 8_400_000, 'protocol': 'https', 'url': 'https://media.test/137'},
+]
+class FakeIE(InfoExtractor):
+    _VALID_URL = r'https?://video\.test/(?P<id>\w+)'
+    def _real_extract(self, url):
+        video_id = self._match_id(url)
+        return {'id': video_id, 'title': "Test video", 'duration': 60, 'formats': [dict(f) for f in FORMATS]}
+def extract_with_merge(url):
+    # What the menu's metadata pass does when ffmpeg is around: yt-dlp's default selection merges video + audio
+    ydl = yt_dlp.YoutubeDL({**PROFILES['metadata'], 'format': 'bestvideo+bestaudio'}, auto_init=False)
+    ydl.add_info_extractor(FakeIE())
+    return extract_cached(ydl, url)
+def test_cached_extraction_does_not_pin_merged_selection():
+    url = "https://video.test/merge1"
+    extract_with_merge(url)
+    info = info_cache.get(downloader.canonical_key(url))
+    audio = select_formats(info, audio_only=True)
+    assert not audio.get('requested_formats')
+    assert audio['format_id'] == '140'
+    assert estimate_size(audio) == 500_000
+    low = select_formats(info, 'low')
+    assert [f['format_id'] for f in low['requested_formats']] == ['134', '140']
+    assert estimate_size(low) == 2_500_000
+def test_cached_extraction_still_serves_metadata():
+    url = "https://video.test/merge2"
+    info = extract_with_merge(url)
+    assert info['title'] == "Test video"
+    assert not info.get('requested_formats')
+def test_extraction_profiles_skip_playlists():
+    for name, opts in PROFILES.items():
+        assert opts.get('noplaylist'), name
+def test_cache_hit_lease_is_not_charged(monkeypatch):
+    url = "https://video.test/charge1"
+    charges = []
+    monkeypatch.setattr(downloader.identity_pool, 'lease', lambda platform, prefer=None, charge=True: charges.append(charge))
+    downloader.lease_identity(url)
+    extract_with_merge(url)
+    downloader.lease_identity(url)
+    downloader.lease_identity(url, charge=True)
+    assert charges == [True, False, True]
+class FakePlaylistIE(InfoExtractor):
+    _VALID_URL = r'https?://video\.test/playlist/(?P<id>\w+)'
+    def _real_extract(self, url):
+        playlist_id = self._match_id(url)
+        entries = (self.url_result(f"https://video.test/v{i}", FakeIE) for i in range(3))
+        return self.playlist_result(entries, playlist_id, "Test playlist")
+def test_playlist_is_cached_as_marker_and_rejected():
+    url = "https://video.test/playlist/list1"
+    ydl = yt_dlp.YoutubeDL(dict(PROFILES['metadata']), auto_init=False)
+    ydl.add_info_extractor(FakePlaylistIE())
+    ydl.add_info_extractor(FakeIE())
+    info = extract_cached(ydl, url)
+    assert info == {'_type': 'playlist', 'id': "list1", 'title': "Test playlist"}
+    assert downloader.get_video_info(url) == {'title': "Test playlist", 'is_playlist': True}
+    assert downloader.estimate_download(url) is None
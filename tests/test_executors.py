@@ -0,0 +1,9 @@
+from executors import default_download_workers
+def test_download_pool_covers_worker_max(monkeypatch):
+    monkeypatch.delenv("ADAPTIVE_WORKERS", raising=False)
+    monkeypatch.setenv("WORKER_MAX", "8")
+    monkeypatch.setenv("PRIORITY_WORKER_COUNT", "1")
+    assert default_download_workers() == 9
+    monkeypatch.setenv("ADAPTIVE_WORKERS", "0")
+    monkeypatch.setenv("WORKER_COUNT", "2")
+    assert default_download_workers() == 4
@@ -0,0 +1,26 @@
+import asyncio
+import pytest
+from gateway import TelegramGateway
+def test_cost_above_capacity_goes_out_and_leaves_debt():
+    gateway = TelegramGateway(private_rate=1.0)
+    calls = []
+    async def send():
+        calls.append(1)
+        return "ok"
+    async def run():
+        assert await asyncio.wait_for(gateway.call(123, send, cost=10), 1) == "ok"
+    asyncio.run(run())
+    assert calls == [1]
+    bucket = gateway.chat_buckets[123]
+    assert bucket.tokens < 0
+    assert not gateway.ready(123)
+def test_non_idempotent_call_is_not_retried_on_transient_error():
+    gateway = TelegramGateway()
+    calls = []
+    async def flaky():
+        calls.append(1)
+        raise ConnectionError("reset")
+    with pytest.raises(ConnectionError):
+        asyncio.run(gateway.call(123, flaky, idempotent=False))
+    assert len(calls) == 1
+    assert gateway.failures == 1
@@ -0,0 +1,44 @@
+import time
+from identities import Identity, IdentityPool, classify_error
+def test_classify_error():
+    assert classify_error("ERROR: [youtube] abc: Sign in to confirm you're not a bot") == 'throttle'
+    assert classify_error("ERROR: [youtube] abc: Sign in to confirm your age") == 'content'
+    assert classify_error("This video is age-restricted") == 'content'
+    assert classify_error("HTTP Error 429: Too Many Requests") == 'throttle'
+    assert classify_error("Unable to download webpage: timed out") == 'network'
+    assert classify_error("Unable to extract page data") == 'other'
+def test_unbudgeted_identity_never_waits():
+    pool = IdentityPool([Identity("direct", budgeted=False)], budgets={'youtube': 1}, max_wait=5)
+    started = time.monotonic()
+    for _ in range(20):
+        pool.release(pool.acquire('youtube'), 'youtube')
+    assert time.monotonic() - started < 1
+    assert pool.overruns == 0
+def test_uncharged_lease_spends_no_budget():
+    pool = IdentityPool([Identity("res1")], budgets={'youtube': 2}, max_wait=0)
+    for _ in range(10):
+        with pool.lease('youtube', charge=False):
+            pass
+    assert pool.overruns == 0
+    with pool.lease('youtube'), pool.lease('youtube'):
+        pass
+    assert pool.overruns == 0
+    with pool.lease('youtube'):
+        pass
+    assert pool.overruns == 1
+def test_implicit_direct_identity_is_unbudgeted(tmp_path):
+    pool = IdentityPool.load(str(tmp_path / "identities.json"), str(tmp_path / "cookies.txt"))
+    assert [i.name for i in pool.identities] == ["direct"]
+    assert not pool.identities[0].budgeted
+def test_hold_pins_identity_and_reports_transfer():
+    pool = IdentityPool([Identity("res1"), Identity("res2")], budgets={'tiktok': 1}, max_wait=0)
+    with pool.lease('tiktok', prefer="res1"):
+        pass
+    with pool.hold("res1", 'tiktok') as lease:
+        assert pool.find("res1").inflight == 1
+        lease.transferred(1000, 2.0)
+    res1 = pool.find("res1")
+    assert res1.inflight == 0
+    assert res1.bytes == 1000
+    assert res1.tokens['tiktok'] < 0 # Charged without waiting for budget
+    assert pool.overruns == 0
@@ -0,0 +1,62 @@
+import threading
+from journal import JobJournal, DONE, DOWNLOADING
+def job(user_id, n, lane="normal"):
+    return {
+        'url': f"https://example.com/{n}", 'video_key': f"v{n}", 'audio_only': False, 'quality': None,
+        'user_id': user_id, 'chat_id': user_id, 'lane': lane, 'cache_key': f"v{n}", 'waiters': []
+    }
+def test_two_connections_never_claim_the_same_job(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    front = JobJournal(path)
+    for n in range(40):
+        front.add(job(n, n))
+    claimed = {}
+    def work(name):
+        journal = JobJournal(path) # Own connection, as a separate worker process would have
+        mine = claimed.setdefault(name, [])
+        while True:
+            record = journal.claim(name, per_user_limit=1)
+            if not record:
+                break
+            mine.append(record['job_id'])
+        journal.close()
+    threads = [threading.Thread(target=work, args=(name,)) for name in ("w1", "w2")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    ids = claimed["w1"] + claimed["w2"]
+    assert sorted(ids) == list(range(1, 41))
+    assert front.counts() == {DOWNLOADING: 40}
+def test_per_user_limit_spans_connections(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    first, second = JobJournal(path), JobJournal(path)
+    first.add(job(1, 0))
+    first.add(job(1, 1))
+    first.add(job(2, 2))
+    assert first.claim("w1")['user_id'] == 1
+    assert second.claim("w2")['user_id'] == 2 # User 1 already has a running job on w1
+    assert second.claim("w2") is None
+    first.complete(1, DONE)
+    assert second.claim("w2")['job_id'] == 2
+def test_priority_lane_claimed_first(tmp_path):
+    journal = JobJournal(str(tmp_path / "jobs.db"))
+    journal.add(job(1, 0))
+    journal.add(job(2, 1, lane="priority"))
+    assert journal.claim("w1")['user_id'] == 2
+def test_claims_round_robin_between_users(tmp_path):
+    journal = JobJournal(str(tmp_path / "jobs.db"))
+    for n in range(3):
+        journal.add(job(1, n))
+    journal.add(job(2, 3))
+    journal.add(job(3, 4))
+    order = [journal.claim("w1", per_user_limit=10)['user_id'] for _ in range(5)]
+    assert order == [1, 2, 3, 1, 1]
+def test_has_queued_respects_lanes(tmp_path):
+    journal = JobJournal(str(tmp_path / "jobs.db"))
+    assert not journal.has_queued()
+    journal.add(job(1, 0))
+    assert journal.has_queued()
+    assert not journal.has_queued(["priority"])
+    journal.claim("w1")
+    assert not journal.has_queued()
@@ -0,0 +1,36 @@
+import asyncio
+import importlib
+import sys
+import pytest
+@pytest.fixture(scope="module")
+def main(tmp_path_factory):
+    patch = pytest.MonkeyPatch()
+    patch.chdir(tmp_path_factory.mktemp("bot")) # Databases, caches and the spool land here
+    for key, value in {'BOT_TOKEN': "0:test", 'API_ID': "1", 'API_HASH': "test", 'METRICS_PORT': "0", 'BOT_ROLE': "all"}.items():
+        patch.setenv(key, value)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop) # pyrogram's Client grabs the current loop on import; earlier asyncio.run calls cleared it
+    module = sys.modules.get("main") or importlib.import_module("main")
+    loop.run_until_complete(asyncio.sleep(0)) # Lets the handler registrations pyrogram scheduled finish
+    yield module
+    patch.undo()
+def test_streamed_bytes_reach_the_controller_sample(main):
+    before = main.concurrency_sample()
+    plan = {'platform': "tiktok"}
+    main.record_stream(plan, 20 * 1024 * 1024, 4.0)
+    main.UPLOAD_BYTES.inc(20 * 1024 * 1024)
+    after = main.concurrency_sample()
+    assert after['bytes'] - before['bytes'] == 40 * 1024 * 1024
+    assert after['download_bytes'] - before['download_bytes'] == 20 * 1024 * 1024
+    assert after['download_seconds'] - before['download_seconds'] == pytest.approx(4.0)
+def test_controller_sees_stream_throughput(main):
+    limiter = main.AdaptiveLimit(2, 1, 4)
+    limiter.busy = 2
+    aimd = main.AIMDController(limiter, main.concurrency_sample, lambda: 3)
+    last = main.concurrency_sample()
+    main.record_stream({'platform': "tiktok"}, 10 * 1024 * 1024, 2.0)
+    main.JOBS.inc(outcome="done")
+    asyncio.run(aimd.tick(main.concurrency_sample(), last, 10))
+    assert aimd.window['throughput'] == pytest.approx(1024 * 1024)
+    assert aimd.window['job_speed'] == pytest.approx(5 * 1024 * 1024)
+    assert aimd.decision == "increase"
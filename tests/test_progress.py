@@ -0,0 +1,27 @@
+import asyncio
+from types import SimpleNamespace
+from gateway import TelegramGateway
+from progress import ProgressDispatcher
+def message(chat_id, message_id=1):
+    return SimpleNamespace(chat=SimpleNamespace(id=chat_id), id=message_id)
+def test_gateway_ready_does_not_consume():
+    gateway = TelegramGateway(group_rate=1 / 60)
+    for _ in range(10):
+        assert gateway.ready(-100)
+    gateway._chat_bucket(-100).block(30)
+    assert not gateway.ready(-100)
+    assert gateway.ready(5)
+def test_dispatcher_skips_chat_that_is_not_ready():
+    edited = []
+    async def edit(message, text):
+        edited.append((message.chat.id, text))
+    dispatcher = ProgressDispatcher(message_interval=0, chat_interval=0, edit=edit, ready=lambda chat_id: chat_id != -100)
+    async def run():
+        task = asyncio.create_task(dispatcher.run())
+        dispatcher.update(message(-100), "group 50%")
+        dispatcher.update(message(7), "private 50%")
+        await asyncio.sleep(0.1)
+        task.cancel()
+    asyncio.run(run())
+    assert edited == [(7, "private 50%")]
+    assert (-100, 1) in dispatcher.pending
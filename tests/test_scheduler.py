@@ -0,0 +1,47 @@
+import asyncio
+from scheduler import FairScheduler, PRIORITY
+def job(user_id, n, lane=None):
+    item = {'user_id': user_id, 'n': n}
+    if lane:
+        item['lane'] = lane
+    return item
+def test_round_robin_between_users():
+    async def run():
+        scheduler = FairScheduler(per_user_limit=10)
+        for n in range(3):
+            await scheduler.put(job("a", n))
+        await scheduler.put(job("b", 0))
+        await scheduler.put(job("c", 0))
+        return [(j['user_id'], j['n']) for j in [await scheduler.get() for _ in range(5)]]
+    assert asyncio.run(run()) == [("a", 0), ("b", 0), ("c", 0), ("a", 1), ("a", 2)]
+def test_priority_lane_goes_first():
+    async def run():
+        scheduler = FairScheduler()
+        await scheduler.put(job("a", 0))
+        await scheduler.put(job("b", 0, PRIORITY))
+        return (await scheduler.get())['user_id']
+    assert asyncio.run(run()) == "b"
+def test_per_user_cap_holds_until_done():
+    async def run():
+        scheduler = FairScheduler(per_user_limit=1)
+        await scheduler.put(job("a", 0))
+        await scheduler.put(job("a", 1))
+        first = await scheduler.get()
+        blocked = asyncio.create_task(scheduler.get())
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+        assert scheduler.inflight_count() == 1
+        await scheduler.done(first)
+        second = await asyncio.wait_for(blocked, 1)
+        return first['n'], second['n']
+    assert asyncio.run(run()) == (0, 1)
+def test_position_counts_other_users_turns():
+    async def run():
+        scheduler = FairScheduler()
+        a = [job("a", n) for n in range(3)]
+        for item in a:
+            await scheduler.put(item)
+        b = job("b", 0)
+        await scheduler.put(b)
+        return scheduler.position(a[2]), scheduler.position(b)
+    assert asyncio.run(run()) == (4, 2)
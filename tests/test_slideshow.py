@@ -0,0 +1,26 @@
+from slideshow import instagram_post
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+    def raise_for_status(self):
+        pass
+    def json(self):
+        return self.data
+class FakeSession:
+    def __init__(self, post):
+        self.post = post
+    def get(self, url, **kwargs):
+        return FakeResponse({'items': [self.post]})
+def photo(url):
+    return {'image_versions2': {'candidates': [{'url': url}]}}
+def video(url):
+    return {'video_versions': [{'url': url}], 'image_versions2': {'candidates': [{'url': url + ".jpg"}]}}
+def test_mixed_carousel_keeps_videos_in_order():
+    post = {'carousel_media': [photo("a.jpg"), video("b.mp4"), photo("c.jpg")], 'user': {'username': "someone"}}
+    result = instagram_post("https://www.instagram.com/p/ABC123/", FakeSession(post))
+    assert result['media'] == [('photo', "a.jpg"), ('video', "b.mp4"), ('photo', "c.jpg")]
+    assert result['author'] == "someone"
+def test_all_video_post_falls_back():
+    post = {'carousel_media': [video("a.mp4"), video("b.mp4")]}
+    assert instagram_post("https://www.instagram.com/p/ABC123/", FakeSession(post)) is None
+    assert instagram_post("https://www.instagram.com/p/ABC123/", FakeSession(video("a.mp4"))) is None
@@ -0,0 +1,38 @@
+import asyncio
+import os
+from spool import Spool
+def test_reserve_waits_for_release(tmp_path):
+    spool = Spool(str(tmp_path), budget_bytes=100)
+    async def run():
+        await spool.reserve(1, 80)
+        waiting = asyncio.create_task(spool.reserve(2, 50))
+        await asyncio.sleep(0.01)
+        assert not waiting.done()
+        assert spool.reserved == 80
+        await spool.release(1)
+        await asyncio.wait_for(waiting, 1)
+    asyncio.run(run())
+    assert spool.reservations == {'2': 50}
+    assert spool.delayed == 1
+def test_oversized_job_runs_alone(tmp_path):
+    spool = Spool(str(tmp_path), budget_bytes=100)
+    asyncio.run(spool.reserve(1, 500))
+    assert spool.reserved == 500
+def test_release_removes_job_dir(tmp_path):
+    spool = Spool(str(tmp_path), budget_bytes=100)
+    path = spool.job_dir(3)
+    open(os.path.join(path, "video.part"), "w").close()
+    async def run():
+        await spool.reserve(3, 10)
+        await spool.release(3)
+    asyncio.run(run())
+    assert not os.path.exists(path)
+    assert spool.reserved == 0
+def test_clean_keeps_active_jobs(tmp_path):
+    spool = Spool(str(tmp_path), orphan_age=0)
+    spool.keep([5])
+    os.makedirs(tmp_path / "job-5")
+    os.makedirs(tmp_path / "job-6")
+    assert spool.clean() == 1
+    assert os.path.exists(tmp_path / "job-5")
+    assert not os.path.exists(tmp_path / "job-6")
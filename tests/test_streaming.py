@@ -0,0 +1,37 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from streaming import http_source
+BODY = b"x" * 1000
+class Handler(BaseHTTPRequestHandler):
+    cookies = []
+    def do_GET(self):
+        Handler.cookies.append(self.headers.get('Cookie'))
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+    def log_message(self, *args):
+        pass
+def test_stream_sends_format_and_identity_cookies(tmp_path):
+    cookiefile = tmp_path / "cookies.txt"
+    cookiefile.write_text("# Netscape HTTP Cookie File\n127.0.0.1\tFALSE\t/\tFALSE\t0\tsessionid\tfromfile\n")
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    plan = {
+        'url': f"http://127.0.0.1:{server.server_port}/video.mp4",
+        'headers': {'Referer': "https://www.tiktok.com/"},
+        'cookies': "tt_chain_token=abc; Domain=127.0.0.1; Path=/",
+        'cookiefile': str(cookiefile)
+    }
+    transfer = {}
+    async def run():
+        return b"".join([part async for part in http_source(plan, transfer=transfer)])
+    try:
+        assert asyncio.run(run()) == BODY
+    finally:
+        server.shutdown()
+    assert transfer['bytes'] == len(BODY)
+    assert transfer['seconds'] > 0
+    sent = dict(pair.split("=", 1) for pair in Handler.cookies[0].split("; "))
+    assert sent == {'tt_chain_token': "abc", 'sessionid': "fromfile"}
@@ -0,0 +1,72 @@
+import asyncio
+import pytest
+from types import SimpleNamespace
+from pyrogram import raw
+from pyrogram.errors import BadRequest, FloodWait, RandomIdDuplicate
+import uploader
+from uploader import PART_SIZE, send_uploaded_media, upload_big_file, upload_big_stream
+class FakeParser:
+    async def parse(self, text, mode):
+        return {'message': text, 'entities': None}
+class FakeClient:
+    def __init__(self):
+        self.random_ids = []
+        self.parser = FakeParser()
+    def rnd_id(self):
+        return 42
+    def guess_mime_type(self, name):
+        return "video/mp4"
+    async def resolve_peer(self, chat_id):
+        return raw.types.InputPeerUser(user_id=chat_id, access_hash=0)
+    async def invoke(self, query):
+        if query.random_id in self.random_ids:
+            raise RandomIdDuplicate()
+        self.random_ids.append(query.random_id)
+        return SimpleNamespace(updates=[])
+def test_retried_send_reuses_random_id():
+    client = FakeClient()
+    input_file = raw.types.InputFile(id=1, parts=1, name="clip.mp4", md5_checksum="")
+    async def send_twice():
+        for _ in range(2):
+            await send_uploaded_media(client, 1, input_file, 'video', random_id=7)
+    asyncio.run(send_twice())
+    assert client.random_ids == [7]
+class FakeSession:
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.parts = []
+    async def invoke(self, rpc):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.parts.append(rpc.file_part)
+    async def stop(self):
+        pass
+def upload_with(tmp_path, session, retries=3):
+    path = tmp_path / "big.bin"
+    path.write_bytes(b"x" * (PART_SIZE + 1))
+    async def factory(client):
+        return session
+    return asyncio.run(upload_big_file(FakeClient(), str(path), parallel_parts=1, connections=1, session_factory=factory, retries=retries))
+def test_big_file_part_waits_out_flood_waits(tmp_path):
+    session = FakeSession([FloodWait(value=0)] * 5)
+    result = upload_with(tmp_path, session, retries=1)
+    assert result.parts == 2 and sorted(session.parts) == [0, 1]
+def test_big_file_part_gives_up_on_transient_errors_after_retries(tmp_path):
+    session = FakeSession([ConnectionError("reset")])
+    with pytest.raises(ConnectionError):
+        upload_with(tmp_path, session, retries=1)
+def test_big_file_part_does_not_retry_other_errors(tmp_path):
+    session = FakeSession([BadRequest("FILE_PARTS_INVALID")])
+    with pytest.raises(BadRequest):
+        upload_with(tmp_path, session)
+    assert session.parts == []
+def test_streamed_parts_wait_out_flood_waits(monkeypatch):
+    session = FakeSession([FloodWait(value=0), FloodWait(value=0)])
+    async def factory(client):
+        return session
+    monkeypatch.setattr(uploader, "open_media_session", factory)
+    async def parts():
+        for _ in range(3):
+            yield b"x" * PART_SIZE
+    result = asyncio.run(upload_big_stream(FakeClient(), parts(), "clip.mp4", workers=1))
+    assert result.parts == 3 and sorted(session.parts) == [0, 1, 2]
@@ -0,0 +1,64 @@
+from types import SimpleNamespace
+import pytest
+import urls
+from urls import canonical_key, canonicalize, extract_links, normalize_url
+VIDEO = "dQw4w9WgXcQ"
+@pytest.mark.parametrize("url, expected", [
+    (f"https://youtu.be/{VIDEO}", ('youtube', VIDEO)),
+    (f"https://youtu.be/{VIDEO}?t=10", ('youtube', VIDEO)),
+    (f"https://www.youtube.com/watch?v={VIDEO}&t=42s", ('youtube', VIDEO)),
+    (f"https://m.youtube.com/watch?v={VIDEO}", ('youtube', VIDEO)),
+    (f"youtube.com/watch?feature=share&v={VIDEO}", ('youtube', VIDEO)),
+    (f"https://music.youtube.com/watch?v={VIDEO}&list=RDAMVM", ('youtube', VIDEO)),
+    (f"https://youtube.com/shorts/{VIDEO}?feature=share", ('youtube', VIDEO)),
+    (f"https://m.youtube.com/shorts/{VIDEO}", ('youtube', VIDEO)),
+    ("https://www.youtube.com/watch?v=short", None),
+    ("https://www.tiktok.com/@some.user/video/7301234567890123456?is_from_webapp=1&sender_device=pc", ('tiktok', "7301234567890123456")),
+    ("https://m.tiktok.com/v/7301234567890123456.html", ('tiktok', "7301234567890123456")),
+    ("https://www.tiktok.com/@user/photo/7301234567890123456", ('tiktok', "7301234567890123456")),
+    ("https://vm.tiktok.com/ZMabc123/", None), # Needs the redirect, see canonical_key
+    ("https://instagr.am/p/Cabc123/", ('instagram', "Cabc123")),
+    ("https://www.instagram.com/p/Cabc123/?igsh=xyz", ('instagram', "Cabc123")),
+    ("https://www.instagram.com/reel/Cxyz_-9/?igsh=abc", ('instagram', "Cxyz_-9")),
+    ("https://www.instagram.com/reels/Cxyz_-9/", ('instagram', "Cxyz_-9")),
+    ("https://www.instagram.com/some.user/p/Cabc123/", ('instagram', "Cabc123")),
+    ("https://example.com/video", None),
+])
+def test_canonicalize(url, expected):
+    assert canonicalize(url) == expected
+@pytest.mark.parametrize("url, expected", [
+    (f"https://www.youtube.com/watch?v={VIDEO}&t=42s&list=PL1", f"youtube.com/watch?v={VIDEO}"),
+    (f"HTTPS://WWW.YouTube.com/shorts/{VIDEO}/", f"youtube.com/shorts/{VIDEO}"),
+    ("https://www.tiktok.com/@user/video/123?lang=en", "tiktok.com/@user/video/123"),
+    ("vm.tiktok.com/ZMabc123/", "vm.tiktok.com/ZMabc123"),
+])
+def test_normalize_url(url, expected):
+    assert normalize_url(url) == expected
+@pytest.mark.parametrize("short", ["https://vm.tiktok.com/ZMabc123/", "https://vt.tiktok.com/ZSdef456/", "https://www.tiktok.com/t/ZTghi789/"])
+def test_short_links_share_the_video_key(monkeypatch, short):
+    target = "https://www.tiktok.com/@user/video/7301234567890123456?_r=1&_t=abc"
+    monkeypatch.setattr(urls.requests, "head", lambda url, **kwargs: SimpleNamespace(url=target))
+    assert canonical_key(short) == canonical_key(target) == "tiktok:7301234567890123456"
+def test_short_link_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(urls, "_resolved_short_links", urls.BoundedLRU(2))
+    monkeypatch.setattr(urls.requests, "head", lambda url, **kwargs: SimpleNamespace(url=url + "resolved"))
+    for code in ("a1", "b2", "c3"):
+        urls.resolve_short_link(f"https://vm.tiktok.com/{code}/")
+    assert len(urls._resolved_short_links) == 2
+    assert urls._resolved_short_links.get("https://vm.tiktok.com/a1/") is None
+@pytest.mark.parametrize("text, expected", [
+    (f"look (https://youtu.be/{VIDEO}), nice", [('youtube', f"https://youtu.be/{VIDEO}")]),
+    (f"https://www.youtube.com/watch?v={VIDEO}.", [('youtube', f"https://www.youtube.com/watch?v={VIDEO}")]),
+    ("tiktok.com/@a/video/123!!", [('tiktok', "https://tiktok.com/@a/video/123")]),
+    ("«https://instagr.am/p/Cabc123/»", [('instagram', "https://instagr.am/p/Cabc123/")]),
+    (f"twice https://youtu.be/{VIDEO} and https://youtu.be/{VIDEO}?", [('youtube', f"https://youtu.be/{VIDEO}")]),
+    ("mail me at someone@youtube.com/x or see example.com/youtube.com/x", []),
+    (f"https://www.tiktok.com/@u/video/1 then https://youtu.be/{VIDEO}", [
+        ('tiktok', "https://www.tiktok.com/@u/video/1"), ('youtube', f"https://youtu.be/{VIDEO}")
+    ]),
+])
+def test_extract_links(text, expected):
+    assert extract_links(text) == expected
+def test_extract_links_includes_hidden_text_links():
+    entities = [SimpleNamespace(offset=0, url=f"https://youtu.be/{VIDEO}")]
+    assert extract_links("click here", entities) == [('youtube', f"https://youtu.be/{VIDEO}")]
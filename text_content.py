@@ -11,6 +11,7 @@ TEXTS = {
         "btn_name": "🇺🇸 English",
         "download_progress": "📥 DL: {percent} | 💾 {total} | 🚀 {speed}",
         "error_live": "Live streams not supported.",
+        "error_playlist": "Playlists not supported, send a link to a single video.",
         "error_age": "Age restricted content.",
         "select_format": "🎬 {title}\n⏱ Duration: {duration}\n\n📝 Choose quality:",
         "btn_video": "📹 Video",
@@ -19,6 +20,10 @@ TEXTS = {
         "btn_med": "💿 Medium (720p)",
         "btn_high": "💎 High (1080p)",
         "analyzing": "⏳ Analyzing video...",
+        "queued": "🕒 In queue: #{position}",
+        "batch_queued": "📥 Downloading {count} links...",
+        "batch_progress": "📥 {done}/{total} done",
+        "batch_failed": "⚠️ {failed} of {total} links could not be downloaded.",
     },
     "ru": {
         "welcome": "Привет, {name}!\n\nОтправь ссылку для скачивания.\n\n(Язык авто-определен. Настройки: /language)",
@@ -32,6 +37,7 @@ TEXTS = {
         "btn_name": "🇷🇺 Русский",
         "download_progress": "📥: {percent} | 💾 {total} | 🚀 {speed}",
         "error_live": "Стримы не поддерживаются.",
+        "error_playlist": "Плейлисты не поддерживаются, отправьте ссылку на одно видео.",
         "error_age": "Возрастное ограничение.",
         "select_format": "🎬 {title}\n⏱ Длительность: {duration}\n\n📝 Выберите качество:",
         "btn_video": "📹 Видео",
@@ -40,6 +46,10 @@ TEXTS = {
         "btn_med": "💿 Среднее (720p)",
         "btn_high": "💎 Высокое (1080p)",
         "analyzing": "⏳ Анализ видео...",
+        "queued": "🕒 В очереди: #{position}",
+        "batch_queued": "📥 Загружаю ссылок: {count}...",
+        "batch_progress": "📥 Готово {done}/{total}",
+        "batch_failed": "⚠️ Не удалось скачать {failed} из {total}.",
     },
     "uk": {
         "welcome": "Привіт, {name}!\n\nНадішли посилання для завантаження.\n\n(Мову визначено. Налаштування: /language)",
@@ -53,6 +63,7 @@ TEXTS = {
         "btn_name": "🇺🇦 Українська",
         "download_progress": "📥: {percent} | 💾 {total} | 🚀 {speed}",
         "error_live": "Стріми не підтримуються.",
+        "error_playlist": "Плейлисти не підтримуються, надішліть посилання на одне відео.",
         "error_age": "Вікові обмеження.",
     },
     "kk": {
@@ -67,6 +78,7 @@ TEXTS = {
         "btn_name": "🇰🇿 Қазақша",
         "download_progress": "📥: {percent} | 💾 {total} | 🚀 {speed}",
         "error_live": "Тікелей эфир жүктелмейді.",
+        "error_playlist": "Ойнату тізімдері жүктелмейді, бір бейнеге сілтеме жіберіңіз.",
         "error_age": "Жас шектеуі.",
     },
     "de": {
@@ -81,6 +93,7 @@ TEXTS = {
         "btn_name": "🇩🇪 Deutsch",
         "download_progress": "📥: {percent} | 💾 {total} | 🚀 {speed}",
         "error_live": "Live-Streams nicht unterstützt.",
+        "error_playlist": "Playlists nicht unterstützt, sende einen Link zu einem einzelnen Video.",
         "error_age": "Altersbeschränkung.",
     },
     "es": {
@@ -95,6 +108,7 @@ TEXTS = {
         "btn_name": "🇪🇸 Español",
         "download_progress": "📥: {percent} | 💾 {total} | 🚀 {speed}",
         "error_live": "Directos no soportados.",
+        "error_playlist": "Listas de reproducción no soportadas, envía el enlace de un solo video.",
         "error_age": "Restricción de edad.",
     },
     "pt": {
@@ -109,6 +123,7 @@ TEXTS = {
         "btn_name": "🇵🇹 Português",
         "download_progress": "📥: {percent} | 💾 {total} | 🚀 {speed}",
         "error_live": "Lives não suportadas.",
+        "error_playlist": "Playlists não suportadas, envie o link de um único vídeo.",
         "error_age": "Restrição de idade.",
     },
     "fr": {
@@ -123,6 +138,7 @@ TEXTS = {
         "btn_name": "🇫🇷 Français",
         "download_progress": "📥: {percent} | 💾 {total} | 🚀 {speed}",
         "error_live": "Directs non supportés.",
+        "error_playlist": "Playlists non supportées, envoyez le lien d'une seule vidéo.",
         "error_age": "Limite d'âge.",
     },
     "it": {
@@ -137,6 +153,7 @@ TEXTS = {
         "btn_name": "🇮🇹 Italiano",
         "download_progress": "📥: {percent} | 💾 {total} | 🚀 {speed}",
         "error_live": "Live non supportate.",
+        "error_playlist": "Playlist non supportate, invia il link di un singolo video.",
         "error_age": "Restrizione di età.",
     },
     "ar": {
@@ -151,6 +168,7 @@ TEXTS = {
         "btn_name": "🇸🇦 العربية",
         "download_progress": "📥: {percent} | 💾 {total} | 🚀 {speed}",
         "error_live": "البث المباشر غير مدعوم.",
+        "error_playlist": "قوائم التشغيل غير مدعومة، أرسل رابط فيديو واحد.",
         "error_age": "محتوى مقيد بالعمر.",
     },
     "fa": {
@@ -165,6 +183,7 @@ TEXTS = {
         "btn_name": "🇮🇷 فارسی",
         "download_progress": "📥: {percent} | 💾 {total} | 🚀 {speed}",
         "error_live": "لایو پشتیبانی نمی‌شود.",
+        "error_playlist": "پلی‌لیست پشتیبانی نمی‌شود، لینک یک ویدیو را بفرستید.",
         "error_age": "محدودیت سنی.",
     },
     "tr": {
@@ -179,6 +198,7 @@ TEXTS = {
         "btn_name": "🇹🇷 Türkçe",
         "download_progress": "📥: {percent} | 💾 {total} | 🚀 {speed}",
         "error_live": "Canlı yayınlar desteklenmiyor.",
+        "error_playlist": "Oynatma listeleri desteklenmiyor, tek bir videonun bağlantısını gönderin.",
         "error_age": "Yaş kısıtlaması.",
     },
     "uz": {
@@ -193,6 +213,7 @@ TEXTS = {
         "btn_name": "🇺🇿 O‘zbek",
         "download_progress": "📥: {percent} | 💾 {total} | 🚀 {speed}",
         "error_live": "Jonli efirlar qo'llab-quvvatlanmaydi.",
+        "error_playlist": "Pleylistlar qo'llab-quvvatlanmaydi, bitta video havolasini yuboring.",
         "error_age": "Yosh cheklovi.",
     },
     "id": {
@@ -207,6 +228,7 @@ TEXTS = {
         "btn_name": "🇮🇩 Indonesia",
         "download_progress": "📥: {percent} | 💾 {total} | 🚀 {speed}",
         "error_live": "Siaran langsung tidak didukung.",
+        "error_playlist": "Playlist tidak didukung, kirim tautan satu video.",
         "error_age": "Pembatasan usia.",
     },
     "hi": {
@@ -221,6 +243,7 @@ TEXTS = {
         "btn_name": "🇮🇳 हिन्दी",
         "download_progress": "📥: {percent} | 💾 {total} | 🚀 {speed}",
         "error_live": "लाइव स्ट्रीम समर्थित नहीं हैं.",
+        "error_playlist": "प्लेलिस्ट समर्थित नहीं हैं, किसी एक वीडियो का लिंक भेजें.",
         "error_age": "आयु प्रतिबंधित.",
     },
     "nl": {
@@ -235,6 +258,7 @@ TEXTS = {
         "btn_name": "🇳🇱 Nederlands",
         "download_progress": "📥: {percent} | 💾 {total} | 🚀 {speed}",
         "error_live": "Live streams niet ondersteund.",
+        "error_playlist": "Playlists niet ondersteund, stuur een link naar één video.",
         "error_age": "Leeftijdsbeperking.",
     },
     "pl": {
@@ -249,6 +273,7 @@ TEXTS = {
         "btn_name": "🇵🇱 Polski",
         "download_progress": "📥: {percent} | 💾 {total} | 🚀 {speed}",
         "error_live": "Transmisje na żywo nieobsługiwane.",
+        "error_playlist": "Playlisty nieobsługiwane, wyślij link do jednego filmu.",
         "error_age": "Ograniczenie wiekowe.",
     },
     "vi": {
@@ -263,6 +288,7 @@ TEXTS = {
         "btn_name": "🇻🇳 Tiếng Việt",
         "download_progress": "📥: {percent} | 💾 {total} | 🚀 {speed}",
         "error_live": "Livestream không được hỗ trợ.",
+        "error_playlist": "Danh sách phát không được hỗ trợ, hãy gửi liên kết của một video.",
         "error_age": "Giới hạn độ tuổi.",
     },
     "zh": {
@@ -277,6 +303,7 @@ TEXTS = {
         "btn_name": "🇨🇳 中文",
         "download_progress": "📥: {percent} | 💾 {total} | 🚀 {speed}",
         "error_live": "不支持直播。",
+        "error_playlist": "不支持播放列表，请发送单个视频的链接。",
         "error_age": "年龄限制。",
     },
     "ms": {
@@ -291,6 +318,7 @@ TEXTS = {
         "btn_name": "🇲🇾 Melayu",
         "download_progress": "📥: {percent} | 💾 {total} | 🚀 {speed}",
         "error_live": "Siaran langsung tidak disokong.",
+        "error_playlist": "Senarai main tidak disokong, hantar pautan satu video.",
         "error_age": "Sekatan umur.",
     },
 }
\ No newline at end of file
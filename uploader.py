@@ -0,0 +1,177 @@
+import asyncio
+import inspect
+import logging
+import math
+import os
+from pyrogram import raw, types, utils
+from pyrogram.errors import FloodWait, RandomIdDuplicate
+from pyrogram.session import Session
+from gateway import TRANSIENT_ERRORS
+PART_SIZE = 512 * 1024 # Fixed by MTProto, every part but the last must be exactly this size
+BIG_FILE_THRESHOLD = 10 * 1024 * 1024 # Below this Telegram wants SaveFilePart + md5, not SaveBigFilePart
+async def open_media_session(client) -> Session:
+    session = Session(
+        client, await client.storage.dc_id(), await client.storage.auth_key(),
+        await client.storage.test_mode(), is_media=True
+    )
+    await session.start()
+    return session
+async def rechunk(source, size: int = PART_SIZE):
+    buffer = bytearray()
+    try:
+        async for data in source:
+            buffer.extend(data)
+            while len(buffer) >= size:
+                yield bytes(buffer[:size])
+                del buffer[:size]
+        if buffer:
+            yield bytes(buffer)
+    finally:
+        await source.aclose() # Propagate early exits so the producer releases its thread
+async def report_progress(progress, current, total, progress_args):
+    if not progress:
+        return
+    result = progress(current, total, *progress_args)
+    if inspect.isawaitable(result):
+        await result
+async def send_part(session, rpc, retries: int = 3):
+    attempt = 0
+    while True:
+        try:
+            return await session.invoke(rpc)
+        except FloodWait as e: # Waiting out a flood limit is not a failed attempt
+            logging.warning(f"FloodWait {e.value}s on part {rpc.file_part}")
+            await asyncio.sleep(e.value)
+        except TRANSIENT_ERRORS as e:
+            attempt += 1
+            if attempt >= retries:
+                raise
+            logging.warning(f"Part {rpc.file_part} upload failed ({e}), retrying")
+            await asyncio.sleep(attempt)
+async def upload_big_stream(client, parts, file_name: str, expected_size: int = None, progress=None, progress_args=(), workers: int = 4) -> raw.types.InputFileBig:
+    # Streamed upload: the part count is unknown until the source ends, so parts go out with
+    # file_total_parts=-1 and the last part (sent once the others are acked) carries the real count
+    file_id = client.rnd_id()
+    session = await open_media_session(client)
+    queue = asyncio.Queue(workers)
+    failures = []
+    async def send_parts():
+        while True:
+            rpc = await queue.get()
+            if rpc is None:
+                return
+            try:
+                await send_part(session, rpc)
+            except Exception as e:
+                failures.append(e)
+    senders = [asyncio.create_task(send_parts()) for _ in range(workers)]
+    uploaded = 0
+    part_index = 0
+    previous = None
+    try:
+        async for chunk in parts:
+            if failures:
+                raise failures[0]
+            if previous is not None:
+                await queue.put(raw.functions.upload.SaveBigFilePart(
+                    file_id=file_id, file_part=part_index, file_total_parts=-1, bytes=previous
+                ))
+                part_index += 1
+                uploaded += len(previous)
+                await report_progress(progress, uploaded, max(uploaded, expected_size or 0), progress_args)
+            previous = chunk
+        if previous is None:
+            raise ValueError("Stream produced no data")
+        for _ in senders:
+            await queue.put(None)
+        await asyncio.gather(*senders)
+        senders = []
+        if failures:
+            raise failures[0]
+        total_parts = part_index + 1
+        await send_part(session, raw.functions.upload.SaveBigFilePart(
+            file_id=file_id, file_part=part_index, file_total_parts=total_parts, bytes=previous
+        ))
+        uploaded += len(previous)
+        await report_progress(progress, uploaded, uploaded, progress_args)
+        return raw.types.InputFileBig(id=file_id, parts=total_parts, name=file_name)
+    finally:
+        for task in senders:
+            task.cancel()
+        await session.stop()
+async def upload_big_file(client, path: str, parallel_parts: int = 8, connections: int = 4, progress=None, progress_args=(), session_factory=open_media_session, retries: int = 3) -> raw.types.InputFileBig:
+    # Parts are independent for SaveBigFilePart, so they can go out of order over several media
+    # connections; progress counts acknowledged bytes only, which is the real upload throughput
+    file_size = os.path.getsize(path)
+    total_parts = math.ceil(file_size / PART_SIZE)
+    file_id = client.rnd_id()
+    sessions = await asyncio.gather(*[session_factory(client) for _ in range(max(1, connections))])
+    pending = asyncio.Queue()
+    for index in range(total_parts):
+        pending.put_nowait(index)
+    state = {'uploaded': 0}
+    async def send_parts(worker_index):
+        session = sessions[worker_index % len(sessions)]
+        with open(path, "rb") as fp:
+            while True:
+                try:
+                    index = pending.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                fp.seek(index * PART_SIZE)
+                chunk = fp.read(PART_SIZE)
+                rpc = raw.functions.upload.SaveBigFilePart(
+                    file_id=file_id, file_part=index, file_total_parts=total_parts, bytes=chunk
+                )
+                await send_part(session, rpc, retries)
+                state['uploaded'] += len(chunk)
+                await report_progress(progress, state['uploaded'], file_size, progress_args)
+    tasks = [asyncio.create_task(send_parts(i)) for i in range(max(1, parallel_parts))]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*[session.stop() for session in sessions], return_exceptions=True)
+    return raw.types.InputFileBig(id=file_id, parts=total_parts, name=os.path.basename(path))
+async def send_uploaded_media(client, chat_id, input_file, kind: str, caption: str = "", file_name: str = None, duration: int = 0, width: int = 0, height: int = 0, title: str = None, performer: str = None, thumb=None, random_id: int = None) -> "types.Message":
+    # input_file and thumb are already uploaded (save_file / upload_big_file), so a retry only repeats SendMedia.
+    # Passing the job's random_id makes that retry idempotent: Telegram rejects a second message with the same id.
+    file_name = file_name or input_file.name
+    if kind == 'photo':
+        media = raw.types.InputMediaUploadedPhoto(file=input_file)
+    elif kind == 'audio':
+        mime_type = client.guess_mime_type(file_name) or "audio/ogg"
+        attributes = [
+            raw.types.DocumentAttributeAudio(duration=int(duration or 0), title=title, performer=performer),
+            raw.types.DocumentAttributeFilename(file_name=file_name)
+        ]
+    else:
+        mime_type = client.guess_mime_type(file_name) or "video/mp4"
+        attributes = [
+            raw.types.DocumentAttributeVideo(supports_streaming=True, duration=int(duration or 0), w=int(width or 0), h=int(height or 0)),
+            raw.types.DocumentAttributeFilename(file_name=file_name)
+        ]
+    if kind != 'photo':
+        media = raw.types.InputMediaUploadedDocument(mime_type=mime_type, file=input_file, attributes=attributes, thumb=thumb)
+    try:
+        r = await client.invoke(
+            raw.functions.messages.SendMedia(
+                peer=await client.resolve_peer(chat_id),
+                media=media,
+                random_id=random_id or client.rnd_id(),
+                **await utils.parse_text_entities(client, caption, None, None)
+            )
+        )
+    except RandomIdDuplicate:
+        logging.warning(f"SendMedia to {chat_id} was already delivered by an earlier attempt")
+        return None
+    for update in r.updates:
+        if isinstance(update, (raw.types.UpdateNewMessage, raw.types.UpdateNewChannelMessage)):
+            return await types.Message._parse(
+                client, update.message,
+                {u.id: u for u in r.users},
+                {c.id: c for c in r.chats}
+            )
+    logging.warning("SendMedia returned no message update")
+    return None
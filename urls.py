@@ -0,0 +1,108 @@
+import logging
+import re
+from urllib.parse import urlsplit, parse_qs
+import requests
+from cache import BoundedLRU
+SHORT_LINK_HOSTS = ('vm.tiktok.com', 'vt.tiktok.com')
+YOUTUBE_ID = r'[\w-]{11}'
+CANONICAL_PATTERNS = [
+    ('youtube', re.compile(rf'^youtu\.be/(?P<id>{YOUTUBE_ID})')),
+    ('youtube', re.compile(rf'^(?:music\.)?youtube\.com/(?:shorts|live|embed|v)/(?P<id>{YOUTUBE_ID})')),
+    ('tiktok', re.compile(r'^tiktok\.com/(?:@[\w.-]*/)?(?:video|photo)/(?P<id>\d+)')),
+    ('tiktok', re.compile(r'^tiktok\.com/v/(?P<id>\d+)')),
+    ('instagram', re.compile(r'^(?:instagram\.com|instagr\.am)/(?:[\w.]+/)?(?:p|reels?|tv)/(?P<id>[\w-]+)')),
+]
+LINK_ROUTES = [
+    # Host -> platform, first match wins; everything else in a message is ignored
+    ('youtube', re.compile(r'^(?:www\.|m\.|music\.)?youtube\.com$|^youtu\.be$')),
+    ('tiktok', re.compile(r'^(?:www\.|m\.|vm\.|vt\.)?tiktok\.com$')),
+    ('instagram', re.compile(r'^(?:www\.|m\.)?instagram\.com$|^instagr\.am$')),
+]
+LINK_SCAN = re.compile(
+    r'(?<![\w.@/-])(?:https?://)?(?:[\w-]+\.)*(?:youtube\.com|youtu\.be|tiktok\.com|instagram\.com|instagr\.am)/[^\s<>"\'`]+',
+    re.IGNORECASE
+)
+TRAILING_PUNCTUATION = '.,;:!?)]}\'"»'
+_resolved_short_links = BoundedLRU(2000) # short link -> redirect target
+def normalize_url(url: str) -> str:
+    if not url.lower().startswith(("http://", "https://")):
+        url = "https://" + url
+    parts = urlsplit(url)
+    host = parts.netloc.lower()
+    for prefix in ('www.', 'm.'):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    path = parts.path.rstrip('/')
+    query = ''
+    if host.endswith('youtube.com') and path == '/watch':
+        video_id = parse_qs(parts.query).get('v')
+        if video_id:
+            query = f"?v={video_id[0]}"
+    return f"{host}{path}{query}"
+def canonicalize(url: str) -> tuple:
+    normalized = normalize_url(url)
+    if normalized.startswith(('youtube.com/watch', 'music.youtube.com/watch')):
+        video_id = parse_qs(urlsplit("https://" + normalized).query).get('v')
+        if video_id and re.fullmatch(YOUTUBE_ID, video_id[0]):
+            return ('youtube', video_id[0])
+        return None
+    for extractor, pattern in CANONICAL_PATTERNS:
+        match = pattern.match(normalized)
+        if match:
+            return (extractor, match.group('id'))
+    return None
+def is_short_link(url: str) -> bool:
+    host = normalize_url(url).split('/', 1)[0]
+    return host in SHORT_LINK_HOSTS or normalize_url(url).startswith('tiktok.com/t/')
+def resolve_short_link(url: str) -> str:
+    if not is_short_link(url):
+        return url
+    cached = _resolved_short_links.get(url)
+    if cached:
+        return cached
+    try:
+        response = requests.head(url, allow_redirects=True, timeout=10)
+        resolved = response.url or url
+    except Exception as e:
+        logging.warning(f"Short link resolve failed for {url}: {e}")
+        return url
+    _resolved_short_links.put(url, resolved)
+    return resolved
+def canonical_key(url: str) -> str:
+    # Blocking for short links (network redirect lookup), call from an executor
+    ident = canonicalize(resolve_short_link(url))
+    if ident:
+        return f"{ident[0]}:{ident[1]}"
+    return normalize_url(url)
+def route_link(url: str) -> str:
+    if not url.lower().startswith(("http://", "https://")):
+        url = "https://" + url
+    host = (urlsplit(url).hostname or '').lower()
+    for platform, pattern in LINK_ROUTES:
+        if pattern.match(host):
+            return platform
+    return None
+def extract_links(text: str, entities=None) -> list:
+    # Every supported link in a message, in reading order, once each: plain URLs plus hidden text_link targets
+    found = [(m.start(), m.group(0)) for m in LINK_SCAN.finditer(text or "")]
+    found += [(entity.offset, entity.url) for entity in entities or [] if getattr(entity, 'url', None)]
+    links = []
+    seen = set()
+    for _, url in sorted(found, key=lambda item: item[0]):
+        url = url.rstrip(TRAILING_PUNCTUATION)
+        if not url.lower().startswith(("http://", "https://")):
+            url = "https://" + url
+        platform = route_link(url)
+        if not platform:
+            continue
+        key = normalize_url(url)
+        if key in seen:
+            continue
+        seen.add(key)
+        links.append((platform, url))
+    return links
+def detect_platform(url: str) -> str:
+    ident = canonicalize(url)
+    if ident:
+        return ident[0]
+    return route_link(url) or 'default'
@@ -0,0 +1,90 @@
+import threading
+import time
+from contextlib import contextmanager
+import yt_dlp
+class PooledHandle:
+    def __init__(self, profile: str, opts: dict, identity=None):
+        self.profile = profile
+        self.identity = identity
+        self.key = (profile, identity.name if identity else None)
+        self.ydl = yt_dlp.YoutubeDL(dict(opts))
+        self.base_params = dict(self.ydl.params)
+        self.hook = None
+        self.uses = 0
+        self.ydl.add_progress_hook(self._dispatch_progress) # Registered once, the job's hook is swapped per checkout
+    def _dispatch_progress(self, d):
+        if self.hook:
+            self.hook(d)
+    def apply(self, overrides: dict):
+        params = self.ydl.params
+        for key, value in overrides.items():
+            if key == 'outtmpl' and isinstance(value, str):
+                value = {**params.get('outtmpl', {}), 'default': value}
+            params[key] = value
+        if 'format' in overrides:
+            self.ydl.format_selector = self.ydl.build_format_selector(overrides['format'])
+    def reset(self):
+        changed = [k for k in self.ydl.params if self.ydl.params.get(k) is not self.base_params.get(k)]
+        for key in changed:
+            if key in self.base_params:
+                self.ydl.params[key] = self.base_params[key]
+            else:
+                del self.ydl.params[key]
+        if 'format' in changed and self.base_params.get('format'):
+            self.ydl.format_selector = self.ydl.build_format_selector(self.base_params['format'])
+        self.hook = None
+class YDLPool:
+    def __init__(self, profiles: dict, max_idle: int = 4):
+        self.profiles = profiles
+        self.max_idle = max_idle
+        self.idle = {} # (profile, identity name) -> handles; proxy and cookie jar are fixed once a handle is built
+        self.lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+        self.setup_time = 0.0
+    def _take(self, profile: str, identity=None) -> PooledHandle:
+        key = (profile, identity.name if identity else None)
+        with self.lock:
+            if self.idle.get(key):
+                self.reused += 1
+                return self.idle[key].pop()
+        started = time.perf_counter()
+        opts = {**self.profiles[profile], **identity.options()} if identity else self.profiles[profile]
+        handle = PooledHandle(profile, opts, identity)
+        with self.lock:
+            self.created += 1
+            self.setup_time += time.perf_counter() - started
+        return handle
+    def _give_back(self, handle: PooledHandle):
+        handle.reset()
+        with self.lock:
+            idle = self.idle.setdefault(handle.key, [])
+            if len(idle) < self.max_idle:
+                idle.append(handle)
+                return
+        handle.ydl.close()
+    @contextmanager
+    def acquire(self, profile: str, progress_hook=None, identity=None, **overrides):
+        handle = self._take(profile, identity)
+        handle.uses += 1
+        handle.apply(overrides)
+        handle.hook = progress_hook
+        try:
+            yield handle.ydl
+        finally:
+            self._give_back(handle)
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'created': self.created,
+                'reused': self.reused,
+                'idle': {f"{profile}@{name}" if name else profile: len(handles) for (profile, name), handles in self.idle.items()},
+                'avg_setup': self.setup_time / self.created if self.created else 0.0
+            }
+    def close(self):
+        with self.lock:
+            handles = [h for group in self.idle.values() for h in group]
+            for group in self.idle.values():
+                group.clear()
+        for handle in handles:
+            handle.ydl.close()